@@ -0,0 +1,137 @@
+"""
+JSON API for tooling.
+
+Requests authenticate with an `Authorization: Token <key>` header (see
+`manage.py create_api_token`). Pastes are created in batches with one
+bulk INSERT, still validated with PasteForm, and fetched many at a time
+with one query.
+"""
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import JsonResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from . import dedup
+from .forms import SPAM_ERROR, PasteForm
+from .models import ApiToken, Paste, hash_content
+from .ratelimit import rate_limit
+
+TOKEN_CACHE_TIMEOUT = 60
+
+
+def token_required(view):
+    """Reject requests without a valid API token"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        scheme, _, key = request.headers.get('Authorization', '').partition(' ')
+        if scheme != 'Token' or not key:
+            return JsonResponse({'error': 'missing API token'}, status=401)
+
+        cache_key = f"api_token_{hash_content(key)}"
+        token_id = cache.get(cache_key)
+        if token_id is None:
+            token = ApiToken.authenticate(key)
+            token_id = token.id if token else 0
+            cache.set(cache_key, token_id, timeout=TOKEN_CACHE_TIMEOUT)
+        if not token_id:
+            return JsonResponse({'error': 'invalid API token'}, status=401)
+
+        request.api_token_id = token_id
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def _rate_limited(request, retry_after):
+    return JsonResponse({'error': f'rate limit exceeded, retry in {retry_after} seconds'}, status=429)
+
+
+def _api_rate_limit(view):
+    return rate_limit(
+        'api', methods=('GET', 'POST'),
+        key=lambda request: request.api_token_id, on_limit=_rate_limited,
+    )(view)
+
+
+def _paste_json(paste, request, content=True):
+    data = {
+        'id': paste.id,
+        'title': paste.title,
+        'language': paste.language,
+        'created_at': paste.created_at.isoformat(),
+        'expires_at': paste.expires_at.isoformat(),
+        'url': request.build_absolute_uri(reverse('view_paste', args=[paste.id])),
+        'raw_url': request.build_absolute_uri(reverse('raw_paste', args=[paste.id])),
+    }
+    if content:
+        data['content'] = paste.content
+        data['views'] = paste.views
+    return data
+
+
+@csrf_exempt
+@require_POST
+@token_required
+@_api_rate_limit
+def bulk_create_pastes(request):
+    """Create up to API_MAX_BATCH pastes from {"pastes": [{title, content, language}, ...]}"""
+    try:
+        items = json.loads(request.body)['pastes']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'expected a JSON object with a "pastes" list'}, status=400)
+    if not isinstance(items, list) or not items:
+        return JsonResponse({'error': '"pastes" must be a non-empty list'}, status=400)
+    if len(items) > settings.API_MAX_BATCH:
+        return JsonResponse({'error': f'at most {settings.API_MAX_BATCH} pastes per request'}, status=400)
+
+    # title and language are optional in the API, like in the model
+    forms = [
+        PasteForm(data={'title': '', 'language': 'plaintext', **item} if isinstance(item, dict) else {})
+        for item in items
+    ]
+    errors = {index: form.errors.get_json_data() for index, form in enumerate(forms) if not form.is_valid()}
+    if errors:
+        return JsonResponse({'errors': errors}, status=400)
+
+    pastes = [form.save(commit=False) for form in forms]
+    dedup.check_batch(pastes)
+    if settings.DEDUP_ACTION == 'reject':
+        for index, form in enumerate(forms):
+            if form.instance._dedup.is_spam:
+                form.add_error('content', SPAM_ERROR)
+                errors[index] = form.errors.get_json_data()
+        if errors:
+            return JsonResponse({'errors': errors}, status=400)
+
+    with transaction.atomic():
+        pastes = Paste.bulk_insert(pastes)
+    return JsonResponse({'pastes': [_paste_json(paste, request, content=False) for paste in pastes]}, status=201)
+
+
+@require_GET
+@token_required
+@_api_rate_limit
+def get_pastes(request):
+    """Fetch up to API_MAX_BATCH pastes with ?ids=a,b,c in one query"""
+    paste_ids = [paste_id for paste_id in request.GET.get('ids', '').split(',') if paste_id]
+    if not paste_ids:
+        return JsonResponse({'error': 'pass paste IDs as ?ids=a,b,c'}, status=400)
+    if len(paste_ids) > settings.API_MAX_BATCH:
+        return JsonResponse({'error': f'at most {settings.API_MAX_BATCH} IDs per request'}, status=400)
+
+    pastes = {
+        paste.id: paste
+        for paste in Paste.objects.select_related('blob').filter(
+            pk__in=paste_ids, expires_at__gt=timezone.now()
+        )
+    }
+    return JsonResponse({
+        'pastes': [_paste_json(pastes[paste_id], request) for paste_id in paste_ids if paste_id in pastes],
+        'missing': [paste_id for paste_id in paste_ids if paste_id not in pastes],
+    })
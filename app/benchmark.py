@@ -0,0 +1,299 @@
+"""
+Endpoint benchmarks, see `manage.py bench_endpoints`.
+
+A synthetic dataset is seeded from a fixed random seed (log-normal paste
+sizes, a fraction already expired), then home, create_paste, view_paste,
+raw_paste and clone_paste are driven concurrently through Django's
+in-process test clients, over WSGI (a thread pool) or ASGI (one event
+loop). Each endpoint gets throughput, p50/p95/p99 latency and database
+queries per request, so runs can be saved as JSON and compared.
+
+The synthetic pastes share one word corpus and look alike to the
+near-duplicate check, so DEDUP_ACTION 'reject' is run as 'flag': creates
+still pay for fingerprinting but aren't turned away.
+"""
+import asyncio
+import contextvars
+import itertools
+import math
+import random
+import secrets
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Paste, PasteBand, PasteBlob, PasteFingerprint, SiteStats
+from .rollups import percentile
+
+ENDPOINTS = ['home', 'create_paste', 'view_paste', 'raw_paste', 'clone_paste']
+
+LANGUAGES = ['plaintext', 'python', 'javascript', 'go', 'rust', 'sql', 'json', 'bash']
+
+WORDS = (
+    'def return self import from for in if else while print value data result '
+    'config error None True False = == + - * ( ) [ ] { } : , . 0 1 2 42 "ok" # //'
+).split()
+
+# Median paste of ~1.5 KB with a long tail, as real pastes tend to have
+MEDIAN_SIZE = 1500
+SIZE_SIGMA = 1.2
+
+# Query counter for the request running in the current context
+_queries = contextvars.ContextVar('bench_queries', default=None)
+
+
+def _count_query(execute, sql, params, many, context):
+    counter = _queries.get()
+    if counter is not None:
+        counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+def _watch_connection(sender, connection, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+class Dataset:
+    """Reproducible synthetic pastes, grown in place to each dataset size"""
+
+    def __init__(self, seed=0, expired_fraction=0.1, max_size=200_000):
+        self.rng = random.Random(seed)
+        self.expired_fraction = expired_fraction
+        self.max_size = max_size
+        self.live_ids = []
+        self.all_ids = []
+        lines = []
+        for _ in range(4000):
+            indent = '    ' * self.rng.randint(0, 3)
+            lines.append(indent + ' '.join(self.rng.choices(WORDS, k=self.rng.randint(1, 12))))
+        self.corpus = '\n'.join(lines)
+
+    def size(self):
+        size = int(self.rng.lognormvariate(math.log(MEDIAN_SIZE), SIZE_SIGMA))
+        return min(max(size, 16), self.max_size)
+
+    def text(self, size=None):
+        size = size or self.size()
+        text = self.corpus * (size // len(self.corpus) + 2)
+        start = self.rng.randrange(len(self.corpus))
+        return text[start:start + size]
+
+    def grow(self, total, batch_size=500):
+        """Insert pastes until the dataset has `total` of them"""
+        now = timezone.now()
+        while len(self.all_ids) < total:
+            pastes = []
+            for _ in range(min(batch_size, total - len(self.all_ids) - len(pastes))):
+                expired = self.rng.random() < self.expired_fraction
+                pastes.append(Paste(
+                    title=f'bench {len(self.all_ids) + len(pastes)}',
+                    language=self.rng.choice(LANGUAGES),
+                    content=self.text(),
+                    expires_at=now + (timedelta(days=-1) if expired else timedelta(days=90)),
+                ))
+            Paste.bulk_insert(pastes)
+            for paste in pastes:
+                self.all_ids.append(paste.id)
+                if paste.expires_at > now:
+                    self.live_ids.append(paste.id)
+
+    def cleanup(self, extra_ids=()):
+        ids = self.all_ids + list(extra_ids)
+        now = timezone.now()
+        blob_ids = set()
+        count = characters = active = 0
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            rows = Paste.objects.filter(pk__in=chunk).values_list('blob_id', 'blob__length', 'expires_at')
+            for blob_id, length, expires_at in rows:
+                blob_ids.add(blob_id)
+                count += 1
+                characters += length
+                active += expires_at > now
+            Paste.objects.filter(pk__in=chunk).delete()
+            PasteBand.objects.filter(paste_id__in=chunk).delete()
+            PasteFingerprint.objects.filter(pk__in=chunk).delete()
+        PasteBlob.delete_orphans(blob_ids)
+        # The seeded pastes were never real, take them out of the totals too,
+        # leaving the lifetime counts of real pastes alone
+        if count:
+            SiteStats.record_removed(characters, count, active)
+
+
+def _headers(address):
+    return {'X-Forwarded-For': address} if address else None
+
+
+class Runner:
+    """Drives one endpoint at a time and collects per-request samples"""
+
+    def __init__(self, dataset, interface='wsgi', concurrency=8):
+        self.dataset = dataset
+        self.interface = interface
+        self.concurrency = concurrency
+        self.created_ids = []
+        # Every create gets its own address so the rate limiter lets it through,
+        # including on back to back runs
+        self._run_id = secrets.token_hex(4)
+        self._addresses = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def plan(self, endpoint, count):
+        """Build (method, path, data, client address) for `count` requests"""
+        rng = self.dataset.rng
+        requests = []
+        for _ in range(count):
+            if endpoint == 'home':
+                requests.append(('get', reverse('home'), None, None))
+            elif endpoint == 'create_paste':
+                data = {'title': 'bench', 'content': self.dataset.text(), 'language': rng.choice(LANGUAGES)}
+                address = f'bench-{self._run_id}-{next(self._addresses)}'
+                requests.append(('post', reverse('create_paste'), data, address))
+            else:
+                paste_id = rng.choice(self.dataset.live_ids)
+                requests.append(('get', reverse(endpoint, args=[paste_id]), None, None))
+        return requests
+
+    def _record(self, endpoint, response):
+        if endpoint == 'create_paste' and response.status_code == 302:
+            paste_id = response['Location'].rstrip('/').rsplit('/', 1)[-1]
+            with self._lock:
+                self.created_ids.append(paste_id)
+
+    def _sync(self, endpoint, requests):
+        local = threading.local()
+
+        def one(request):
+            method, path, data, address = request
+            if not hasattr(local, 'client'):
+                local.client = Client(raise_request_exception=False)
+            counter = [0]
+            token = _queries.set(counter)
+            try:
+                started = time.perf_counter()
+                response = getattr(local.client, method)(path, data, headers=_headers(address))
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                # The test client keeps connections open; a server would do this
+                close_old_connections()
+                elapsed = time.perf_counter() - started
+            finally:
+                _queries.reset(token)
+            self._record(endpoint, response)
+            return elapsed, counter[0], response.status_code
+
+        def close(barrier):
+            # One call per worker thread, for connections kept by CONN_MAX_AGE
+            barrier.wait()
+            connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            samples = list(pool.map(one, requests))
+            barrier = threading.Barrier(self.concurrency)
+            list(pool.map(close, [barrier] * self.concurrency))
+        return samples
+
+    async def _async(self, endpoint, requests):
+        client = AsyncClient(raise_request_exception=False)
+        limit = asyncio.Semaphore(self.concurrency)
+
+        async def one(request):
+            method, path, data, address = request
+            counter = [0]
+            _queries.set(counter)
+            async with limit:
+                started = time.perf_counter()
+                response = await getattr(client, method)(path, data, headers=_headers(address))
+                if response.streaming:
+                    b''.join([chunk async for chunk in response.streaming_content])
+                await sync_to_async(close_old_connections)()
+                elapsed = time.perf_counter() - started
+            self._record(endpoint, response)
+            return elapsed, counter[0], response.status_code
+
+        samples = await asyncio.gather(*(one(request) for request in requests))
+        await sync_to_async(connections.close_all)()
+        return samples
+
+    def run(self, endpoint, count):
+        requests = self.plan(endpoint, count)
+        started = time.perf_counter()
+        if self.interface == 'asgi':
+            samples = asyncio.run(self._async(endpoint, requests))
+        else:
+            samples = self._sync(endpoint, requests)
+        return summarize(endpoint, samples, time.perf_counter() - started)
+
+
+def summarize(endpoint, samples, seconds):
+    """Turn (seconds, queries, status) samples into one result row"""
+    latencies = sorted(elapsed * 1000 for elapsed, _, _ in samples)
+    queries = [count for _, count, _ in samples]
+    statuses = Counter(status for _, _, status in samples)
+    return {
+        'endpoint': endpoint,
+        'requests': len(samples),
+        'seconds': round(seconds, 4),
+        'throughput': round(len(samples) / seconds, 2) if seconds else 0.0,
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'queries_mean': round(sum(queries) / len(queries), 2) if queries else 0.0,
+        'queries_max': max(queries, default=0),
+        'status': {str(status): count for status, count in sorted(statuses.items())},
+    }
+
+
+def run(sizes, requests=200, concurrency=8, interface='wsgi', endpoints=ENDPOINTS,
+        seed=0, expired_fraction=0.1, warmup=10, keep=False):
+    """Benchmark each endpoint at each dataset size. Returns a JSON-able report."""
+    dataset = Dataset(seed=seed, expired_fraction=expired_fraction)
+    runner = Runner(dataset, interface=interface, concurrency=concurrency)
+    dedup_action = 'flag' if settings.DEDUP_ACTION == 'reject' else settings.DEDUP_ACTION
+    report = {
+        'started_at': timezone.now().isoformat(),
+        'config': {
+            'sizes': sizes, 'requests': requests, 'concurrency': concurrency,
+            'interface': interface, 'seed': seed, 'expired_fraction': expired_fraction,
+            'warmup': warmup, 'database': connections['default'].vendor,
+            'dedup_action': dedup_action,
+        },
+        'results': [],
+    }
+
+    connection_created.connect(_watch_connection, dispatch_uid='bench_queries')
+    for connection in connections.all(initialized_only=True):
+        _watch_connection(None, connection)
+    # The test clients always send Host: testserver
+    overrides = override_settings(
+        ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], DEDUP_ACTION=dedup_action,
+    )
+    overrides.enable()
+    try:
+        for size in sorted(sizes):
+            dataset.grow(size)
+            for endpoint in endpoints:
+                if warmup:
+                    runner.run(endpoint, warmup)
+                result = runner.run(endpoint, requests)
+                report['results'].append({'dataset_size': size, **result})
+    finally:
+        overrides.disable()
+        connection_created.disconnect(dispatch_uid='bench_queries')
+        for connection in connections.all(initialized_only=True):
+            if _count_query in connection.execute_wrappers:
+                connection.execute_wrappers.remove(_count_query)
+        if not keep:
+            dataset.cleanup(runner.created_ids)
+    return report
@@ -0,0 +1,128 @@
+"""
+Storage for paste bodies kept out of the database.
+
+Bodies of PASTE_BLOB_EXTERNAL_SIZE bytes or more are written here under
+their content hash, uncompressed so they can be streamed and served in
+ranges, and their PasteBlob row only keeps the metadata. Stores have the
+small S3-like interface the app needs (put, open, size, delete), so
+PASTE_BLOB_STORE can be a local directory or an s3://bucket/prefix URL
+(needs boto3; set AWS_ENDPOINT_URL for other S3-compatible services).
+read_range() reads part of an opened blob without loading all of it.
+"""
+import io
+import mmap
+import os
+import tempfile
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import boto3
+except ImportError:
+    boto3 = None
+
+# Blobs are read this many bytes at a time
+CHUNK_SIZE = 64 * 1024
+
+
+class FileSystemBlobStore:
+    """Blobs as files under root, fanned out by the first bytes of the key"""
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def _path(self, key):
+        return self.root / key[:2] / key[2:4] / key
+
+    def put(self, key, data):
+        path = self._path(key)
+        if path.exists():
+            # Keys are content hashes, so it's already there
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write then rename, so readers never see a partial file
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+
+    def open(self, key):
+        """Binary file object for the blob; it supports fileno() for mmap"""
+        return open(self._path(key), 'rb')
+
+    def size(self, key):
+        return self._path(key).stat().st_size
+
+    def delete(self, key):
+        self._path(key).unlink(missing_ok=True)
+
+
+class S3BlobStore:
+    """Blobs as objects in an S3 bucket, under prefix"""
+
+    def __init__(self, bucket, prefix=''):
+        if boto3 is None:
+            raise ImproperlyConfigured("s3:// blob stores need the boto3 package")
+        self.client = boto3.client('s3')
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def put(self, key, data):
+        self.client.put_object(Bucket=self.bucket, Key=self.prefix + key, Body=data)
+
+    def open(self, key):
+        """Streaming body for the blob, read with read(n)"""
+        return self.client.get_object(Bucket=self.bucket, Key=self.prefix + key)['Body']
+
+    def size(self, key):
+        return self.client.head_object(Bucket=self.bucket, Key=self.prefix + key)['ContentLength']
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self.prefix + key)
+
+
+def read_range(f, start, end, chunk_size=CHUNK_SIZE):
+    """Yield bytes start..end (inclusive) of an opened blob in chunks"""
+    try:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+        mapped = None
+    if mapped is not None:
+        with mapped:
+            for position in range(start, end + 1, chunk_size):
+                yield mapped[position:min(position + chunk_size, end + 1)]
+        return
+
+    # Streams that can't seek, like S3 bodies: skip up to start
+    position = 0
+    while position < start:
+        skipped = f.read(min(chunk_size, start - position))
+        if not skipped:
+            return
+        position += len(skipped)
+    while position <= end:
+        chunk = f.read(min(chunk_size, end + 1 - position))
+        if not chunk:
+            return
+        position += len(chunk)
+        yield chunk
+
+
+@lru_cache(maxsize=None)
+def _store(location):
+    if location.startswith('s3://'):
+        bucket, _, prefix = location.removeprefix('s3://').partition('/')
+        return S3BlobStore(bucket, prefix.rstrip('/') + '/' if prefix else '')
+    return FileSystemBlobStore(location)
+
+
+def get_store():
+    """The store configured by PASTE_BLOB_STORE"""
+    return _store(str(settings.PASTE_BLOB_STORE))
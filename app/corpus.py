@@ -0,0 +1,183 @@
+"""
+Streaming export and import of pastes as NDJSON.
+
+One paste per line: id, title, language, created_at, expires_at, views
+and content. Files ending in .gz are gzip compressed.
+
+Export walks the paste table in primary key order with a server-side
+cursor (iterator(chunk_size=...)) and fetches the database-held bodies of
+each chunk in one query; bodies in the blob store are streamed into their
+record a block at a time. Memory stays flat however many pastes there are
+and however big they get. Import inserts each chunk of lines in one
+transaction with Paste.bulk_insert and reports how many lines are done
+after every chunk, which the command saves as a checkpoint to resume from.
+
+Imported pastes aren't new, so they get no near-duplicate fingerprints,
+and the paste filter is dropped for the import and rebuilt after it
+instead of leaving a marker per paste.
+"""
+import codecs
+import gzip
+import io
+import itertools
+import json
+import sys
+from contextlib import closing
+
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from . import blobstore, pastefilter
+from .models import Paste, PasteBlob, SiteStats
+
+CHUNK_SIZE = 1000
+
+# What to do with a paste whose ID is already taken: leave the existing
+# one and skip it, or import it under a new ID
+ON_CONFLICT = ('skip', 'new-id')
+
+FIELDS = ('id', 'title', 'language', 'created_at', 'expires_at', 'views', 'blob_id')
+
+
+def open_file(path, mode):
+    """Open path for binary reading or writing, gzipped for .gz, '-' for stdio"""
+    if path == '-':
+        stdio = sys.stdin if 'r' in mode else sys.stdout
+        return open(stdio.fileno(), mode, closefd=False)
+    if path.endswith('.gz'):
+        return gzip.open(path, mode, compresslevel=6)
+    return open(path, mode)
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def export_pastes(out, created_after=None, created_before=None, live_after=None,
+                  chunk_size=CHUNK_SIZE, using='default'):
+    """Write matching pastes to the binary file out. Returns how many.
+
+    live_after keeps only pastes that expire after that time.
+    """
+    pastes = Paste.objects.using(using).order_by('pk')
+    if created_after:
+        pastes = pastes.filter(created_at__gte=created_after)
+    if created_before:
+        pastes = pastes.filter(created_at__lt=created_before)
+    if live_after:
+        pastes = pastes.filter(expires_at__gt=live_after)
+
+    total = 0
+    rows = pastes.values_list(*FIELDS).iterator(chunk_size=chunk_size)
+    for chunk in _chunks(rows, chunk_size):
+        blobs = (
+            PasteBlob.objects.using(using)
+            .filter(hash__in={row[-1] for row in chunk})
+            .exclude(codec=PasteBlob.CODEC_EXTERNAL)
+        )
+        texts = {blob.hash: blob.text() for blob in blobs}
+        for paste_id, title, language, created_at, expires_at, views, blob_id in chunk:
+            record = {
+                'id': paste_id,
+                'title': title,
+                'language': language,
+                'created_at': created_at.isoformat(),
+                'expires_at': expires_at.isoformat(),
+                'views': views,
+            }
+            if blob_id in texts:
+                record['content'] = texts[blob_id]
+                out.write(json.dumps(record, ensure_ascii=False).encode('utf-8'))
+            else:
+                _write_external(out, record, PasteBlob(hash=blob_id, codec=PasteBlob.CODEC_EXTERNAL))
+            out.write(b'\n')
+        total += len(chunk)
+    return total
+
+
+def _write_external(out, record, blob):
+    """Write record with the blob's body as its content, one block at a time"""
+    out.write(json.dumps(record, ensure_ascii=False)[:-1].encode('utf-8'))
+    out.write(b', "content": "')
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    with closing(blob.open()) as f:
+        while data := f.read(blobstore.CHUNK_SIZE):
+            # A JSON string without its quotes
+            out.write(json.dumps(decoder.decode(data), ensure_ascii=False)[1:-1].encode('utf-8'))
+    decoder.decode(b'', final=True)
+    out.write(b'"}')
+
+
+def _paste(record):
+    return Paste(
+        id=record.get('id') or None,
+        title=record.get('title', ''),
+        language=record.get('language', 'plaintext'),
+        content=record['content'],
+        created_at=parse_datetime(record['created_at']) if record.get('created_at') else None,
+        expires_at=parse_datetime(record['expires_at']) if record.get('expires_at') else None,
+        views=record.get('views', 0),
+    )
+
+
+def _insert_chunk(pastes, on_conflict):
+    """Insert one chunk in a transaction. Returns (imported, skipped)."""
+    with transaction.atomic():
+        skipped = 0
+        if on_conflict == 'skip':
+            taken = set(Paste.objects.filter(pk__in=[paste.id for paste in pastes]).values_list('pk', flat=True))
+            fresh = []
+            for paste in pastes:
+                if paste.id in taken:
+                    skipped += 1
+                else:
+                    # Only the first of any repeats in the file
+                    taken.add(paste.id)
+                    fresh.append(paste)
+            pastes = fresh
+
+        created = [paste.created_at for paste in pastes]
+        Paste.bulk_insert(pastes, imported=True)
+        # bulk_create sets created_at to now, put the exported times back
+        restored = []
+        for paste, created_at in zip(pastes, created):
+            if created_at:
+                paste.created_at = created_at
+                restored.append(paste)
+        Paste.objects.bulk_update(restored, ['created_at'])
+    return len(pastes), skipped
+
+
+def import_pastes(lines, chunk_size=CHUNK_SIZE, on_conflict='skip', start=0, on_chunk=None):
+    """Insert pastes from NDJSON lines, skipping the first `start` lines.
+
+    After each chunk commits, calls on_chunk(lines_done, imported, skipped)
+    with running totals. Returns (lines_done, imported, skipped).
+    """
+    done = start
+    imported = skipped = 0
+    # Imported pastes leave no markers, so nothing is filtered until a
+    # filter that has them is built
+    filtered = pastefilter.drop()
+    lines = itertools.islice(lines, start, None)
+    for chunk in _chunks(lines, chunk_size):
+        pastes = [_paste(json.loads(line)) for line in chunk if line.strip()]
+        chunk_imported, chunk_skipped = _insert_chunk(pastes, on_conflict)
+        done += len(chunk)
+        imported += chunk_imported
+        skipped += chunk_skipped
+        if on_chunk:
+            on_chunk(done, imported, skipped)
+
+    if imported:
+        SiteStats.rebuild()
+    if filtered:
+        pastefilter.build()
+    return done, imported, skipped
+
+
+def read_lines(stream):
+    """Text lines of a binary NDJSON stream"""
+    return io.TextIOWrapper(stream, encoding='utf-8')
@@ -0,0 +1,109 @@
+"""
+Read replica routing.
+
+Reads made while handling a GET or HEAD request go to a random database
+in DATABASE_REPLICAS; everything else, including management commands and
+any request that has written, uses the primary. A request that writes
+also sets a cookie that keeps its client on the primary for
+READ_AFTER_WRITE_SECONDS, so the paste it just created is found on the
+redirect even if the replicas haven't caught up yet.
+
+Bookkeeping writes that the client won't read back, like view counts,
+go in an unpinned() block so they don't pin the client.
+
+The routing state lives in a context variable, like the metrics, so it
+follows async views into sync_to_async threads.
+"""
+import contextvars
+import random
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+PIN_COOKIE = 'read_primary'
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Routing for the request being handled in this context
+_current = contextvars.ContextVar('db_routing', default=None)
+
+
+class Routing:
+    __slots__ = ('use_replica', 'wrote')
+
+    def __init__(self, use_replica):
+        self.use_replica = use_replica
+        self.wrote = False
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        routing = _current.get()
+        if routing is None or not routing.use_replica or not settings.DATABASE_REPLICAS:
+            return 'default'
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        routing = _current.get()
+        if routing is not None:
+            # Read our own writes for the rest of the request
+            routing.use_replica = False
+            routing.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+
+@contextmanager
+def unpinned():
+    """Query the primary inside the block without pinning the client to it"""
+    token = _current.set(None)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def _start(request):
+    use_replica = request.method in SAFE_METHODS and PIN_COOKIE not in request.COOKIES
+    routing = Routing(use_replica)
+    return routing, _current.set(routing)
+
+
+def _finish(response, routing, token):
+    _current.reset(token)
+    if routing.wrote and settings.DATABASE_REPLICAS:
+        response.set_cookie(
+            PIN_COOKIE, '1', max_age=settings.READ_AFTER_WRITE_SECONDS,
+            httponly=True, samesite='Lax',
+        )
+
+
+class ReplicaMiddleware:
+    """Let safe requests read from replicas; put this before anything that queries"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        routing, token = _start(request)
+        response = self.get_response(request)
+        _finish(response, routing, token)
+        return response
+
+    async def __acall__(self, request):
+        routing, token = _start(request)
+        response = await self.get_response(request)
+        _finish(response, routing, token)
+        return response
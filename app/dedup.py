@@ -0,0 +1,237 @@
+"""
+Near-duplicate detection for new pastes.
+
+Each paste gets a MinHash signature of its word shingles (SHINGLE_SIZE
+words in a row). It is computed with one hash per shingle by one
+permutation hashing: the top bits of the hash pick one of SIGNATURE_SIZE
+bins, and each bin keeps its smallest value. The fraction of bins two
+signatures agree on estimates the Jaccard similarity of their shingles.
+
+Signatures are cut into BANDS bands of ROWS values, and each band is
+stored hashed to one indexed key (locality sensitive hashing). Pastes
+with a similarity near the threshold almost always share a band, so
+finding near-duplicates among the pastes of the last DEDUP_WINDOW seconds
+is one index lookup for the new paste's band keys, followed by comparing
+the few signatures it returns. Exact copies are found by content hash
+as well. Pastes too short to have a signature (fewer than SHINGLE_SIZE
+words) are never counted, exact copies or not, so everyone pasting
+"hello world" can't get it rejected.
+
+PasteForm calls check(); with DEDUP_ACTION 'reject', content with
+DEDUP_MAX_COPIES or more recent near-duplicates is refused, and with
+'flag' it is saved and marked with the paste it resembles. The bulk API
+also runs check_batch(), so copies sent together count against each other.
+"""
+import hashlib
+import logging
+import re
+import struct
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+SHINGLE_SIZE = 4
+SIGNATURE_SIZE = 64
+BANDS = 16
+ROWS = SIGNATURE_SIZE // BANDS
+
+# Only the start of a paste is fingerprinted
+MAX_CHARS = 100_000
+
+# Top bits of a shingle hash pick the bin, the rest are its value
+BIN_SHIFT = 64 - (SIGNATURE_SIZE - 1).bit_length()
+VALUE_MASK = (1 << BIN_SHIFT) - 1
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def _hash64(data):
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+
+def signature(content):
+    """MinHash signature of content as SIGNATURE_SIZE ints, or None if it's too short"""
+    tokens = TOKEN_RE.findall(content[:MAX_CHARS].lower())
+    if len(tokens) < SHINGLE_SIZE:
+        return None
+    shingles = {' '.join(tokens[i:i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1)}
+
+    bins = [None] * SIGNATURE_SIZE
+    for shingle in shingles:
+        value = _hash64(shingle.encode('utf-8'))
+        index = value >> BIN_SHIFT
+        value &= VALUE_MASK
+        if bins[index] is None or value < bins[index]:
+            bins[index] = value
+
+    # Fill empty bins from the next full one, offset so they only match
+    # signatures with the same gap
+    signature = []
+    for index in range(SIGNATURE_SIZE):
+        distance = 0
+        while bins[(index + distance) % SIGNATURE_SIZE] is None:
+            distance += 1
+        signature.append(bins[(index + distance) % SIGNATURE_SIZE] + (distance << BIN_SHIFT))
+    return signature
+
+
+def pack(signature):
+    return struct.pack(f'<{SIGNATURE_SIZE}Q', *signature)
+
+
+def unpack(data):
+    return struct.unpack(f'<{SIGNATURE_SIZE}Q', bytes(data))
+
+
+def band_keys(signature):
+    """One signed 64-bit key per band"""
+    keys = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS:(band + 1) * ROWS]
+        digest = hashlib.blake2b(struct.pack(f'<B{ROWS}Q', band, *rows), digest_size=8).digest()
+        keys.append(int.from_bytes(digest, 'little', signed=True))
+    return keys
+
+
+def similarity(first, second):
+    """Estimated Jaccard similarity of two signatures"""
+    return sum(a == b for a, b in zip(first, second)) / SIGNATURE_SIZE
+
+
+@dataclass
+class Check:
+    """What check() found for some content"""
+    signature: list = None
+    # (paste_id, similarity) of recent near-duplicates, most similar first;
+    # check_batch() adds (paste, similarity) for unsaved ones of a batch
+    similar: list = field(default_factory=list)
+
+    @property
+    def is_spam(self):
+        return len(self.similar) >= settings.DEDUP_MAX_COPIES
+
+
+def find_similar(signature, content_hash=None, since=None, limit=100):
+    """Recent pastes whose signature is at least DEDUP_THRESHOLD similar"""
+    PasteBand = apps.get_model('app', 'PasteBand')
+    PasteFingerprint = apps.get_model('app', 'PasteFingerprint')
+    Paste = apps.get_model('app', 'Paste')
+    since = since or timezone.now() - timedelta(seconds=settings.DEDUP_WINDOW)
+
+    similar = {}
+    if content_hash:
+        exact = Paste.objects.filter(blob_id=content_hash, created_at__gte=since).values_list('pk', flat=True)
+        similar.update((paste_id, 1.0) for paste_id in exact[:limit])
+    if signature is not None:
+        candidates = set(
+            PasteBand.objects.filter(key__in=band_keys(signature), created_at__gte=since)
+            .values_list('paste_id', flat=True)[:limit * BANDS]
+        )
+        candidates -= similar.keys()
+        for paste_id, data in PasteFingerprint.objects.filter(pk__in=candidates).values_list('pk', 'signature'):
+            score = similarity(signature, unpack(data))
+            if score >= settings.DEDUP_THRESHOLD:
+                similar[paste_id] = score
+    return sorted(similar.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+
+def check(content, content_hash):
+    """Fingerprint new content and find its recent near-duplicates"""
+    if settings.DEDUP_ACTION == 'off':
+        return Check()
+    content_signature = signature(content)
+    if content_signature is None:
+        return Check()
+    return Check(content_signature, find_similar(content_signature, content_hash))
+
+
+def check_batch(pastes):
+    """Add the near-duplicates each paste has earlier in its own batch.
+
+    A batch is indexed only once it's inserted, so check() can't find its
+    pastes in each other. Uses the check() made for each paste, and stops
+    looking once a paste has DEDUP_MAX_COPIES.
+    """
+    if settings.DEDUP_ACTION == 'off':
+        return
+    copies = {}
+    banded = {}
+    for paste in pastes:
+        result = paste._dedup
+        if result.signature is None:
+            continue
+        keys = band_keys(result.signature)
+        found = {id(earlier): (earlier, 1.0) for earlier in copies.get(paste.content, ())}
+        compared = set(found)
+        for key in keys:
+            for earlier in banded.get(key, ()):
+                if len(result.similar) + len(found) >= settings.DEDUP_MAX_COPIES:
+                    break
+                if id(earlier) in compared:
+                    continue
+                compared.add(id(earlier))
+                score = similarity(result.signature, earlier._dedup.signature)
+                if score >= settings.DEDUP_THRESHOLD:
+                    found[id(earlier)] = (earlier, score)
+        if found:
+            result.similar = sorted(
+                result.similar + list(found.values()), key=lambda item: item[1], reverse=True,
+            )
+        copies.setdefault(paste.content, []).append(paste)
+        for key in keys:
+            banded.setdefault(key, []).append(paste)
+
+
+def index(pastes):
+    """Store fingerprints of new pastes, using the check() made for them if any"""
+    PasteBand = apps.get_model('app', 'PasteBand')
+    PasteFingerprint = apps.get_model('app', 'PasteFingerprint')
+    if settings.DEDUP_ACTION == 'off':
+        return
+
+    now = timezone.now()
+    fingerprints = []
+    bands = []
+    for paste in pastes:
+        result = getattr(paste, '_dedup', None)
+        paste_signature = result.signature if result else signature(paste.content)
+        if paste_signature is None:
+            continue
+        similar_to = result.similar[0][0] if result and result.similar else ''
+        # A paste of the same batch, which has its ID by now
+        similar_to = getattr(similar_to, 'pk', similar_to)
+        if result and result.is_spam:
+            logger.warning("paste %s looks like %d recent pastes, e.g. %s", paste.id, len(result.similar), similar_to)
+        fingerprints.append(PasteFingerprint(
+            paste_id=paste.id, signature=pack(paste_signature), similar_to=similar_to, created_at=now,
+        ))
+        bands.extend(PasteBand(key=key, paste_id=paste.id, created_at=now) for key in band_keys(paste_signature))
+    # A fingerprint outlives its paste, so an imported paste can reuse the
+    # ID. Bands of the old one may then turn up as candidates, but they're
+    # compared against the new signature.
+    PasteFingerprint.objects.bulk_create(
+        fingerprints, update_conflicts=True, unique_fields=['paste_id'],
+        update_fields=['signature', 'similar_to', 'created_at'],
+    )
+    PasteBand.objects.bulk_create(bands)
+
+
+def prune(batch_size=5000):
+    """Delete fingerprints older than DEDUP_WINDOW. Returns how many."""
+    PasteBand = apps.get_model('app', 'PasteBand')
+    PasteFingerprint = apps.get_model('app', 'PasteFingerprint')
+    before = timezone.now() - timedelta(seconds=settings.DEDUP_WINDOW)
+    total = 0
+    while True:
+        ids = list(PasteFingerprint.objects.filter(created_at__lt=before).values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            break
+        PasteBand.objects.filter(paste_id__in=ids).delete()
+        PasteFingerprint.objects.filter(pk__in=ids).delete()
+        total += len(ids)
+    return total
@@ -1,7 +1,21 @@
 from django import forms
-from .models import Paste
+from django.conf import settings
+from django.template.defaultfilters import filesizeformat
+from . import dedup
+from .models import Paste, hash_content
+
+SPAM_ERROR = "Too many recent pastes look just like this one"
 
 class PasteForm(forms.ModelForm):
+    # Not a model field, Paste.content is backed by a PasteBlob
+    content = forms.CharField(widget=forms.Textarea(attrs={
+        'class': 'code-editor',
+        'rows': 15,
+        'placeholder': '// paste your code here...\n// or just type some text idc',
+        'spellcheck': 'false',
+        'id': 'code-input'  # ADD THIS
+    }))
+    
     class Meta:
         model = Paste
         fields = ['title', 'content', 'language']
@@ -11,15 +25,24 @@ class PasteForm(forms.ModelForm):
                 'placeholder': 'config.py, notes.txt, etc',
                 'id': 'paste-title'  # ADD THIS
             }),
-            'content': forms.Textarea(attrs={
-                'class': 'code-editor',
-                'rows': 15,
-                'placeholder': '// paste your code here...\n// or just type some text idc',
-                'spellcheck': 'false',
-                'id': 'code-input'  # ADD THIS
-            }),
             'language': forms.Select(attrs={
                 'class': 'w-full p-3 bg-gray-50 border border-gray-200 rounded-xl focus:ring-2 focus:ring-pink-400 focus:border-transparent outline-none appearance-none',
                 'id': 'language-select'  # ADD THIS
             }),
-        }
\ No newline at end of file
+        }
+    
+    def clean_content(self):
+        content = self.cleaned_data['content']
+        if len(content.encode('utf-8')) > settings.PASTE_MAX_SIZE:
+            raise forms.ValidationError(
+                f"Pastes can be at most {filesizeformat(settings.PASTE_MAX_SIZE)}"
+            )
+        
+        self.instance._dedup = dedup.check(content, hash_content(content))
+        if settings.DEDUP_ACTION == 'reject' and self.instance._dedup.is_spam:
+            raise forms.ValidationError(SPAM_ERROR)
+        return content
+    
+    def save(self, commit=True):
+        self.instance.content = self.cleaned_data['content']
+        return super().save(commit)
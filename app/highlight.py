@@ -0,0 +1,136 @@
+"""
+Server-side syntax highlighting.
+
+A paste is highlighted once with Pygments and the rendered HTML, line
+count and line-number gutter are cached by content hash and language,
+so every later view (and every duplicate of the same content) reuses
+them. Languages without a lexer here, or a missing Pygments install,
+are sent escaped and highlighted in the browser by the vendored
+highlight.js, which the view only loads for them.
+
+Pastes over LARGE_PASTE_SIZE characters are rendered in windows of lines
+instead (see lines.py), each cached on its own.
+"""
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.html import escape
+
+from . import lines
+
+try:
+    from pygments import highlight as pygments_highlight
+    from pygments.formatters import HtmlFormatter
+    from pygments.lexers import get_lexer_by_name
+except ImportError:
+    pygments_highlight = None
+
+CSS_CLASS = 'skibin-hl'
+STYLE = 'github-dark'
+
+# Paste.LANGUAGE_CHOICES value -> Pygments lexer alias
+LEXERS = {
+    'plaintext': 'text',
+    'python': 'python',
+    'javascript': 'javascript',
+    'typescript': 'typescript',
+    'lua': 'lua',
+    'java': 'java',
+    'cpp': 'cpp',
+    'c': 'c',
+    'csharp': 'csharp',
+    'go': 'go',
+    'rust': 'rust',
+    'php': 'php',
+    'ruby': 'ruby',
+    'swift': 'swift',
+    'kotlin': 'kotlin',
+    'html': 'html',
+    'css': 'css',
+    'sql': 'sql',
+    'bash': 'bash',
+    'json': 'json',
+    'yaml': 'yaml',
+    'markdown': 'markdown',
+    'dockerfile': 'docker',
+}
+
+
+@lru_cache(maxsize=None)
+def _formatter():
+    return HtmlFormatter(nowrap=True, style=STYLE)
+
+
+@lru_cache(maxsize=None)
+def _lexer(language):
+    options = {'startinline': True} if language == 'php' else {}
+    return get_lexer_by_name(LEXERS[language], stripnl=False, ensurenl=False, **options)
+
+
+@lru_cache(maxsize=None)
+def style_css():
+    """Pygments CSS for highlighted pastes"""
+    if pygments_highlight is None:
+        return ''
+    return _formatter().get_style_defs(f'.{CSS_CLASS}')
+
+
+def _gutter(first_line, line_count):
+    return ''.join(f'<div>{n}</div>' for n in range(first_line, first_line + line_count))
+
+
+def _render(content, language, first_line=1):
+    line_count = content.count('\n') + 1
+    if pygments_highlight is not None and language in LEXERS:
+        html = pygments_highlight(content, _lexer(language), _formatter())
+        client_highlight = False
+    else:
+        html = escape(content)
+        client_highlight = True
+    return {
+        'html': html,
+        'client_highlight': client_highlight,
+        'line_count': line_count,
+        'gutter': _gutter(first_line, line_count),
+    }
+
+
+def _cached(key, build):
+    artifact = cache.get(key)
+    if artifact is None:
+        artifact = build()
+        cache.set(key, artifact, timeout=settings.PASTE_CACHE_TIMEOUT)
+    return artifact
+
+
+def rendered(paste):
+    """Get the rendered paste as a dict.
+
+    Keys are html, client_highlight (no lexer, html is only escaped
+    text), line_count, gutter, total_lines and
+    next_start (first line not rendered, or None).
+    Big pastes only get their first window rendered.
+    """
+    if paste.length > settings.LARGE_PASTE_SIZE:
+        return rendered_window(paste, 0, settings.LARGE_PASTE_WINDOW)
+
+    def build():
+        artifact = _render(paste.content, paste.language)
+        artifact.update(total_lines=artifact['line_count'], next_start=None)
+        return artifact
+
+    return _cached(f"paste_html_{paste.content_hash}_{paste.language}", build)
+
+
+def rendered_window(paste, start, count):
+    """Get count lines of the paste from line index start, rendered"""
+    def build():
+        text, total_lines = lines.window(paste, start, count)
+        artifact = _render(text, paste.language, first_line=start + 1)
+        end = start + artifact['line_count']
+        artifact.update(total_lines=total_lines, next_start=end if end < total_lines else None)
+        return artifact
+
+    key = f"paste_html_{paste.content_hash}_{paste.language}_{start}_{count}"
+    return _cached(key, build)
@@ -0,0 +1,121 @@
+"""
+Paste ID allocation.
+
+IDs are 8 characters drawn from a CSPRNG. New pastes are always saved
+with an INSERT (never an UPDATE), and Paste.save() retries with a fresh
+ID when the insert hits an existing one, so a collision can no longer
+overwrite someone else's paste.
+
+With PASTE_ID_POOL_SIZE > 0 each worker keeps a pool of IDs that were
+checked against the table in one query per refill, which keeps
+collisions off the create path as the keyspace fills.
+
+Allocations and collisions are counted in the default cache; see
+`manage.py paste_id_stats`. They only add up across workers when that
+cache is shared (REDIS_URL). Without it each process keeps its own
+counts, which the command can't see.
+"""
+import secrets
+import string
+import threading
+from collections import deque
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection
+
+ALPHABET = string.ascii_lowercase + string.ascii_uppercase + string.digits
+ID_LENGTH = 8
+
+# Inserts tried before giving up on a paste
+MAX_ATTEMPTS = 5
+
+ALLOCATIONS_KEY = 'paste_id_allocations'
+COLLISIONS_KEY = 'paste_id_collisions'
+
+
+def random_id(length=ID_LENGTH):
+    return ''.join(secrets.choice(ALPHABET) for _ in range(length))
+
+
+def _count(key, amount=1):
+    if not amount:
+        return
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key, amount)
+    except ValueError:
+        pass
+
+
+def record_insert(collisions, count=1):
+    """Count pastes inserted after `collisions` failed attempts"""
+    _count(ALLOCATIONS_KEY, count)
+    _count(COLLISIONS_KEY, collisions)
+
+
+class IdPool:
+    """Per-process pool of IDs not yet present in the paste table"""
+
+    def __init__(self):
+        self._ids = deque()
+        self._lock = threading.Lock()
+
+    def _refill(self, size):
+        Paste = apps.get_model('app', 'Paste')
+        candidates = {random_id() for _ in range(size)}
+        taken = set(Paste.objects.filter(pk__in=candidates).values_list('pk', flat=True))
+        _count(COLLISIONS_KEY, len(taken))
+        self._ids.extend(candidates - taken)
+
+    def take(self):
+        size = settings.PASTE_ID_POOL_SIZE
+        with self._lock:
+            if not self._ids:
+                self._refill(size)
+            return self._ids.popleft() if self._ids else random_id()
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+
+
+pool = IdPool()
+
+
+def generate_paste_id(length=ID_LENGTH):
+    """Generate a random short ID like Pastebin"""
+    if length == ID_LENGTH and settings.PASTE_ID_POOL_SIZE > 0:
+        return pool.take()
+    return random_id(length)
+
+
+def _table_size():
+    """Rows in the paste table (expired ones still hold their IDs until reaped)"""
+    Paste = apps.get_model('app', 'Paste')
+    if connection.vendor == 'postgresql':
+        # The planner's estimate, instead of counting millions of rows
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [Paste._meta.db_table])
+            row = cursor.fetchone()
+        if row and row[0] >= 0:
+            return row[0]
+    return Paste.objects.count()
+
+
+def stats():
+    """Collision rate so far against the rate expected at the current size"""
+    allocations = cache.get(ALLOCATIONS_KEY) or 0
+    collisions = cache.get(COLLISIONS_KEY) or 0
+    table_size = _table_size()
+    return {
+        'allocations': allocations,
+        'collisions': collisions,
+        'collision_rate': collisions / allocations if allocations else 0.0,
+        'table_size': table_size,
+        'expected_rate': table_size / len(ALPHABET) ** ID_LENGTH,
+        # False when each process counts on its own
+        'counters_shared': not isinstance(caches['default'], LocMemCache),
+    }
@@ -0,0 +1,78 @@
+"""
+Line windows over paste content.
+
+Big pastes are rendered a window of lines at a time. The byte offset of
+every line start in the UTF-8 body is computed once per content hash and
+cached, so slicing out any window is a couple of index lookups instead of
+a split of the whole body. Bodies in the blob store are scanned and read
+in ranges through blobstore.read_range, so they are never loaded whole.
+"""
+from array import array
+from contextlib import closing
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .blobstore import read_range
+
+
+def _external_blob(paste):
+    """The paste's blob if its body is in the blob store and not loaded"""
+    if paste._content is None and paste.blob_id and paste.blob.is_external:
+        return paste.blob
+    return None
+
+
+def _compute_offsets(chunks):
+    offsets = array('Q', [0])
+    base = 0
+    for chunk in chunks:
+        find = chunk.find
+        pos = find(b'\n')
+        while pos != -1:
+            offsets.append(base + pos + 1)
+            pos = find(b'\n', pos + 1)
+        base += len(chunk)
+    return offsets
+
+
+def _read(paste, start, end):
+    """Bytes start..end (exclusive, None for the end of the body) of the paste"""
+    blob = _external_blob(paste)
+    if blob is None:
+        return paste.content.encode('utf-8')[start:end]
+    with closing(blob.open()) as f:
+        last = (end if end is not None else blob.size()) - 1
+        return b''.join(read_range(f, start, last))
+
+
+def line_offsets(paste):
+    """Get the byte offset of every line start in the paste's UTF-8 body"""
+    key = f"paste_line_bytes_{paste.content_hash}"
+    offsets = cache.get(key)
+    if offsets is None:
+        blob = _external_blob(paste)
+        if blob is None:
+            offsets = _compute_offsets([paste.content.encode('utf-8')])
+        else:
+            with closing(blob.open()) as f:
+                offsets = _compute_offsets(read_range(f, 0, blob.size() - 1))
+        cache.set(key, offsets, timeout=settings.PASTE_CACHE_TIMEOUT)
+    return offsets
+
+
+def window(paste, start, count):
+    """Get (text, total_lines) for count lines starting at line index start"""
+    offsets = line_offsets(paste)
+    total = len(offsets)
+    start = min(max(start, 0), total)
+    end = min(start + count, total)
+    if start == end:
+        return '', total
+    if end < total:
+        # Drop the newline that ends the window's last line
+        data = _read(paste, offsets[start], offsets[end] - 1)
+    else:
+        data = _read(paste, offsets[start], None)
+    # Line starts follow a newline byte, so windows never split a character
+    return data.decode('utf-8'), total
@@ -0,0 +1,108 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+
+from app.models import Paste, PasteBlob, SiteStats
+from app.responses import STREAM_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare serving /p/<id>/raw/ to slow clients with a fixed pool of sync "
+        "workers (gunicorn sync) against the ASGI handler on one event loop"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--workers', type=int, default=4, help="Sync workers for the WSGI run")
+        parser.add_argument('--concurrency', type=int, default=100, help="In-flight requests for the ASGI run")
+        parser.add_argument('--size', type=int, default=512 * 1024, help="Paste size in bytes")
+        parser.add_argument(
+            '--client-delay', type=float, default=0.01,
+            help="Seconds a slow client takes to read each 64 KiB of the response",
+        )
+
+    def handle(self, *args, **options):
+        paste = Paste.objects.create(title='bench', content='x' * options['size'])
+        host = next((h for h in settings.ALLOWED_HOSTS if h not in ('*', '')), 'localhost')
+        path = f'/p/{paste.id}/raw/'
+        try:
+            wsgi = self.bench_wsgi(path, host, options)
+            asgi = asyncio.run(self.bench_asgi(path, host, options))
+        finally:
+            blob_id = paste.blob_id
+            paste.delete()
+            PasteBlob.delete_orphans([blob_id])
+            SiteStats.record_removed(options['size'])
+
+        for name, seconds in (('wsgi', wsgi), ('asgi', asgi)):
+            self.stdout.write(
+                f"{name}: {options['requests']} requests in {seconds:.2f}s "
+                f"({options['requests'] / seconds:.1f} req/s)"
+            )
+        self.stdout.write(f"asgi speedup: {wsgi / asgi:.1f}x")
+
+    def bench_wsgi(self, path, host, options):
+        app = WSGIHandler()
+        delay = options['client_delay']
+
+        def one_request(_):
+            environ = {
+                'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '',
+                'SERVER_NAME': host, 'SERVER_PORT': '80', 'HTTP_HOST': host,
+                'wsgi.input': BytesIO(), 'wsgi.url_scheme': 'http',
+                'wsgi.errors': BytesIO(), 'SERVER_PROTOCOL': 'HTTP/1.1',
+            }
+            result = app(environ, lambda status, headers, exc_info=None: None)
+            try:
+                # The worker is stuck until the slow client has read everything
+                for chunk in result:
+                    time.sleep(delay * max(len(chunk) / STREAM_CHUNK_SIZE, 1))
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            list(pool.map(one_request, range(options['requests'])))
+        return time.monotonic() - started
+
+    async def bench_asgi(self, path, host, options):
+        app = ASGIHandler()
+        delay = options['client_delay']
+        limit = asyncio.Semaphore(options['concurrency'])
+
+        async def one_request():
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+                'method': 'GET', 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+                'query_string': b'', 'root_path': '',
+                'headers': [(b'host', host.encode())],
+                'client': ('127.0.0.1', 0), 'server': (host, 80),
+            }
+
+            received = asyncio.Event()
+
+            async def receive():
+                if received.is_set():
+                    # Client stays connected until the response is done
+                    await asyncio.Future()
+                received.set()
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+            async def send(message):
+                if message['type'] == 'http.response.body':
+                    await asyncio.sleep(delay * max(len(message.get('body', b'')) / STREAM_CHUNK_SIZE, 1))
+
+            async with limit:
+                await app(scope, receive, send)
+
+        started = time.monotonic()
+        await asyncio.gather(*(one_request() for _ in range(options['requests'])))
+        return time.monotonic() - started
@@ -0,0 +1,114 @@
+import random
+import string
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from app import dedup
+from app.models import PasteBand, PasteFingerprint
+from app.rollups import percentile
+
+# Synthetic fingerprints get IDs no real paste can have, so they're easy to remove
+PREFIX = '~'
+
+VOCABULARY_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed synthetic MinHash fingerprints and report near-duplicate lookup "
+        "latency and recall for mutated copies of planted pastes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fingerprints', type=int, default=1_000_000, help="Synthetic fingerprints to seed")
+        parser.add_argument('--planted', type=int, default=200, help="Pastes to plant and look up mutated copies of")
+        parser.add_argument('--mutation', type=float, default=0.02, help="Fraction of words changed in each copy")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--keep', action='store_true', help="Leave the seeded fingerprints in the database")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        # Planted ones are made fresh each run; seeded ones kept by --keep are reused
+        PasteBand.objects.filter(paste_id__startswith=PREFIX + 'p').delete()
+        PasteFingerprint.objects.filter(pk__startswith=PREFIX + 'p').delete()
+        existing = PasteFingerprint.objects.filter(pk__startswith=PREFIX).count()
+        try:
+            started = time.perf_counter()
+            self.seed(rng, existing, options['fingerprints'], options['batch_size'])
+            seconds = time.perf_counter() - started
+            self.stdout.write(
+                f"seeded {max(options['fingerprints'] - existing, 0)} fingerprints in {seconds:.1f}s"
+            )
+            self.lookups(rng, options['planted'], options['mutation'])
+        finally:
+            if not options['keep']:
+                PasteBand.objects.filter(paste_id__startswith=PREFIX).delete()
+                PasteFingerprint.objects.filter(pk__startswith=PREFIX).delete()
+
+    def seed(self, rng, start, total, batch_size):
+        # Signatures of unrelated pastes share almost no values, so random
+        # ones stand in for them. Rows go in with executemany, as building
+        # millions of model instances would be most of the run.
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        quote = connection.ops.quote_name
+        insert_fingerprint = (
+            f"INSERT INTO {quote(PasteFingerprint._meta.db_table)} (paste_id, signature, similar_to, created_at) "
+            f"VALUES (%s, %s, '', %s)"
+        )
+        insert_band = (
+            f"INSERT INTO {quote(PasteBand._meta.db_table)} ({quote('key')}, paste_id, created_at) "
+            f"VALUES (%s, %s, %s)"
+        )
+        for offset in range(start, total, batch_size):
+            fingerprints = []
+            bands = []
+            for number in range(offset, min(offset + batch_size, total)):
+                paste_id = f'{PREFIX}{number:09d}'
+                signature = [rng.getrandbits(64) for _ in range(dedup.SIGNATURE_SIZE)]
+                fingerprints.append((paste_id, dedup.pack(signature), now))
+                bands.extend((key, paste_id, now) for key in dedup.band_keys(signature))
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(insert_fingerprint, fingerprints)
+                cursor.executemany(insert_band, bands)
+            self.stderr.write(f"  {offset + len(fingerprints)}/{total}")
+
+    def lookups(self, rng, planted, mutation):
+        now = timezone.now()
+        vocabulary = [
+            ''.join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 10))) for _ in range(VOCABULARY_SIZE)
+        ]
+        texts = {}
+        for number in range(planted):
+            words = rng.choices(vocabulary, k=rng.randint(50, 400))
+            paste_id = f'{PREFIX}p{number:08d}'
+            texts[paste_id] = words
+            signature = dedup.signature(' '.join(words))
+            PasteFingerprint.objects.create(paste_id=paste_id, signature=dedup.pack(signature), created_at=now)
+            PasteBand.objects.bulk_create(
+                PasteBand(key=key, paste_id=paste_id, created_at=now) for key in dedup.band_keys(signature)
+            )
+
+        signing = []
+        lookups = []
+        found = 0
+        for paste_id, words in texts.items():
+            copy = [rng.choice(vocabulary) if rng.random() < mutation else word for word in words]
+            started = time.perf_counter()
+            signature = dedup.signature(' '.join(copy))
+            signed = time.perf_counter()
+            similar = dedup.find_similar(signature)
+            lookups.append(time.perf_counter() - signed)
+            signing.append(signed - started)
+            found += any(similar_id == paste_id for similar_id, _ in similar)
+
+        for name, samples in (('signature', signing), ('lookup', lookups)):
+            samples.sort()
+            self.stdout.write(
+                f"{name:<10} p50 {percentile(samples, 50) * 1000:.2f}ms  "
+                f"p95 {percentile(samples, 95) * 1000:.2f}ms  p99 {percentile(samples, 99) * 1000:.2f}ms"
+            )
+        self.stdout.write(f"recall {found}/{planted} mutated copies found ({mutation:.0%} of words changed)")
@@ -0,0 +1,60 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app import benchmark
+
+
+def int_list(value):
+    return [int(item) for item in value.split(',') if item]
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a synthetic dataset and report throughput, latency percentiles and "
+        "queries per request for the paste endpoints at each dataset size"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int_list, default=[1000, 10000], help="Comma separated dataset sizes")
+        parser.add_argument('--requests', type=int, default=200, help="Requests per endpoint and size")
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--interface', choices=['wsgi', 'asgi'], default='wsgi')
+        parser.add_argument(
+            '--endpoints', type=lambda value: value.split(','), default=benchmark.ENDPOINTS,
+            help="Comma separated subset of " + ', '.join(benchmark.ENDPOINTS),
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--expired-fraction', type=float, default=0.1)
+        parser.add_argument('--warmup', type=int, default=10, help="Untimed requests per endpoint first")
+        parser.add_argument('--keep', action='store_true', help="Leave the seeded pastes in the database")
+        parser.add_argument('--output', help="Write the JSON report to this file")
+
+    def handle(self, *args, **options):
+        unknown = set(options['endpoints']) - set(benchmark.ENDPOINTS)
+        if unknown:
+            raise CommandError(f"unknown endpoints: {', '.join(sorted(unknown))}")
+
+        report = benchmark.run(
+            sizes=options['sizes'],
+            requests=options['requests'],
+            concurrency=options['concurrency'],
+            interface=options['interface'],
+            endpoints=options['endpoints'],
+            seed=options['seed'],
+            expired_fraction=options['expired_fraction'],
+            warmup=options['warmup'],
+            keep=options['keep'],
+        )
+
+        for row in report['results']:
+            self.stdout.write(
+                f"{row['dataset_size']:>8} {row['endpoint']:<13} {row['throughput']:>9.1f} req/s  "
+                f"p50 {row['p50_ms']:.1f}ms  p95 {row['p95_ms']:.1f}ms  p99 {row['p99_ms']:.1f}ms  "
+                f"{row['queries_mean']:.1f} queries  {row['status']}"
+            )
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"wrote {options['output']}")
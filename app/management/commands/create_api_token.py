@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from app.models import ApiToken
+
+
+class Command(BaseCommand):
+    help = "Create a token for the JSON API"
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', help="Who or what the token is for")
+
+    def handle(self, *args, **options):
+        token, key = ApiToken.create_token(options['name'])
+        self.stdout.write(f"created token {token.name!r}, this key is only shown once:")
+        self.stdout.write(key)
@@ -0,0 +1,49 @@
+import time
+from datetime import datetime, time as dt_time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from app import corpus
+
+
+def moment(value):
+    """A date or ISO datetime, in the current time zone unless it has one"""
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(value)
+        parsed = datetime.combine(day, dt_time.min)
+    return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed)
+
+
+class Command(BaseCommand):
+    help = "Stream pastes to an NDJSON file, gzipped if it ends in .gz"
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="File to write, or - for stdout")
+        parser.add_argument('--created-after', type=moment, help="Only pastes created at or after this date")
+        parser.add_argument('--created-before', type=moment, help="Only pastes created before this date")
+        parser.add_argument('--live', action='store_true', help="Skip expired pastes")
+        parser.add_argument('--chunk-size', type=int, default=corpus.CHUNK_SIZE)
+        parser.add_argument('--database', default='default', help="Database alias to read from, e.g. a replica")
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be positive")
+
+        started = time.monotonic()
+        with corpus.open_file(options['output'], 'wb') as out:
+            total = corpus.export_pastes(
+                out,
+                created_after=options['created_after'],
+                created_before=options['created_before'],
+                live_after=timezone.now() if options['live'] else None,
+                chunk_size=options['chunk_size'],
+                using=options['database'],
+            )
+        seconds = time.monotonic() - started
+        rate = total / seconds if seconds else 0
+        self.stderr.write(f"exported {total} pastes in {seconds:.1f}s ({rate:.0f}/s)")
@@ -0,0 +1,32 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from app import viewcounts
+
+
+class Command(BaseCommand):
+    help = "Write buffered paste view counts to the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop', action='store_true',
+            help="Keep running, flushing every VIEW_COUNT_FLUSH_INTERVAL seconds",
+        )
+        parser.add_argument(
+            '--all', action='store_true',
+            help="Also flush the generation that is still being written to",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            flushed = viewcounts.flush(include_current=options['all'])
+            if flushed is None:
+                self.stdout.write("another flusher is running, skipped")
+            else:
+                self.stdout.write(f"flushed {flushed} views")
+
+            if not options['loop']:
+                break
+            time.sleep(settings.VIEW_COUNT_FLUSH_INTERVAL)
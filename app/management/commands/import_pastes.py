@@ -0,0 +1,64 @@
+import os
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app import corpus
+
+
+class Command(BaseCommand):
+    help = (
+        "Load pastes from an NDJSON export in chunks, resuming from the "
+        "checkpoint file if an earlier run was interrupted"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help="File from export_pastes, gzipped if it ends in .gz")
+        parser.add_argument('--chunk-size', type=int, default=corpus.CHUNK_SIZE, help="Pastes per transaction")
+        parser.add_argument(
+            '--on-conflict', choices=corpus.ON_CONFLICT, default='skip',
+            help="For IDs already taken: keep the existing paste, or import under a new ID",
+        )
+        parser.add_argument('--checkpoint', help="Progress file, <input>.checkpoint by default")
+        parser.add_argument('--restart', action='store_true', help="Ignore the checkpoint and start over")
+
+    def handle(self, *args, **options):
+        if options['input'] == '-':
+            raise CommandError("import needs a file, so it can resume")
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be positive")
+
+        checkpoint = Path(options['checkpoint'] or options['input'] + '.checkpoint')
+        start = 0
+        if checkpoint.exists() and not options['restart']:
+            start = int(checkpoint.read_text())
+            self.stderr.write(f"resuming after line {start}")
+
+        started = time.monotonic()
+
+        def on_chunk(done, imported, skipped):
+            # Write then rename, so a crash never leaves a torn checkpoint
+            tmp = checkpoint.with_name(checkpoint.name + '.tmp')
+            tmp.write_text(str(done))
+            os.replace(tmp, checkpoint)
+            seconds = time.monotonic() - started
+            rate = imported / seconds if seconds else 0
+            self.stderr.write(f"line {done}: {imported} imported, {skipped} skipped ({rate:.0f}/s)")
+
+        with corpus.open_file(options['input'], 'rb') as stream:
+            done, imported, skipped = corpus.import_pastes(
+                corpus.read_lines(stream),
+                chunk_size=options['chunk_size'],
+                on_conflict=options['on_conflict'],
+                start=start,
+                on_chunk=on_chunk,
+            )
+        checkpoint.unlink(missing_ok=True)
+
+        seconds = time.monotonic() - started
+        rate = imported / seconds if seconds else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"imported {imported} pastes, skipped {skipped} taken IDs, "
+            f"{done} lines in {seconds:.1f}s ({rate:.0f}/s)"
+        ))
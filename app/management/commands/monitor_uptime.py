@@ -0,0 +1,38 @@
+import asyncio
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from app import monitoring
+
+
+class Command(BaseCommand):
+    help = "Probe the configured services every UPTIME_INTERVAL seconds"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Run a single tick and exit")
+
+    def handle(self, *args, **options):
+        asyncio.run(self.run(options['once']))
+
+    async def run(self, once):
+        record = sync_to_async(monitoring.record_results)
+        async with monitoring.make_client() as client:
+            while True:
+                started = time.monotonic()
+                results = await monitoring.probe_all(
+                    client, settings.UPTIME_SERVICES,
+                    settings.UPTIME_TIMEOUT, settings.UPTIME_JITTER,
+                )
+                summary = await record(results)
+                down = [name for name, result in summary.items() if not result['is_up']]
+                self.stdout.write(
+                    f"checked {len(summary)} services in {time.monotonic() - started:.1f}s"
+                    + (f", down: {', '.join(down)}" if down else "")
+                )
+
+                if once:
+                    break
+                await asyncio.sleep(max(settings.UPTIME_INTERVAL - (time.monotonic() - started), 0))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from app import ids
+
+
+class Command(BaseCommand):
+    help = "Show paste ID collision rate against the rate expected at the current table size"
+
+    def handle(self, *args, **options):
+        stats = ids.stats()
+        if not stats['counters_shared']:
+            self.stderr.write("The default cache is per process (no REDIS_URL), so only this process's counts show")
+        self.stdout.write(
+            f"{stats['allocations']} IDs allocated, {stats['collisions']} collisions "
+            f"({stats['collision_rate']:.6%})"
+        )
+        self.stdout.write(
+            f"{stats['table_size']} pastes, expected collision rate "
+            f"{stats['expected_rate']:.6%} per allocation"
+        )
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app import dedup, reaper
+from app.models import RateLimitCounter
+
+
+class Command(BaseCommand):
+    help = "Delete expired pastes in small batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=reaper.BATCH_SIZE,
+            help="Pastes deleted per transaction",
+        )
+        parser.add_argument(
+            '--pause', type=float, default=0.05,
+            help="Seconds to sleep between batches",
+        )
+        parser.add_argument(
+            '--loop', action='store_true',
+            help="Keep running, reaping every --interval seconds",
+        )
+        parser.add_argument('--interval', type=int, default=300)
+
+    def handle(self, *args, **options):
+        while True:
+            deleted, seconds = reaper.reap(options['batch_size'], options['pause'])
+            rate = deleted / seconds if seconds else 0
+            self.stdout.write(f"reaped {deleted} pastes in {seconds:.1f}s ({rate:.0f}/s)")
+            pruned = dedup.prune(options['batch_size'])
+            self.stdout.write(f"pruned {pruned} old fingerprints")
+            pruned = RateLimitCounter.prune()
+            self.stdout.write(f"pruned {pruned} old rate limit counters")
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
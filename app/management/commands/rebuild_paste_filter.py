@@ -0,0 +1,52 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from app import ids, pastefilter
+
+
+class Command(BaseCommand):
+    help = "Build the Bloom filter of live paste IDs that lets workers 404 missing IDs without a query"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--error-rate', type=float, help="Defaults to PASTE_FILTER_ERROR_RATE")
+        parser.add_argument(
+            '--loop', action='store_true',
+            help="Keep running, rebuilding every --interval seconds",
+        )
+        parser.add_argument(
+            '--interval', type=int,
+            help="Defaults to half of PASTE_FILTER_MAX_AGE",
+        )
+        parser.add_argument(
+            '--synthetic', type=int, metavar='N',
+            help="Only measure a filter of N random IDs, without reading or sharing anything",
+        )
+        parser.add_argument('--samples', type=int, default=100_000, help="Unknown IDs tried to measure false positives")
+
+    def handle(self, *args, **options):
+        error_rate = options['error_rate'] or settings.PASTE_FILTER_ERROR_RATE
+        if options['synthetic']:
+            started = time.monotonic()
+            bloom = pastefilter.BloomFilter.for_capacity(options['synthetic'], error_rate)
+            for _ in range(options['synthetic']):
+                bloom.add(ids.random_id())
+            self.report(bloom, options['synthetic'], time.monotonic() - started, options['samples'])
+            return
+
+        interval = options['interval'] or max(settings.PASTE_FILTER_MAX_AGE // 2, 1)
+        while True:
+            bloom, count, seconds = pastefilter.build(error_rate)
+            self.report(bloom, count, seconds, options['samples'])
+            if not options['loop']:
+                break
+            time.sleep(interval)
+
+    def report(self, bloom, count, seconds, samples):
+        # Random IDs are all but certainly not pastes, so any hit is a false positive
+        hits = sum(ids.random_id() in bloom for _ in range(samples))
+        self.stdout.write(
+            f"{count} IDs in {seconds:.1f}s: {len(bloom.bits) / 2**20:.1f} MiB, {bloom.hashes} hashes, "
+            f"{hits / samples:.2%} false positives ({hits}/{samples})"
+        )
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from app.models import Paste, PasteSearch
+
+
+class Command(BaseCommand):
+    help = "Add every live paste missing from the search index"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        pastes = (
+            Paste.objects.select_related('blob')
+            .filter(expires_at__gt=timezone.now(), search__isnull=True)
+            .order_by('pk')
+        )
+        batch = []
+        total = 0
+        for paste in pastes.iterator(chunk_size=options['batch_size']):
+            batch.append(paste)
+            if len(batch) >= options['batch_size']:
+                PasteSearch.index(batch)
+                total += len(batch)
+                batch = []
+        PasteSearch.index(batch)
+        total += len(batch)
+        self.stdout.write(self.style.SUCCESS(f"indexed {total} pastes"))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from app.models import SiteStats
+
+
+class Command(BaseCommand):
+    help = "Recount the home page stats from the paste table"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset-totals', action='store_true',
+            help="Let the lifetime totals drop to what's left in the table",
+        )
+
+    def handle(self, *args, **options):
+        stats = SiteStats.rebuild(keep_totals=not options['reset_totals'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats.total_pastes} pastes, {stats.active_pastes} active, "
+            f"{stats.total_characters} characters"
+        ))
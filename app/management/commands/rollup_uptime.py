@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app import rollups
+
+
+class Command(BaseCommand):
+    help = "Roll raw uptime checks up into hourly and daily aggregates and prune old rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop', action='store_true',
+            help="Keep running, rolling up every --interval seconds",
+        )
+        parser.add_argument('--interval', type=int, default=600)
+
+    def handle(self, *args, **options):
+        while True:
+            hourly = rollups.rollup('hour')
+            daily = rollups.rollup('day')
+            logs, old_hourly = rollups.prune()
+            self.stdout.write(
+                f"wrote {hourly} hourly and {daily} daily rollups, "
+                f"pruned {logs} checks and {old_hourly} hourly rollups"
+            )
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
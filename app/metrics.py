@@ -0,0 +1,268 @@
+"""
+Per-request metrics, exported in Prometheus text format at /metrics.
+
+MetricsMiddleware times every request and records, per route: latency,
+response size, database queries and query time, and paste cache hits,
+misses and lookups the paste filter turned away. Totals are kept in this process only, so with several workers
+each scrape sees the worker that served it; scrape them individually or
+label them by instance.
+
+Queries are counted by an execute wrapper put on every connection as it
+is opened. Its state lives in a context variable, so queries made from
+sync_to_async threads by async views are counted too. METRICS_SAMPLE_RATE
+of requests also keep each query's SQL. A sampled request slower than
+METRICS_SLOW_REQUEST_MS is logged with its METRICS_SLOW_QUERIES slowest
+queries.
+"""
+import contextvars
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# Stats for the request being handled in this context
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestStats:
+    __slots__ = ('queries', 'db_seconds', 'cache_hits', 'cache_misses', 'cache_filtered', 'sampled', 'sql')
+
+    def __init__(self, sampled):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_filtered = 0
+        self.sampled = sampled
+        self.sql = []
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Counters and histograms for this process, keyed by label tuples"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.requests = defaultdict(int)
+        self.db_queries = defaultdict(int)
+        self.db_seconds = defaultdict(float)
+        self.cache = defaultdict(int)
+        self.latency = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.queries = defaultdict(lambda: Histogram(QUERY_BUCKETS))
+        self.size = defaultdict(lambda: Histogram(SIZE_BUCKETS))
+
+    def record(self, route, method, status, seconds, size, stats):
+        with self._lock:
+            self.requests[(route, method, str(status))] += 1
+            self.latency[(route, method)].observe(seconds)
+            self.queries[(route,)].observe(stats.queries)
+            if size is not None:
+                self.size[(route,)].observe(size)
+            self.db_queries[(route,)] += stats.queries
+            self.db_seconds[(route,)] += stats.db_seconds
+            self.cache[(route, 'hit')] += stats.cache_hits
+            self.cache[(route, 'miss')] += stats.cache_misses
+            if stats.cache_filtered:
+                self.cache[(route, 'filtered')] += stats.cache_filtered
+
+    def render(self):
+        """Everything in Prometheus text exposition format"""
+        with self._lock:
+            lines = []
+            _counter(lines, 'skibin_requests_total', "Requests served",
+                     ('route', 'method', 'status'), self.requests)
+            _histogram(lines, 'skibin_request_duration_seconds', "Request latency",
+                       ('route', 'method'), self.latency)
+            _histogram(lines, 'skibin_request_db_queries', "Database queries per request",
+                       ('route',), self.queries)
+            _counter(lines, 'skibin_db_queries_total', "Database queries",
+                     ('route',), self.db_queries)
+            _counter(lines, 'skibin_db_query_seconds_total', "Time spent in database queries",
+                     ('route',), self.db_seconds)
+            _counter(lines, 'skibin_paste_cache_lookups_total', "Paste cache lookups",
+                     ('route', 'result'), self.cache)
+            _histogram(lines, 'skibin_response_size_bytes', "Response body size",
+                       ('route',), self.size)
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    escaped = (
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _counter(lines, name, help_text, label_names, values):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} counter')
+    for key, value in sorted(values.items()):
+        lines.append(f'{name}{_labels(label_names, key)} {_number(value)}')
+
+
+def _histogram(lines, name, help_text, label_names, histograms):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} histogram')
+    for key, histogram in sorted(histograms.items()):
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{_labels(label_names, key, [("le", bound)])} {cumulative}')
+        lines.append(f'{name}_bucket{_labels(label_names, key, [("le", "+Inf")])} {histogram.count}')
+        lines.append(f'{name}_sum{_labels(label_names, key)} {_number(histogram.sum)}')
+        lines.append(f'{name}_count{_labels(label_names, key)} {histogram.count}')
+
+
+registry = Registry()
+
+
+def _time_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        stats.queries += 1
+        stats.db_seconds += elapsed
+        if stats.sampled:
+            stats.sql.append((elapsed, sql))
+
+
+def _watch_connection(sender, connection, **kwargs):
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+connection_created.connect(_watch_connection, dispatch_uid='app.metrics')
+
+
+def record_cache(result):
+    """Count a paste cache lookup against the current request.
+
+    result is 'hit', 'miss', or 'filtered' for a lookup the paste filter
+    answered; those are kept apart so they don't skew the hit ratio.
+    """
+    stats = _current.get()
+    if stats is not None:
+        if result == 'hit':
+            stats.cache_hits += 1
+        elif result == 'miss':
+            stats.cache_misses += 1
+        else:
+            stats.cache_filtered += 1
+
+
+def _route(request):
+    match = getattr(request, 'resolver_match', None)
+    # Unmatched paths all share one label to keep the series bounded
+    return match.route if match else 'unmatched'
+
+
+def _response_size(response):
+    if response.streaming:
+        length = response.get('Content-Length')
+        return int(length) if length else None
+    return len(response.content)
+
+
+def _start():
+    stats = RequestStats(sampled=random.random() < settings.METRICS_SAMPLE_RATE)
+    return stats, _current.set(stats), time.perf_counter()
+
+
+def _finish(request, response, stats, token, started):
+    seconds = time.perf_counter() - started
+    _current.reset(token)
+    registry.record(
+        _route(request), request.method, response.status_code, seconds,
+        _response_size(response), stats,
+    )
+    if stats.sampled and seconds * 1000 >= settings.METRICS_SLOW_REQUEST_MS:
+        worst = sorted(stats.sql, key=lambda query: query[0], reverse=True)[:settings.METRICS_SLOW_QUERIES]
+        logger.warning(
+            "slow request %s %s: %.1fms, %d queries in %.1fms, paste cache %d hits/%d misses%s",
+            request.method, request.path, seconds * 1000, stats.queries, stats.db_seconds * 1000,
+            stats.cache_hits, stats.cache_misses,
+            ''.join(f"\n  {elapsed * 1000:.1f}ms {sql[:300]}" for elapsed, sql in worst),
+        )
+
+
+class MetricsMiddleware:
+    """Time every request; put this first so it covers the whole stack"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        # Connections opened before this module was imported
+        for connection in connections.all(initialized_only=True):
+            _watch_connection(None, connection)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats, token, started = _start()
+        response = self.get_response(request)
+        _finish(request, response, stats, token, started)
+        return response
+
+    async def __acall__(self, request):
+        stats, token, started = _start()
+        response = await self.get_response(request)
+        _finish(request, response, stats, token, started)
+        return response
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint, behind METRICS_TOKEN when it's set"""
+    token = settings.METRICS_TOKEN
+    if token:
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+        if not constant_time_compare(supplied, token):
+            return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,47 @@
+# Generated by Django 6.0 on 2026-10-17 10:12
+
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import Length
+from django.utils import timezone
+
+
+def populate_stats(apps, schema_editor):
+    db = schema_editor.connection.alias
+    Paste = apps.get_model('app', 'Paste')
+    SiteStats = apps.get_model('app', 'SiteStats')
+    SiteStats.objects.using(db).create(
+        pk=1,
+        total_pastes=Paste.objects.using(db).count(),
+        total_characters=Paste.objects.using(db).aggregate(total=Sum(Length('content')))['total'] or 0,
+        active_pastes=Paste.objects.using(db).filter(expires_at__gt=timezone.now()).count(),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0002_alter_paste_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SiteStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_pastes', models.PositiveBigIntegerField(default=0)),
+                ('total_characters', models.PositiveBigIntegerField(default=0)),
+                ('active_pastes', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'site stats',
+            },
+        ),
+        migrations.AlterField(
+            model_name='paste',
+            name='language',
+            field=models.CharField(choices=[('plaintext', 'Plain Text'), ('python', 'Python'), ('javascript', 'JavaScript'), ('typescript', 'TypeScript'), ('lua', 'Lua'), ('java', 'Java'), ('cpp', 'C++'), ('c', 'C'), ('csharp', 'C#'), ('go', 'Go'), ('rust', 'Rust'), ('php', 'PHP'), ('ruby', 'Ruby'), ('swift', 'Swift'), ('kotlin', 'Kotlin'), ('html', 'HTML'), ('css', 'CSS'), ('sql', 'SQL'), ('bash', 'Bash'), ('json', 'JSON'), ('yaml', 'YAML'), ('markdown', 'Markdown'), ('dockerfile', 'Dockerfile')], default='plaintext', max_length=20),
+        ),
+        migrations.RunPython(populate_stats, migrations.RunPython.noop),
+    ]
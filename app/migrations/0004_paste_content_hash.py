@@ -0,0 +1,35 @@
+# Generated by Django 6.0 on 2026-10-17 11:40
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def fill_content_hash(apps, schema_editor):
+    db = schema_editor.connection.alias
+    Paste = apps.get_model('app', 'Paste')
+    batch = []
+    for paste in Paste.objects.using(db).only('id', 'content').iterator(chunk_size=500):
+        paste.content_hash = hashlib.sha256(paste.content.encode('utf-8')).hexdigest()
+        batch.append(paste)
+        if len(batch) >= 500:
+            Paste.objects.using(db).bulk_update(batch, ['content_hash'])
+            batch = []
+    if batch:
+        Paste.objects.using(db).bulk_update(batch, ['content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0003_sitestats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paste',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+        migrations.RunPython(fill_content_hash, migrations.RunPython.noop),
+    ]
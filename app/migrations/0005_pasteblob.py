@@ -0,0 +1,71 @@
+# Generated by Django 6.0 on 2026-10-17 13:05
+
+import hashlib
+import zlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def move_content_to_blobs(apps, schema_editor):
+    db = schema_editor.connection.alias
+    Paste = apps.get_model('app', 'Paste')
+    PasteBlob = apps.get_model('app', 'PasteBlob')
+    batch = []
+    for paste in Paste.objects.using(db).only('id', 'content').iterator(chunk_size=500):
+        content_hash = hashlib.sha256(paste.content.encode('utf-8')).hexdigest()
+        if not PasteBlob.objects.using(db).filter(hash=content_hash).exists():
+            raw = paste.content.encode('utf-8')
+            if len(raw) < 128:
+                codec, data = 'none', raw
+            else:
+                codec, data = 'zlib', zlib.compress(raw, 6)
+            PasteBlob.objects.using(db).create(hash=content_hash, codec=codec, data=data, length=len(paste.content))
+        paste.blob_id = content_hash
+        batch.append(paste)
+        if len(batch) >= 500:
+            Paste.objects.using(db).bulk_update(batch, ['blob'])
+            batch = []
+    if batch:
+        Paste.objects.using(db).bulk_update(batch, ['blob'])
+
+
+def move_blobs_to_content(apps, schema_editor):
+    db = schema_editor.connection.alias
+    Paste = apps.get_model('app', 'Paste')
+    for paste in Paste.objects.using(db).select_related('blob').iterator(chunk_size=500):
+        data = bytes(paste.blob.data)
+        if paste.blob.codec == 'zlib':
+            data = zlib.decompress(data)
+        elif paste.blob.codec == 'zstd':
+            import zstandard
+            data = zstandard.ZstdDecompressor().decompress(data)
+        paste.content = data.decode('utf-8')
+        paste.content_hash = paste.blob_id
+        paste.save(using=db, update_fields=['content', 'content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_paste_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PasteBlob',
+            fields=[
+                ('hash', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('codec', models.CharField(default='none', max_length=8)),
+                ('data', models.BinaryField()),
+                ('length', models.PositiveBigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='paste',
+            name='blob',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='pastes', to='app.pasteblob'),
+        ),
+        migrations.RunPython(move_content_to_blobs, move_blobs_to_content),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 6.0 on 2026-10-17 13:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # Separate from 0005 so the data copy is committed before the paste
+    # table is altered (Postgres refuses ALTER TABLE with pending
+    # deferred FK checks).
+
+    dependencies = [
+        ('app', '0005_pasteblob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='paste',
+            name='blob',
+            field=models.ForeignKey(editable=False, on_delete=django.db.models.deletion.PROTECT, related_name='pastes', to='app.pasteblob'),
+        ),
+        # Default lets the column be added back on unapply
+        migrations.AlterField(
+            model_name='paste',
+            name='content',
+            field=models.TextField(default=''),
+        ),
+        migrations.RemoveField(
+            model_name='paste',
+            name='content',
+        ),
+        migrations.RemoveField(
+            model_name='paste',
+            name='content_hash',
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 6.0 on 2026-10-17 16:02
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_paste_expires_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServiceStatus',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('service', models.CharField(max_length=50)),
+                ('status', models.CharField(choices=[('operational', 'Operational'), ('degraded', 'Degraded Performance'), ('partial', 'Partial Outage'), ('major', 'Major Outage')], default='operational', max_length=20)),
+                ('message', models.CharField(blank=True, default='', max_length=200)),
+                ('start_time', models.DateTimeField(default=django.utils.timezone.now)),
+                ('end_time', models.DateTimeField(blank=True, null=True)),
+                ('is_resolved', models.BooleanField(default=False)),
+            ],
+            options={
+                'verbose_name_plural': 'service statuses',
+                'indexes': [models.Index(fields=['service', 'is_resolved'], name='app_service_service_ee77a5_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='IncidentUpdate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('operational', 'Operational'), ('degraded', 'Degraded Performance'), ('partial', 'Partial Outage'), ('major', 'Major Outage')], max_length=20)),
+                ('message', models.CharField(max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('incident', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='updates', to='app.servicestatus')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UptimeLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('service', models.CharField(max_length=50)),
+                ('is_up', models.BooleanField()),
+                ('response_time', models.FloatField(help_text='milliseconds')),
+                ('checked_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['service', 'checked_at'], name='app_uptimel_service_9fb621_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 6.0 on 2026-10-17 17:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_uptime'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UptimeRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('service', models.CharField(max_length=50)),
+                ('period', models.CharField(choices=[('hour', 'Hourly'), ('day', 'Daily')], max_length=4)),
+                ('bucket_start', models.DateTimeField()),
+                ('checks', models.PositiveIntegerField(default=0)),
+                ('up_checks', models.PositiveIntegerField(default=0)),
+                ('p50', models.FloatField(default=0, help_text='milliseconds')),
+                ('p95', models.FloatField(default=0, help_text='milliseconds')),
+                ('p99', models.FloatField(default=0, help_text='milliseconds')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('period', 'service', 'bucket_start'), name='unique_uptime_rollup')],
+            },
+        ),
+    ]
@@ -0,0 +1,96 @@
+# Generated by Django 6.0 on 2026-10-17 20:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# The text parser drops anything that looks like an HTML tag, so <> are
+# blanked out first; otherwise `<vector>` or `<div>` could never match
+POSTGRES_FORWARD = [
+    """
+    ALTER TABLE app_pastesearch ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', translate(coalesce(title, ''), '<>', '  ')), 'A') ||
+        setweight(to_tsvector('simple', translate(body, '<>', '  ')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX app_pastesearch_vector_gin ON app_pastesearch USING gin (search_vector)",
+]
+
+# Only speeds up the ILIKE fallback, so skipped where pg_trgm isn't installed
+POSTGRES_TRIGRAM = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX app_pastesearch_body_trgm ON app_pastesearch USING gin (body gin_trgm_ops)",
+]
+
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS app_pastesearch_body_trgm",
+    "DROP INDEX IF EXISTS app_pastesearch_vector_gin",
+    "ALTER TABLE app_pastesearch DROP COLUMN IF EXISTS search_vector",
+]
+
+# External content FTS5 table over app_pastesearch, kept in sync by triggers
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE app_pastesearch_fts USING fts5(
+        title, body, content='app_pastesearch', content_rowid='rowid'
+    )
+    """,
+    """
+    CREATE TRIGGER app_pastesearch_ai AFTER INSERT ON app_pastesearch BEGIN
+        INSERT INTO app_pastesearch_fts(rowid, title, body) VALUES (new.rowid, new.title, new.body);
+    END
+    """,
+    """
+    CREATE TRIGGER app_pastesearch_ad AFTER DELETE ON app_pastesearch BEGIN
+        INSERT INTO app_pastesearch_fts(app_pastesearch_fts, rowid, title, body)
+        VALUES ('delete', old.rowid, old.title, old.body);
+    END
+    """,
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS app_pastesearch_ad",
+    "DROP TRIGGER IF EXISTS app_pastesearch_ai",
+    "DROP TABLE IF EXISTS app_pastesearch_fts",
+]
+
+
+def _run(schema_editor, statements):
+    for statement in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def _has_trigram(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+def create_search_index(apps, schema_editor):
+    _run(schema_editor, {'postgresql': POSTGRES_FORWARD, 'sqlite': SQLITE_FORWARD})
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql' and _has_trigram(connection):
+        _run(schema_editor, {'postgresql': POSTGRES_TRIGRAM})
+
+
+def drop_search_index(apps, schema_editor):
+    _run(schema_editor, {'postgresql': POSTGRES_BACKWARD, 'sqlite': SQLITE_BACKWARD})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_apitoken'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PasteSearch',
+            fields=[
+                ('paste', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search', serialize=False, to='app.paste')),
+                ('title', models.CharField(blank=True, default='', max_length=200)),
+                ('body', models.TextField()),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
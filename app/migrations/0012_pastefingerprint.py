@@ -0,0 +1,34 @@
+# Generated by Django 6.0 on 2026-10-17 21:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0011_pastesearch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PasteFingerprint',
+            fields=[
+                ('paste_id', models.CharField(max_length=10, primary_key=True, serialize=False)),
+                ('signature', models.BinaryField()),
+                ('similar_to', models.CharField(blank=True, default='', max_length=10)),
+                ('created_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PasteBand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.BigIntegerField()),
+                ('paste_id', models.CharField(db_index=True, max_length=10)),
+                ('created_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['key', 'created_at'], name='app_pasteband_key_created')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-17 22:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_pastefingerprint'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='paste',
+            name='id',
+            field=models.CharField(editable=False, max_length=10, primary_key=True, serialize=False),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 6.0 on 2026-10-17 23:30
+
+from django.db import migrations
+
+# PasteSearch.MAX_CHARS when this migration was written
+MAX_CHARS = 10_000
+
+
+def truncate_bodies(apps, schema_editor):
+    # The tsvector column is generated from body, so Postgres recomputes it
+    schema_editor.execute(
+        "UPDATE app_pastesearch SET body = substr(body, 1, %s) WHERE length(body) > %s",
+        [MAX_CHARS, MAX_CHARS],
+    )
+    if schema_editor.connection.vendor == 'sqlite':
+        # The FTS5 table has no update trigger, rebuild it from the bodies
+        schema_editor.execute("INSERT INTO app_pastesearch_fts(app_pastesearch_fts) VALUES ('rebuild')")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0014_ratelimitcounter'),
+    ]
+
+    operations = [
+        migrations.RunPython(truncate_bodies, migrations.RunPython.noop),
+    ]
@@ -1,13 +1,139 @@
-import random
-import string
-from django.db import models
+import hashlib
+import secrets
+import zlib
+from contextlib import closing
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Sum
 from django.utils import timezone
 from datetime import timedelta
 
-def generate_paste_id(length=8):
-    """Generate a random short ID like Pastebin"""
-    chars = string.ascii_lowercase + string.ascii_uppercase + string.digits
-    return ''.join(random.choice(chars) for _ in range(length))
+from . import blobstore, dedup, ids, pastefilter
+from .ids import generate_paste_id
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def hash_content(content):
+    """SHA-256 hex digest of paste content"""
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+class PasteBlob(models.Model):
+    """Compressed paste body, stored once per distinct content"""
+    CODEC_NONE = 'none'
+    CODEC_ZLIB = 'zlib'
+    CODEC_ZSTD = 'zstd'
+    # Stored uncompressed in the blob store, see blobstore.py
+    CODEC_EXTERNAL = 'external'
+    
+    # Bodies shorter than this are stored uncompressed
+    COMPRESS_MIN_SIZE = 128
+    
+    hash = models.CharField(primary_key=True, max_length=64)
+    codec = models.CharField(max_length=8, default=CODEC_NONE)
+    data = models.BinaryField()
+    length = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.hash[:12]} ({self.codec}, {self.length} chars)"
+    
+    @property
+    def is_external(self):
+        return self.codec == self.CODEC_EXTERNAL
+    
+    @classmethod
+    def encode(cls, content, content_hash):
+        """Get (codec, data) for content using the configured codec.
+        
+        Big bodies are written to the blob store instead and get no data.
+        """
+        raw = content.encode('utf-8')
+        if len(raw) >= settings.PASTE_BLOB_EXTERNAL_SIZE:
+            blobstore.get_store().put(content_hash, raw)
+            return cls.CODEC_EXTERNAL, b''
+        if len(raw) < cls.COMPRESS_MIN_SIZE:
+            return cls.CODEC_NONE, raw
+        if settings.PASTE_BLOB_CODEC == cls.CODEC_ZSTD and zstandard is not None:
+            return cls.CODEC_ZSTD, zstandard.ZstdCompressor(level=10).compress(raw)
+        return cls.CODEC_ZLIB, zlib.compress(raw, 6)
+    
+    @classmethod
+    def store(cls, content):
+        """Get the blob for content, creating it if this content is new"""
+        content_hash = hash_content(content)
+        blob = cls.objects.filter(hash=content_hash).defer('data').first()
+        if blob is None:
+            codec, data = cls.encode(content, content_hash)
+            blob, _ = cls.objects.get_or_create(hash=content_hash, defaults={
+                'codec': codec,
+                'data': data,
+                'length': len(content),
+            })
+        return blob
+    
+    @classmethod
+    def store_many(cls, contents):
+        """Make sure a blob exists for every content. Returns their hashes."""
+        by_hash = {hash_content(content): content for content in contents}
+        existing = set(cls.objects.filter(hash__in=by_hash).values_list('hash', flat=True))
+        new_blobs = []
+        for content_hash, content in by_hash.items():
+            if content_hash not in existing:
+                codec, data = cls.encode(content, content_hash)
+                new_blobs.append(cls(hash=content_hash, codec=codec, data=data, length=len(content)))
+        cls.objects.bulk_create(new_blobs, ignore_conflicts=True)
+        return [hash_content(content) for content in contents]
+    
+    @classmethod
+    def delete_orphans(cls, hashes):
+        """Delete the blobs in hashes that no paste uses any more"""
+        orphans = cls.objects.filter(hash__in=hashes, pastes__isnull=True)
+        external = list(orphans.filter(codec=cls.CODEC_EXTERNAL).values_list('hash', flat=True))
+        orphans.delete()
+        if external:
+            transaction.on_commit(lambda: cls._delete_files(external))
+    
+    @classmethod
+    def _delete_files(cls, hashes):
+        # Skip any that were stored again since
+        stored = set(cls.objects.filter(hash__in=hashes).values_list('hash', flat=True))
+        store = blobstore.get_store()
+        for content_hash in hashes:
+            if content_hash not in stored:
+                store.delete(content_hash)
+    
+    def open(self):
+        """Binary file object over an external blob's UTF-8 body"""
+        return blobstore.get_store().open(self.hash)
+    
+    def size(self):
+        """Size of an external blob's body in bytes"""
+        return blobstore.get_store().size(self.hash)
+    
+    def head(self, length):
+        """The first length characters, reading no more of an external body"""
+        if not self.is_external:
+            return self.text()[:length]
+        with closing(self.open()) as f:
+            # UTF-8 takes at most 4 bytes a character; a cut-off one is dropped
+            return f.read(length * 4).decode('utf-8', errors='ignore')[:length]
+    
+    def text(self):
+        if self.is_external:
+            with closing(self.open()) as f:
+                return f.read().decode('utf-8')
+        data = bytes(self.data)
+        if self.codec == self.CODEC_ZLIB:
+            data = zlib.decompress(data)
+        elif self.codec == self.CODEC_ZSTD:
+            data = zstandard.ZstdDecompressor().decompress(data)
+        return data.decode('utf-8')
 
 class Paste(models.Model):
     LANGUAGE_CHOICES = [
@@ -36,21 +162,62 @@ class Paste(models.Model):
         ('dockerfile', 'Dockerfile'),
     ]
     
-    # Short ID like Pastebin
+    # Short ID like Pastebin, allocated when the paste is first saved. Not a
+    # field default: that would take an ID (and maybe refill the pool with
+    # a query) for every unsaved Paste, such as the one behind each form.
     id = models.CharField(
         primary_key=True,
         max_length=10,
-        default=generate_paste_id,
         editable=False
     )
     
     title = models.CharField(max_length=200, blank=True, default='')
-    content = models.TextField()
+    # Body lives in a deduplicated PasteBlob, see the content property
+    blob = models.ForeignKey(PasteBlob, on_delete=models.PROTECT, related_name='pastes', editable=False)
     language = models.CharField(max_length=20, choices=LANGUAGE_CHOICES, default='plaintext')
     created_at = models.DateTimeField(auto_now_add=True)
     expires_at = models.DateTimeField()
     views = models.PositiveIntegerField(default=0)
     
+    class Meta:
+        # Built concurrently on Postgres, see migration 0007
+        indexes = [models.Index(fields=['expires_at'], name='app_paste_expires_at_idx')]
+    
+    # Characters of the body shown in link previews
+    EXCERPT_LENGTH = 200
+    
+    _content = None
+    _content_changed = False
+    
+    @property
+    def content(self):
+        if self._content is None:
+            self._content = self.blob.text() if self.blob_id else ''
+        return self._content
+    
+    @property
+    def length(self):
+        """Length of the body in characters, without reading it from the blob"""
+        if self._content is not None or not self.blob_id:
+            return len(self.content)
+        return self.blob.length
+    
+    @property
+    def excerpt(self):
+        """Start of the body, without reading all of an external one"""
+        if self._content is not None or not self.blob_id:
+            return self.content[:self.EXCERPT_LENGTH]
+        return self.blob.head(self.EXCERPT_LENGTH)
+    
+    @content.setter
+    def content(self, value):
+        self._content = value
+        self._content_changed = True
+    
+    @property
+    def content_hash(self):
+        return self.blob_id
+    
     def save(self, *args, **kwargs):
         # Ensure we have an ID
         if not self.id:
@@ -60,7 +227,86 @@ class Paste(models.Model):
         if not self.expires_at:
             self.expires_at = timezone.now() + timedelta(days=90)
         
-        super().save(*args, **kwargs)
+        # Store the body in its blob, reusing an existing one for duplicates
+        if self._content_changed:
+            if not self.blob_id or hash_content(self._content) != self.blob_id:
+                self.blob = PasteBlob.store(self._content)
+            self._content_changed = False
+        
+        if self._state.adding:
+            self._insert(*args, **kwargs)
+            SiteStats.record_created(len(self.content), active=int(not self.is_expired()))
+            PasteSearch.index([self])
+            dedup.index([self])
+            pastefilter.record_created([self.id])
+        else:
+            super().save(*args, **kwargs)
+    
+    def _insert(self, *args, **kwargs):
+        """INSERT the paste, picking a new ID if ours is already taken"""
+        kwargs['force_insert'] = True
+        for attempt in range(ids.MAX_ATTEMPTS):
+            try:
+                with transaction.atomic():
+                    super().save(*args, **kwargs)
+            except IntegrityError:
+                taken = Paste.objects.filter(pk=self.id).exists()
+                if not taken or attempt == ids.MAX_ATTEMPTS - 1:
+                    raise
+                self.id = generate_paste_id()
+            else:
+                ids.record_insert(collisions=attempt)
+                return
+    
+    @classmethod
+    def bulk_insert(cls, pastes, imported=False):
+        """INSERT many new pastes at once, in a single transaction.
+
+        Does what save() does for each paste, with one query per step
+        instead of one per paste. Imported pastes weren't just created, so
+        they get no near-duplicate fingerprints or paste filter markers.
+        """
+        if not pastes:
+            return pastes
+        blob_ids = PasteBlob.store_many([paste.content for paste in pastes])
+        expires_at = timezone.now() + timedelta(days=90)
+        for paste, blob_id in zip(pastes, blob_ids):
+            paste.blob_id = blob_id
+            paste._content_changed = False
+            paste.expires_at = paste.expires_at or expires_at
+        
+        for paste in pastes:
+            paste.id = paste.id or generate_paste_id()
+        
+        collisions = 0
+        for attempt in range(ids.MAX_ATTEMPTS):
+            taken = set(cls.objects.filter(pk__in=[paste.id for paste in pastes]).values_list('pk', flat=True))
+            seen = set()
+            for paste in pastes:
+                while paste.id in taken or paste.id in seen:
+                    paste.id = generate_paste_id()
+                    collisions += 1
+                seen.add(paste.id)
+            try:
+                with transaction.atomic():
+                    cls.objects.bulk_create(pastes)
+                break
+            except IntegrityError:
+                # Lost a race for an ID we had just checked, try again
+                if attempt == ids.MAX_ATTEMPTS - 1:
+                    raise
+        
+        ids.record_insert(collisions=collisions, count=len(pastes))
+        now = timezone.now()
+        SiteStats.record_created(
+            sum(len(paste.content) for paste in pastes), count=len(pastes),
+            active=sum(paste.expires_at > now for paste in pastes),
+        )
+        PasteSearch.index(pastes)
+        if not imported:
+            dedup.index(pastes)
+            pastefilter.record_created([paste.id for paste in pastes])
+        return pastes
     
     def is_expired(self):
         return timezone.now() > self.expires_at
@@ -76,12 +322,291 @@ class Paste(models.Model):
     @classmethod
     def get_total_characters(cls):
         """Get total characters shared across all pastes"""
-        total = 0
-        for paste in cls.objects.all():
-            total += len(paste.content)
-        return total
+        return cls.objects.aggregate(total=Sum('blob__length'))['total'] or 0
     
     @classmethod  
     def get_active_pastes(cls):
         """Get non-expired pastes"""
         return cls.objects.filter(expires_at__gt=timezone.now()).count()
+
+
+class PasteSearch(models.Model):
+    """Searchable copy of a paste's text, see search.py.
+
+    The full-text index itself is database specific and created by
+    migration 0011: a generated tsvector column with GIN and trigram
+    indexes on Postgres, an FTS5 table kept in sync by triggers on SQLite.
+    """
+    # Only this much of each paste is indexed; the body is a second copy of
+    # it, so it's kept to a prefix (see migration 0015)
+    MAX_CHARS = 10_000
+    
+    paste = models.OneToOneField(Paste, primary_key=True, on_delete=models.CASCADE, related_name='search')
+    title = models.CharField(max_length=200, blank=True, default='')
+    body = models.TextField()
+    expires_at = models.DateTimeField(db_index=True)
+    
+    def __str__(self):
+        return f"search entry for {self.paste_id}"
+    
+    @classmethod
+    def index(cls, pastes):
+        """Add new pastes to the search index"""
+        cls.objects.bulk_create([
+            cls(
+                paste_id=paste.id,
+                title=paste.title,
+                body=paste.content[:cls.MAX_CHARS],
+                expires_at=paste.expires_at,
+            )
+            for paste in pastes
+        ], ignore_conflicts=True)
+
+
+class PasteFingerprint(models.Model):
+    """MinHash signature of a recent paste, see dedup.py.
+
+    Not a foreign key, so fingerprints can outlive their paste until they
+    leave the DEDUP_WINDOW and are pruned.
+    """
+    paste_id = models.CharField(primary_key=True, max_length=10)
+    signature = models.BinaryField()
+    # The most similar recent paste when this one was created, if any
+    similar_to = models.CharField(max_length=10, blank=True, default='')
+    created_at = models.DateTimeField(db_index=True)
+    
+    def __str__(self):
+        return f"fingerprint of {self.paste_id}"
+
+
+class PasteBand(models.Model):
+    """One hashed LSH band of a fingerprint; pastes sharing a key are candidates"""
+    key = models.BigIntegerField()
+    paste_id = models.CharField(max_length=10, db_index=True)
+    created_at = models.DateTimeField()
+    
+    class Meta:
+        indexes = [models.Index(fields=['key', 'created_at'], name='app_pasteband_key_created')]
+    
+    def __str__(self):
+        return f"band {self.key} of {self.paste_id}"
+
+
+class ApiToken(models.Model):
+    """Token for the JSON API; only a hash of the token is stored"""
+    name = models.CharField(max_length=100)
+    key_hash = models.CharField(max_length=64, unique=True, editable=False)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return self.name
+    
+    @classmethod
+    def create_token(cls, name):
+        """Create a token. Returns (token, key); the key is only shown once."""
+        key = secrets.token_urlsafe(32)
+        return cls.objects.create(name=name, key_hash=hash_content(key)), key
+    
+    @classmethod
+    def authenticate(cls, key):
+        """Get the active token for key, or None"""
+        return cls.objects.filter(key_hash=hash_content(key), is_active=True).first()
+
+
+class RateLimitCounter(models.Model):
+    """Requests in one slot of a rate limit window, see ratelimit.py.
+
+    Only used without Redis. Rows are bumped with a single UPDATE and
+    pruned by the reaper once they leave their window.
+    """
+    # Policy name and client key
+    bucket = models.CharField(max_length=200)
+    slot = models.BigIntegerField()
+    count = models.IntegerField(default=0)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['bucket', 'slot'], name='unique_rate_limit_slot'),
+        ]
+    
+    def __str__(self):
+        return f"{self.bucket} slot {self.slot}: {self.count}"
+    
+    @classmethod
+    def prune(cls, now=None):
+        """Delete counters whose window has passed. Returns how many."""
+        deleted, _ = cls.objects.filter(expires_at__lte=now or timezone.now()).delete()
+        return deleted
+
+
+class SiteStats(models.Model):
+    """Single-row counters behind the home page stats.
+
+    Kept up to date on paste create and expiry so the home page never has
+    to scan the paste table. Run ``manage.py rebuild_stats`` to recount.
+    total_pastes and total_characters count every paste ever created, so
+    they never go down when the reaper deletes expired ones.
+    """
+    CACHE_KEY = 'site_stats'
+    CACHE_TIMEOUT = 30
+    
+    total_pastes = models.PositiveBigIntegerField(default=0)
+    total_characters = models.PositiveBigIntegerField(default=0)
+    active_pastes = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name_plural = 'site stats'
+    
+    def __str__(self):
+        return f"{self.total_pastes} pastes, {self.total_characters} chars"
+    
+    @classmethod
+    def _bump(cls, **deltas):
+        updates = {name: F(name) + delta for name, delta in deltas.items()}
+        if not cls.objects.filter(pk=1).update(updated_at=timezone.now(), **updates):
+            # Counter row is missing (fresh database), recount from scratch
+            cls.rebuild()
+    
+    @classmethod
+    def record_created(cls, characters, count=1, active=None):
+        """Count newly created pastes, `active` of them not yet expired (default all)"""
+        active = count if active is None else active
+        cls._bump(total_pastes=count, total_characters=characters, active_pastes=active)
+    
+    @classmethod
+    def record_removed(cls, characters, count=1, active=None):
+        """Take back record_created() for pastes that shouldn't have counted"""
+        active = count if active is None else active
+        cls._bump(total_pastes=-count, total_characters=-characters, active_pastes=-active)
+    
+    @classmethod
+    def record_expired(cls):
+        """Recount active pastes after some have expired (index-only count)"""
+        if not cls.objects.filter(pk=1).update(
+            active_pastes=Paste.get_active_pastes(), updated_at=timezone.now()
+        ):
+            cls.rebuild()
+    
+    @classmethod
+    def rebuild(cls, keep_totals=True):
+        """Recount everything from the paste table.
+
+        The table no longer has reaped pastes, so the lifetime totals only
+        go up unless keep_totals is False.
+        """
+        totals = {
+            'total_pastes': Paste.get_total_pastes(),
+            'total_characters': Paste.get_total_characters(),
+        }
+        current = cls.objects.filter(pk=1).values('total_pastes', 'total_characters').first()
+        if keep_totals and current:
+            totals = {name: max(value, current[name]) for name, value in totals.items()}
+        stats, _ = cls.objects.update_or_create(pk=1, defaults={
+            **totals,
+            'active_pastes': Paste.get_active_pastes(),
+        })
+        cache.delete(cls.CACHE_KEY)
+        return stats
+    
+    @classmethod
+    def get_cached(cls):
+        """Get the current counters as a dict, served from cache"""
+        data = cache.get(cls.CACHE_KEY)
+        if data is None:
+            stats = cls.objects.filter(pk=1).first() or cls.rebuild()
+            data = {
+                'total_pastes': stats.total_pastes,
+                'total_characters': stats.total_characters,
+                'active_pastes': max(stats.active_pastes, 0),
+            }
+            cache.set(cls.CACHE_KEY, data, timeout=cls.CACHE_TIMEOUT)
+        return data
+    
+    @classmethod
+    async def aget_cached(cls):
+        """Async get_cached()"""
+        data = await cache.aget(cls.CACHE_KEY)
+        if data is None:
+            data = await sync_to_async(cls.get_cached)()
+        return data
+
+
+class UptimeLog(models.Model):
+    """One uptime check of one service"""
+    service = models.CharField(max_length=50)
+    is_up = models.BooleanField()
+    response_time = models.FloatField(help_text="milliseconds")
+    checked_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        indexes = [models.Index(fields=['service', 'checked_at'])]
+    
+    def __str__(self):
+        return f"{self.service} {'up' if self.is_up else 'down'} at {self.checked_at}"
+
+
+class ServiceStatus(models.Model):
+    """An incident affecting a service, open until is_resolved"""
+    STATUS_CHOICES = [
+        ('operational', 'Operational'),
+        ('degraded', 'Degraded Performance'),
+        ('partial', 'Partial Outage'),
+        ('major', 'Major Outage'),
+    ]
+    
+    service = models.CharField(max_length=50)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='operational')
+    message = models.CharField(max_length=200, blank=True, default='')
+    start_time = models.DateTimeField(default=timezone.now)
+    end_time = models.DateTimeField(null=True, blank=True)
+    is_resolved = models.BooleanField(default=False)
+    
+    class Meta:
+        verbose_name_plural = 'service statuses'
+        indexes = [models.Index(fields=['service', 'is_resolved'])]
+    
+    def __str__(self):
+        return f"{self.service}: {self.status}"
+
+
+class IncidentUpdate(models.Model):
+    """Timeline entry on an incident"""
+    incident = models.ForeignKey(ServiceStatus, on_delete=models.CASCADE, related_name='updates')
+    status = models.CharField(max_length=20, choices=ServiceStatus.STATUS_CHOICES)
+    message = models.CharField(max_length=200)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.incident.service} {self.status}: {self.message}"
+
+
+class UptimeRollup(models.Model):
+    """Uptime checks of one service aggregated over an hour or a day"""
+    PERIOD_CHOICES = [
+        ('hour', 'Hourly'),
+        ('day', 'Daily'),
+    ]
+    
+    service = models.CharField(max_length=50)
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    bucket_start = models.DateTimeField()
+    checks = models.PositiveIntegerField(default=0)
+    up_checks = models.PositiveIntegerField(default=0)
+    p50 = models.FloatField(default=0, help_text="milliseconds")
+    p95 = models.FloatField(default=0, help_text="milliseconds")
+    p99 = models.FloatField(default=0, help_text="milliseconds")
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'service', 'bucket_start'], name='unique_uptime_rollup'),
+        ]
+    
+    def __str__(self):
+        return f"{self.service} {self.period} {self.bucket_start}: {self.availability:.2f}%"
+    
+    @property
+    def availability(self):
+        return (self.up_checks / self.checks) * 100 if self.checks else 100.0
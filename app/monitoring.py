@@ -1,109 +1,120 @@
-# monitoring.py - Run this as a background task (cron every 1 minute)
-import requests
+# monitoring.py - Run with `python manage.py monitor_uptime`
+"""
+Uptime probing.
+
+All services are probed concurrently on one keep-alive connection pool,
+each with its own timeout and a little start jitter, so one hung service
+no longer delays the others. A tick's results are written with one bulk
+insert, and open incidents are looked up in one query.
+"""
+import asyncio
+import random
 import time
-from django.utils import timezone
+
+import httpx
+from django.conf import settings
 from django.db import transaction
-from .models import UptimeLog, ServiceStatus
+from django.utils import timezone
+
+from .models import IncidentUpdate, ServiceStatus, UptimeLog
+
 
-def check_service(url, service_name, timeout=10):
-    """Check if a service is up and log the result"""
-    start_time = time.time()
+def make_client():
+    """Shared client for all probes; reuse it across ticks"""
+    return httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=20, max_keepalive_connections=20),
+        follow_redirects=False,
+    )
+
+
+async def probe(client, service_name, url, timeout, jitter=0.0):
+    """Check one service. Returns (service_name, is_up, response_time_ms)"""
+    if jitter:
+        await asyncio.sleep(random.uniform(0, jitter))
+    start_time = time.monotonic()
     try:
-        response = requests.get(url, timeout=timeout)
-        response_time = (time.time() - start_time) * 1000  # Convert to ms
+        response = await asyncio.wait_for(client.get(url, timeout=timeout), timeout)
         is_up = response.status_code == 200
-        
-        # Log the check
-        UptimeLog.objects.create(
-            service=service_name,
-            is_up=is_up,
-            response_time=response_time
-        )
-        
-        # Check if we need to create/update an incident
-        if not is_up:
-            create_incident_if_needed(service_name)
-        else:
-            resolve_incident_if_up(service_name)
-            
-        return is_up, response_time
-        
-    except requests.RequestException as e:
-        response_time = (time.time() - start_time) * 1000
-        
-        UptimeLog.objects.create(
-            service=service_name,
-            is_up=False,
-            response_time=response_time
-        )
-        
-        create_incident_if_needed(service_name)
-        return False, response_time
-
-def create_incident_if_needed(service_name):
-    """Create an incident if service is down and no active incident exists"""
-    with transaction.atomic():
-        # Check for existing unresolved incident
-        existing = ServiceStatus.objects.filter(
-            service=service_name,
-            is_resolved=False
-        ).first()
-        
-        if not existing:
-            ServiceStatus.objects.create(
-                service=service_name,
-                status='major',
-                message=f'{service_name} is not responding',
-                start_time=timezone.now()
-            )
-
-def resolve_incident_if_up(service_name):
-    """Mark incident as resolved if service is back up"""
+    except (httpx.HTTPError, asyncio.TimeoutError):
+        is_up = False
+    response_time = (time.monotonic() - start_time) * 1000  # Convert to ms
+    return service_name, is_up, response_time
+
+
+async def probe_all(client, services, timeout, jitter=0.0):
+    """Check all services concurrently"""
+    return await asyncio.gather(*(
+        probe(client, name, url, timeout, jitter) for name, url in services.items()
+    ))
+
+
+def record_results(results):
+    """Log a tick's results and open or resolve incidents"""
+    now = timezone.now()
     with transaction.atomic():
-        incident = ServiceStatus.objects.filter(
-            service=service_name,
-            is_resolved=False
-        ).first()
-        
-        if incident:
-            incident.is_resolved = True
-            incident.end_time = timezone.now()
-            incident.status = 'operational'
-            incident.save()
-            
-            # Add resolution update
-            IncidentUpdate.objects.create(
-                incident=incident,
-                status='operational',
-                message=f'{service_name} is back online'
-            )
-
-def check_all_services():
-    """Check all skibin.lol services"""
-    services_to_check = {
-        'web': 'https://skibin.lol/',
-        'api': 'https://skibin.lol/api/health',  # You'll need to create this
-        'db': 'https://skibin.lol/api/db-health',  # You'll need to create this
-    }
-    
-    results = {}
-    for service_name, url in services_to_check.items():
-        is_up, response_time = check_service(url, service_name)
-        results[service_name] = {
-            'is_up': is_up,
-            'response_time': response_time
+        UptimeLog.objects.bulk_create([
+            UptimeLog(service=name, is_up=is_up, response_time=response_time, checked_at=now)
+            for name, is_up, response_time in results
+        ])
+
+        names = [name for name, _, _ in results] + ['all']
+        open_incidents = {
+            incident.service: incident
+            for incident in ServiceStatus.objects.filter(service__in=names, is_resolved=False)
         }
-    
-    # Check overall status
-    all_up = all(result['is_up'] for result in results.values())
-    if not all_up and not ServiceStatus.objects.filter(service='all', is_resolved=False).exists():
-        ServiceStatus.objects.create(
-            service='all',
-            status='partial',
-            message='Some services are experiencing issues',
-            start_time=timezone.now()
-        )
-    
-    return results
-
-# For cron: python manage.py shell -c "from your_app.monitoring import check_all_services; check_all_services()"
+
+        new_incidents = []
+        resolved = []
+        for name, is_up, _ in results:
+            incident = open_incidents.get(name)
+            if not is_up and incident is None:
+                new_incidents.append(ServiceStatus(
+                    service=name,
+                    status='major',
+                    message=f'{name} is not responding',
+                    start_time=now,
+                ))
+            elif is_up and incident is not None:
+                incident.is_resolved = True
+                incident.end_time = now
+                incident.status = 'operational'
+                resolved.append(incident)
+
+        # Check overall status
+        all_up = all(is_up for _, is_up, _ in results)
+        if not all_up and 'all' not in open_incidents:
+            new_incidents.append(ServiceStatus(
+                service='all',
+                status='partial',
+                message='Some services are experiencing issues',
+                start_time=now,
+            ))
+
+        ServiceStatus.objects.bulk_create(new_incidents)
+        if resolved:
+            ServiceStatus.objects.bulk_update(resolved, ['is_resolved', 'end_time', 'status'])
+            # Add resolution updates
+            IncidentUpdate.objects.bulk_create([
+                IncidentUpdate(
+                    incident=incident,
+                    status='operational',
+                    message=f'{incident.service} is back online',
+                )
+                for incident in resolved
+            ])
+
+    return {
+        name: {'is_up': is_up, 'response_time': response_time}
+        for name, is_up, response_time in results
+    }
+
+
+def check_all_services(services=None):
+    """Check all skibin.lol services once"""
+    services = services or settings.UPTIME_SERVICES
+
+    async def run():
+        async with make_client() as client:
+            return await probe_all(client, services, settings.UPTIME_TIMEOUT)
+
+    return record_results(asyncio.run(run()))
@@ -0,0 +1,89 @@
+"""
+Page and fragment caching.
+
+Static pages (pricing, terms, contact, advtest) are cached as whole
+responses by @cached_page. The home page is a cached shell with its stats
+fragment spliced in; the fragment has a short TTL and is served stale
+while a single request rebuilds it.
+
+Every key contains version(), which changes on deploy, so old pages are
+never served by new code. It is PAGE_CACHE_VERSION when set, otherwise a
+hash of the templates and the static files manifest.
+"""
+import hashlib
+import time
+from functools import lru_cache, wraps
+from pathlib import Path
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.template.utils import get_app_template_dirs
+
+
+@lru_cache(maxsize=None)
+def _deploy_digest():
+    digest = hashlib.sha256()
+    dirs = [Path(d) for engine in settings.TEMPLATES for d in engine.get('DIRS', [])]
+    dirs += [Path(d) for d in get_app_template_dirs('templates')]
+    files = sorted(path for d in dirs if d.is_dir() for path in d.rglob('*') if path.is_file())
+    if settings.STATIC_ROOT:
+        files.append(Path(settings.STATIC_ROOT) / 'staticfiles.json')
+    for path in files:
+        if path.is_file():
+            digest.update(str(path).encode())
+            digest.update(path.read_bytes())
+    return digest.hexdigest()[:12]
+
+
+def version():
+    return settings.PAGE_CACHE_VERSION or _deploy_digest()
+
+
+def _key(name):
+    return f"page_{version()}_{name}"
+
+
+def cached_page(name):
+    """Serve a view's GET responses from the cache once it has rendered a 200"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            key = _key(name)
+            cached = cache.get(key)
+            if cached is not None:
+                content, content_type = cached
+                return HttpResponse(content, content_type=content_type)
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming:
+                cache.set(key, (response.content, response['Content-Type']), settings.PAGE_CACHE_TIMEOUT)
+            return response
+        return wrapper
+    return decorator
+
+
+async def aget_fragment(name, build, timeout, stale=0):
+    """Get a cached fragment, calling build() (sync) to make it.
+
+    Fragments older than `timeout` seconds are served for up to `stale`
+    more seconds while the one request that takes the refresh lock
+    rebuilds them.
+    """
+    key = _key(name)
+    entry = await cache.aget(key)
+    now = time.time()
+    if entry is not None:
+        value, fresh_until = entry
+        if now < fresh_until:
+            return value
+        if not await cache.aadd(f"{key}_refresh", 1, timeout=max(stale, 1)):
+            return value
+
+    value = await sync_to_async(build)()
+    await cache.aset(key, (value, now + timeout), timeout=timeout + stale)
+    if entry is not None:
+        await cache.adelete(f"{key}_refresh")
+    return value
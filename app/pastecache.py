@@ -0,0 +1,186 @@
+"""
+Read-through cache for pastes.
+
+Paste content never changes after creation, so view/raw/clone look pastes
+up here instead of hitting the database. Lookups go through a small
+per-process LRU first, then the shared Django cache, then the database.
+Entries never outlive the paste's expires_at. IDs that miss the LRU
+and that the paste filter (pastefilter.py) rules out are 404s without
+going any further.
+
+Bodies kept in the blob store are not cached; the entry only says where
+they are, and they are read from the store when needed.
+
+The cached `views` value is only as fresh as the entry; view counts are
+buffered separately (see viewcounts.py) anyway.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404
+from django.utils import timezone
+
+from . import dbrouter, metrics, pastefilter
+from .models import Paste, PasteBlob
+
+FIELDS = (
+    'id', 'title', 'language', 'created_at', 'expires_at', 'views', 'blob_id',
+)
+
+_local = OrderedDict()
+_lock = threading.Lock()
+_counters = {'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'filtered': 0}
+
+
+def _cache_key(paste_id):
+    # v2: entries carry the blob codec and leave out external bodies
+    return f"paste_v2_{paste_id}"
+
+
+def _count(name):
+    with _lock:
+        _counters[name] += 1
+    metrics.record_cache({'misses': 'miss', 'filtered': 'filtered'}.get(name, 'hit'))
+
+
+def _serialize(paste):
+    data = {name: getattr(paste, name) for name in FIELDS}
+    data['codec'] = paste.blob.codec
+    data['length'] = paste.blob.length
+    if not paste.blob.is_external:
+        data['content'] = paste.content
+    return data
+
+
+def _deserialize(data):
+    fields = {name: value for name, value in data.items() if name not in ('codec', 'length')}
+    # Assigning the blob asks the router for a write database; nothing is written
+    with dbrouter.unpinned():
+        paste = Paste(**fields)
+        # The blob without its data, enough to find an external body
+        paste.blob = PasteBlob(hash=data['blob_id'], codec=data['codec'], length=data['length'])
+    paste._content_changed = False
+    paste._state.adding = False
+    paste._state.db = 'default'
+    return paste
+
+
+def _seconds_left(data):
+    return (data['expires_at'] - timezone.now()).total_seconds()
+
+
+def _local_get(paste_id):
+    with _lock:
+        entry = _local.get(paste_id)
+        if entry is None:
+            return None
+        data, deadline = entry
+        if deadline < time.monotonic():
+            del _local[paste_id]
+            return None
+        _local.move_to_end(paste_id)
+        return data
+
+
+def _local_set(paste_id, data):
+    ttl = min(settings.PASTE_CACHE_LOCAL_TIMEOUT, _seconds_left(data))
+    if ttl <= 0:
+        return
+    with _lock:
+        _local[paste_id] = (data, time.monotonic() + ttl)
+        _local.move_to_end(paste_id)
+        while len(_local) > settings.PASTE_CACHE_LOCAL_SIZE:
+            _local.popitem(last=False)
+
+
+def _shared_timeout(data):
+    """Seconds to keep data in the shared cache, or None to skip it"""
+    ttl = min(settings.PASTE_CACHE_TIMEOUT, _seconds_left(data))
+    return int(ttl) or 1 if ttl > 0 else None
+
+
+def get_paste(paste_id):
+    """Get a paste by ID or raise Http404"""
+    data = _local_get(paste_id)
+    if data is not None:
+        _count('local_hits')
+        return _deserialize(data)
+
+    if not pastefilter.might_exist(paste_id):
+        _count('filtered')
+        raise Http404("Paste not found")
+
+    data = cache.get(_cache_key(paste_id))
+    if data is not None:
+        _count('shared_hits')
+    else:
+        _count('misses')
+        try:
+            paste = Paste.objects.select_related('blob').get(id=paste_id)
+        except Paste.DoesNotExist:
+            raise Http404("Paste not found")
+        data = _serialize(paste)
+        timeout = _shared_timeout(data)
+        if timeout:
+            cache.set(_cache_key(paste_id), data, timeout=timeout)
+
+    _local_set(paste_id, data)
+    return _deserialize(data)
+
+
+async def aget_paste(paste_id):
+    """Async get_paste(), using the async cache and ORM APIs"""
+    data = _local_get(paste_id)
+    if data is not None:
+        _count('local_hits')
+        return _deserialize(data)
+
+    if not await pastefilter.amight_exist(paste_id):
+        _count('filtered')
+        raise Http404("Paste not found")
+
+    data = await cache.aget(_cache_key(paste_id))
+    if data is not None:
+        _count('shared_hits')
+    else:
+        _count('misses')
+        try:
+            paste = await Paste.objects.select_related('blob').aget(id=paste_id)
+        except Paste.DoesNotExist:
+            raise Http404("Paste not found")
+        data = _serialize(paste)
+        timeout = _shared_timeout(data)
+        if timeout:
+            await cache.aset(_cache_key(paste_id), data, timeout=timeout)
+
+    _local_set(paste_id, data)
+    return _deserialize(data)
+
+
+def invalidate(paste_id):
+    """Drop a paste from this process and the shared cache"""
+    with _lock:
+        _local.pop(paste_id, None)
+    cache.delete(_cache_key(paste_id))
+
+
+def clear_local():
+    with _lock:
+        _local.clear()
+        for name in _counters:
+            _counters[name] = 0
+
+
+def stats():
+    """Hit/miss counters for this process"""
+    with _lock:
+        counters = dict(_counters)
+        counters['local_size'] = len(_local)
+    # Filtered lookups are turned away, not missed, so they stay out of the ratio
+    lookups = counters['local_hits'] + counters['shared_hits'] + counters['misses']
+    hits = counters['local_hits'] + counters['shared_hits']
+    counters['hit_ratio'] = hits / lookups if lookups else 0.0
+    return counters
@@ -0,0 +1,192 @@
+"""
+Bloom filter of live paste IDs, to turn away lookups of IDs that don't exist.
+
+Scrapers request random /p/<id>/ URLs, and each of those would otherwise
+miss the caches and cost a primary key lookup. `manage.py
+rebuild_paste_filter` builds a filter of every live paste ID, sized for
+PASTE_FILTER_ERROR_RATE false positives, and puts it in the shared cache.
+Each worker loads it, checks every PASTE_FILTER_CHECK_INTERVAL seconds
+whether a newer one was built, and answers IDs the filter doesn't have
+with a 404 before touching the database.
+
+A paste created after a build isn't in the shared filter, so creating one
+adds it to the creating worker's copy and leaves a marker for it in the
+cache that lasts as long as a filter is trusted: PASTE_FILTER_MAX_AGE
+seconds from the start of its build. IDs the filter doesn't have are
+looked up there, which is still one cache round trip instead of a query.
+A filter older than that (the rebuild stopped running) is ignored.
+
+Bloom filters can't delete, so expired pastes stay in until the next
+rebuild; their lookups go to the database as before.
+"""
+import hashlib
+import math
+import threading
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+FILTER_KEY = 'paste_filter'
+BUILT_AT_KEY = 'paste_filter_built_at'
+
+# Room for at least this many IDs, so a young site doesn't rebuild a tiny
+# filter that is full after the next few pastes
+MIN_CAPACITY = 10_000
+
+# Marker lifetime past PASTE_FILTER_MAX_AGE, for pastes whose transaction
+# committed after a build had already read the table
+MARKER_MARGIN = 60
+
+
+class BloomFilter:
+    """Set membership with no false negatives, in `size` bits"""
+
+    def __init__(self, size, hashes, bits=None):
+        self.size = size
+        self.hashes = hashes
+        self.bits = bits if bits is not None else bytearray((size + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity, error_rate):
+        """A filter that holds capacity items with about error_rate false positives"""
+        size = max(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        hashes = max(round(size / capacity * math.log(2)), 1)
+        return cls(size, hashes)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def to_dict(self):
+        return {'size': self.size, 'hashes': self.hashes, 'bits': bytes(self.bits)}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['size'], data['hashes'], bytearray(data['bits']))
+
+
+def _marker_key(paste_id):
+    return f"paste_new_{paste_id}"
+
+
+def _timeout():
+    return settings.PASTE_FILTER_MAX_AGE + MARKER_MARGIN
+
+
+class _Loaded:
+    """This process's copy of the shared filter"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.filter = None
+        self.built_at = None
+        self.checked = -math.inf
+
+    def due(self):
+        return time.monotonic() - self.checked >= settings.PASTE_FILTER_CHECK_INTERVAL
+
+    def update(self, built_at, fetch):
+        """Swap in the shared filter if it changed; fetch() returns its data"""
+        with self.lock:
+            self.checked = time.monotonic()
+            if built_at == self.built_at:
+                return
+            data = fetch() if built_at is not None else None
+            if data is None or data['built_at'] != built_at:
+                self.filter, self.built_at = None, None
+            else:
+                self.filter, self.built_at = BloomFilter.from_dict(data), built_at
+
+    def lacks(self, paste_id):
+        """True if the paste definitely isn't in the filter"""
+        with self.lock:
+            if self.filter is None or time.time() - self.built_at > settings.PASTE_FILTER_MAX_AGE:
+                return False
+            return paste_id not in self.filter
+
+    def add(self, paste_ids):
+        with self.lock:
+            if self.filter is not None:
+                for paste_id in paste_ids:
+                    self.filter.add(paste_id)
+
+
+_loaded = _Loaded()
+
+
+def might_exist(paste_id):
+    """False only if there's certainly no paste with this ID"""
+    if not settings.PASTE_FILTER_MAX_AGE:
+        return True
+    if _loaded.due():
+        _loaded.update(cache.get(BUILT_AT_KEY), lambda: cache.get(FILTER_KEY))
+    if not _loaded.lacks(paste_id):
+        return True
+    return cache.get(_marker_key(paste_id)) is not None
+
+
+async def amight_exist(paste_id):
+    """Async might_exist()"""
+    if not settings.PASTE_FILTER_MAX_AGE:
+        return True
+    if _loaded.due():
+        built_at = await cache.aget(BUILT_AT_KEY)
+        data = await cache.aget(FILTER_KEY) if built_at not in (None, _loaded.built_at) else None
+        _loaded.update(built_at, lambda: data)
+    if not _loaded.lacks(paste_id):
+        return True
+    return await cache.aget(_marker_key(paste_id)) is not None
+
+
+def record_created(paste_ids):
+    """Make new pastes findable until a filter built after them is loaded"""
+    if not settings.PASTE_FILTER_MAX_AGE:
+        return
+    cache.set_many({_marker_key(paste_id): 1 for paste_id in paste_ids}, timeout=_timeout())
+    _loaded.add(paste_ids)
+
+
+def build(error_rate=None, chunk_size=10_000):
+    """Build a filter of live paste IDs and share it. Returns (filter, count, seconds)."""
+    Paste = apps.get_model('app', 'Paste')
+    started = time.monotonic()
+    built_at = time.time()
+    now = timezone.now()
+    live = Paste.objects.filter(expires_at__gt=now)
+    count = live.count()
+    bloom = BloomFilter.for_capacity(max(count, MIN_CAPACITY), error_rate or settings.PASTE_FILTER_ERROR_RATE)
+    count = 0
+    for paste_id in live.values_list('pk', flat=True).iterator(chunk_size=chunk_size):
+        bloom.add(paste_id)
+        count += 1
+
+    timeout = _timeout()
+    cache.set(FILTER_KEY, {**bloom.to_dict(), 'built_at': built_at}, timeout=timeout)
+    cache.set(BUILT_AT_KEY, built_at, timeout=timeout)
+    return bloom, count, time.monotonic() - started
+
+
+def drop():
+    """Stop filtering lookups until the next build(). Returns whether a filter was shared."""
+    shared = cache.get(BUILT_AT_KEY) is not None
+    cache.delete_many([FILTER_KEY, BUILT_AT_KEY])
+    return shared
+
+
+def clear_local():
+    _loaded.clear()
@@ -0,0 +1,189 @@
+"""
+Rate limiting shared across workers.
+
+Limits are sliding windows made of SLOTS sub-windows, each an atomic
+counter. A request bumps the current slot and reads the others, so a
+check costs two round trips. The window slides with a granularity of
+window / SLOTS.
+
+With RATE_LIMIT_STORE = 'cache' the counters live in the default cache
+(Redis in production, see CACHES) and a check never touches the
+database. With 'database' they are RateLimitCounter rows, each bumped
+with a single UPDATE ... SET count = count + 1; the reaper prunes them.
+
+Policies are named in settings.RATE_LIMITS, e.g. {'create_paste': '1/30s'}.
+"""
+import math
+import time
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.http import HttpResponse
+from django.utils import timezone
+
+from . import dbrouter
+from .models import RateLimitCounter
+
+SLOTS = 10
+
+UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def get_client_ip(request):
+    """Get client IP address.
+
+    Clients can send any X-Forwarded-For they like, so only the entry our
+    own proxies appended (TRUSTED_PROXY_HOPS from the right) is believed.
+    """
+    hops = settings.TRUSTED_PROXY_HOPS
+    forwarded = [ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if ip.strip()]
+    if hops and len(forwarded) >= hops:
+        return forwarded[-hops]
+    return request.META.get('REMOTE_ADDR')
+
+
+def parse_rate(rate):
+    """'5/30s' -> (5, 30.0); the count of units defaults to 1 ('60/m')"""
+    limit, period = rate.split('/')
+    unit = period[-1]
+    amount = period[:-1] or '1'
+    return int(limit), float(amount) * UNITS[unit]
+
+
+def _slot_key(name, key, slot):
+    return f"rl_{name}_{key}_{slot}"
+
+
+class CacheStore:
+    """Counters in the default cache; incr is atomic on Redis"""
+
+    def bump(self, name, key, current, older, timeout):
+        current_key = _slot_key(name, key, current)
+        if cache.add(current_key, 1, timeout=timeout):
+            count = 1
+        else:
+            try:
+                count = cache.incr(current_key)
+            except ValueError:
+                cache.add(current_key, 1, timeout=timeout)
+                count = 1
+        values = cache.get_many([_slot_key(name, key, slot) for slot in older])
+        return count, [values.get(_slot_key(name, key, slot), 0) for slot in older]
+
+    def decr(self, name, key, slot):
+        try:
+            cache.decr(_slot_key(name, key, slot))
+        except ValueError:
+            pass
+
+
+class DatabaseStore:
+    """Counters in RateLimitCounter rows on the primary.
+
+    The queries run unpinned, so a rate-limited GET keeps its client on
+    the replicas.
+    """
+
+    def _rows(self, name, key):
+        return RateLimitCounter.objects.filter(bucket=f"{name}_{key}")
+
+    def bump(self, name, key, current, older, timeout):
+        bump = {'count': F('count') + 1}
+        with dbrouter.unpinned():
+            rows = self._rows(name, key)
+            if not rows.filter(slot=current).update(**bump):
+                try:
+                    with transaction.atomic():
+                        RateLimitCounter.objects.create(
+                            bucket=f"{name}_{key}", slot=current, count=1,
+                            expires_at=timezone.now() + timedelta(seconds=timeout),
+                        )
+                except IntegrityError:
+                    # Another worker created the slot first
+                    rows.filter(slot=current).update(**bump)
+            counts = dict(rows.filter(slot__in=[*older, current]).values_list('slot', 'count'))
+        return counts.get(current, 0), [counts.get(slot, 0) for slot in older]
+
+    def decr(self, name, key, slot):
+        with dbrouter.unpinned():
+            self._rows(name, key).filter(slot=slot).update(count=F('count') - 1)
+
+
+STORES = {'cache': CacheStore(), 'database': DatabaseStore()}
+
+
+def _store():
+    return STORES[settings.RATE_LIMIT_STORE]
+
+
+def hit(name, key, limit, window, now=None):
+    """Count a request; returns seconds to wait, or 0 if it's allowed"""
+    store = _store()
+    now = time.time() if now is None else now
+    slot_length = window / SLOTS
+    current = int(now // slot_length)
+    timeout = math.ceil(window + slot_length)
+
+    older = [current - n for n in range(SLOTS - 1, 0, -1)]
+    count, per_slot = store.bump(name, key, current, older, timeout)
+    if count + sum(per_slot) <= limit:
+        return 0
+
+    # Rejected requests don't count against the client
+    store.decr(name, key, current)
+
+    # Wait until enough of the oldest slots have left the window
+    excess = count + sum(per_slot) - limit
+    for slot, value in zip(older + [current], per_slot + [count - 1]):
+        excess -= value
+        if excess <= 0:
+            return max((slot + SLOTS) * slot_length - now, 0.001)
+    return window
+
+
+def refund(name, key, window, now):
+    """Give back a request counted by hit() at time now"""
+    _store().decr(name, key, int(now // (window / SLOTS)))
+
+
+def too_many_requests(request, retry_after):
+    return HttpResponse(
+        f"Rate limit exceeded, retry in {retry_after} seconds",
+        status=429, content_type='text/plain; charset=utf-8',
+    )
+
+
+def rate_limit(name, methods=('POST',), key=get_client_ip, on_limit=too_many_requests, refund_if=None):
+    """Limit a view with the policy settings.RATE_LIMITS[name].
+
+    on_limit(request, retry_after) builds the response for limited
+    requests, which always gets a Retry-After header. If refund_if(response)
+    is true the request is given back, e.g. for a form that failed to
+    validate.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return view(request, *args, **kwargs)
+
+            limit, window = parse_rate(settings.RATE_LIMITS[name])
+            client = key(request)
+            now = time.time()
+            wait = hit(name, client, limit, window, now)
+            if wait:
+                retry_after = math.ceil(wait)
+                response = on_limit(request, retry_after)
+                response['Retry-After'] = str(retry_after)
+                return response
+
+            response = view(request, *args, **kwargs)
+            if refund_if is not None and refund_if(response):
+                refund(name, client, window, now)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,58 @@
+"""
+Deletes expired pastes in small batches.
+
+Each batch is its own short transaction over the next BATCH_SIZE expired
+primary keys, so the reaper never holds locks on a large part of the
+table. Blobs left without any paste are deleted with their last paste
+(external ones from the blob store once the batch commits), and search
+entries go with their paste.
+"""
+import time
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Paste, PasteBlob, SiteStats
+
+BATCH_SIZE = 1000
+
+
+def reap_batch(after_pk='', batch_size=BATCH_SIZE, now=None):
+    """Delete up to batch_size expired pastes with pk > after_pk.
+
+    Returns (deleted, last_pk); last_pk is None once nothing is left.
+    """
+    now = now or timezone.now()
+    rows = list(
+        Paste.objects.filter(expires_at__lte=now, pk__gt=after_pk)
+        .order_by('pk')
+        .values_list('pk', 'blob_id')[:batch_size]
+    )
+    if not rows:
+        return 0, None
+
+    paste_ids = [pk for pk, _ in rows]
+    blob_ids = {blob_id for _, blob_id in rows}
+    with transaction.atomic():
+        _, per_model = Paste.objects.filter(pk__in=paste_ids, expires_at__lte=now).delete()
+        PasteBlob.delete_orphans(blob_ids)
+    return per_model.get(Paste._meta.label, 0), paste_ids[-1]
+
+
+def reap(batch_size=BATCH_SIZE, pause=0.0):
+    """Delete all pastes expired as of now. Returns (deleted, seconds)."""
+    started = time.monotonic()
+    now = timezone.now()
+    total = 0
+    last_pk = ''
+    while True:
+        deleted, last_pk = reap_batch(last_pk, batch_size, now)
+        if last_pk is None:
+            break
+        total += deleted
+        if pause:
+            time.sleep(pause)
+
+    if total:
+        SiteStats.record_expired()
+    return total, time.monotonic() - started
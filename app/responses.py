@@ -0,0 +1,275 @@
+"""
+Raw paste responses.
+
+Pastes are immutable, so the raw endpoint can hand out strong ETags (the
+content hash), long-lived cache headers bounded by the paste's expiry,
+and gzip/brotli bodies that are compressed once and then shared through
+the cache by content hash. Single byte ranges are supported for resuming
+big downloads.
+
+Bodies kept in the blob store are never read whole: they are sent as a
+file, or streamed in chunks (memory-mapped when the store is local) and
+compressed on the fly, so memory use doesn't grow with the paste.
+"""
+import gzip
+import re
+import zlib
+from contextlib import closing
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from .blobstore import read_range
+from .models import hash_content
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Bodies smaller than this are not worth compressing
+COMPRESS_MIN_SIZE = 1024
+
+MAX_AGE = 365 * 24 * 60 * 60
+
+# Bodies over this many bytes are streamed in chunks this size
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def _accepts(header, encoding):
+    """Whether an Accept-Encoding header allows encoding (q=0 refuses it)"""
+    qualities = {}
+    for item in header.split(','):
+        coding, *params = (part.strip() for part in item.split(';'))
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            qualities[coding.lower()] = quality
+    quality = qualities.get(encoding, qualities.get('*', 0.0))
+    return quality > 0
+
+
+def _choose_encoding(request, size):
+    if size < COMPRESS_MIN_SIZE or request.headers.get('Range'):
+        return None
+    accepted = request.headers.get('Accept-Encoding', '')
+    if brotli is not None and _accepts(accepted, 'br'):
+        return 'br'
+    if _accepts(accepted, 'gzip'):
+        return 'gzip'
+    return None
+
+
+def _compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def _compressed_body(content_hash, data, encoding, ttl):
+    key = f"paste_body_{content_hash}_{encoding}"
+    body = cache.get(key)
+    if body is None:
+        body = _compress(data, encoding)
+        cache.set(key, body, timeout=min(settings.PASTE_CACHE_TIMEOUT, ttl))
+    return body
+
+
+def _parse_range(header, size):
+    """Get (start, end) inclusive for a single-range header.
+
+    Returns None to ignore the header (serve the whole body) and raises
+    ValueError if the range can't be satisfied.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or size == 0:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes, of which there must be some
+        if int(last) == 0:
+            raise ValueError("Unsatisfiable range")
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError("Unsatisfiable range")
+    return start, end
+
+
+async def _chunks(data):
+    view = memoryview(data)
+    for start in range(0, len(view), STREAM_CHUNK_SIZE):
+        yield bytes(view[start:start + STREAM_CHUNK_SIZE])
+
+
+def _compressor(encoding):
+    """(compress, finish) functions for a streaming encoder"""
+    if encoding == 'br':
+        compressor = brotli.Compressor()
+        return compressor.process, compressor.finish
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    return compressor.compress, compressor.flush
+
+
+def _blob_chunks(blob, start, end, encoding):
+    with closing(blob.open()) as f:
+        if not encoding:
+            yield from read_range(f, start, end, STREAM_CHUNK_SIZE)
+            return
+        compress, finish = _compressor(encoding)
+        for chunk in read_range(f, start, end, STREAM_CHUNK_SIZE):
+            chunk = compress(chunk)
+            if chunk:
+                yield chunk
+        yield finish()
+
+
+async def _async_chunks(chunks):
+    """Async iterator over a sync one, reading each chunk in a thread"""
+    next_chunk = sync_to_async(next, thread_sensitive=False)
+    try:
+        while (chunk := await next_chunk(chunks, None)) is not None:
+            yield chunk
+    finally:
+        chunks.close()
+
+
+def _set_cache_headers(response, paste, etag, ttl):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(paste.created_at.timestamp())
+    response['Cache-Control'] = f"public, max-age={ttl}, immutable"
+    response['Expires'] = http_date(paste.expires_at.timestamp())
+    patch_vary_headers(response, ['Accept-Encoding'])
+
+
+def raw_response(request, paste, stream=False):
+    """Build the raw text response for a non-expired paste.
+
+    With stream, big bodies are sent as an async iterator of chunks for
+    ASGI servers.
+    """
+    content_hash = paste.content_hash or hash_content(paste.content)
+    blob = paste.blob if paste.blob_id else None
+    if blob is not None and blob.is_external:
+        return _external_response(request, paste, blob, stream)
+    data = paste.content.encode('utf-8')
+    ttl = int((paste.expires_at - timezone.now()).total_seconds())
+    ttl = min(max(ttl, 0), MAX_AGE)
+
+    encoding = _choose_encoding(request, len(data))
+    etag = quote_etag(f"{content_hash}-{encoding}" if encoding else content_hash)
+
+    not_modified = get_conditional_response(
+        request, etag=etag, last_modified=int(paste.created_at.timestamp())
+    )
+    if not_modified is not None:
+        _set_cache_headers(not_modified, paste, etag, ttl)
+        return not_modified
+
+    status = 200
+    content_range = None
+    range_header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    if range_header and (not if_range or if_range == etag):
+        try:
+            byte_range = _parse_range(range_header, len(data))
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f"bytes */{len(data)}"
+            return response
+        if byte_range:
+            start, end = byte_range
+            content_range = f"bytes {start}-{end}/{len(data)}"
+            data = data[start:end + 1]
+            status = 206
+
+    if encoding:
+        data = _compressed_body(content_hash, data, encoding, ttl)
+
+    if stream and len(data) > STREAM_CHUNK_SIZE:
+        response = StreamingHttpResponse(_chunks(data), content_type='text/plain; charset=utf-8', status=status)
+    else:
+        response = HttpResponse(data, content_type='text/plain; charset=utf-8', status=status)
+    response['X-Content-Type-Options'] = 'nosniff'
+    response['Accept-Ranges'] = 'bytes'
+    if encoding:
+        response['Content-Encoding'] = encoding
+    if content_range:
+        response['Content-Range'] = content_range
+    response['Content-Length'] = len(data)
+    _set_cache_headers(response, paste, etag, ttl)
+    return response
+
+
+def _external_response(request, paste, blob, stream):
+    """raw_response() for a body in the blob store, streamed from there"""
+    size = blob.size()
+    ttl = int((paste.expires_at - timezone.now()).total_seconds())
+    ttl = min(max(ttl, 0), MAX_AGE)
+
+    encoding = _choose_encoding(request, size)
+    etag = quote_etag(f"{blob.hash}-{encoding}" if encoding else blob.hash)
+
+    not_modified = get_conditional_response(
+        request, etag=etag, last_modified=int(paste.created_at.timestamp())
+    )
+    if not_modified is not None:
+        _set_cache_headers(not_modified, paste, etag, ttl)
+        return not_modified
+
+    status = 200
+    start, end = 0, size - 1
+    content_range = None
+    range_header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    if range_header and (not if_range or if_range == etag):
+        try:
+            byte_range = _parse_range(range_header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f"bytes */{size}"
+            return response
+        if byte_range:
+            start, end = byte_range
+            content_range = f"bytes {start}-{end}/{size}"
+            status = 206
+
+    content_type = 'text/plain; charset=utf-8'
+    if status == 200 and not encoding and not stream:
+        # The whole file as is, which WSGI servers can sendfile()
+        response = FileResponse(blob.open(), content_type=content_type)
+        response.block_size = STREAM_CHUNK_SIZE
+        # Not a download, like the other raw responses
+        del response['Content-Disposition']
+    else:
+        chunks = _blob_chunks(blob, start, end, encoding)
+        response = StreamingHttpResponse(
+            _async_chunks(chunks) if stream else chunks, content_type=content_type, status=status,
+        )
+    response['X-Content-Type-Options'] = 'nosniff'
+    response['Accept-Ranges'] = 'bytes'
+    if encoding:
+        response['Content-Encoding'] = encoding
+    else:
+        response['Content-Length'] = end - start + 1
+    if content_range:
+        response['Content-Range'] = content_range
+    _set_cache_headers(response, paste, etag, ttl)
+    return response
@@ -0,0 +1,125 @@
+"""
+Uptime rollups.
+
+Raw per-minute UptimeLog rows are downsampled into hourly and daily
+UptimeRollup rows (availability and p50/p95/p99 response time) once
+each hour or day has closed. The last rolled-up bucket is rolled up
+again on the next run, so checks logged just after it closed still
+count. Raw rows are then pruned after
+UPTIME_RAW_RETENTION_DAYS and hourly rollups after
+UPTIME_HOURLY_RETENTION_DAYS, so the status page only ever reads a
+bounded number of rollup rows.
+"""
+import math
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from .models import UptimeLog, UptimeRollup
+
+PERIODS = {
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+}
+
+
+def truncate(moment, period):
+    moment = moment.replace(minute=0, second=0, microsecond=0)
+    if period == 'day':
+        moment = moment.replace(hour=0)
+    return moment
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(pct / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def _first_bucket_to_roll(period):
+    last = UptimeRollup.objects.filter(period=period).aggregate(last=Max('bucket_start'))['last']
+    if last is not None:
+        # Roll the last bucket up again to pick up late checks
+        return last
+    oldest = UptimeLog.objects.aggregate(oldest=Min('checked_at'))['oldest']
+    return truncate(oldest, period) if oldest else None
+
+
+def rollup(period, now=None):
+    """Aggregate every closed bucket since the last rollup. Returns rows written."""
+    now = now or timezone.now()
+    start = _first_bucket_to_roll(period)
+    end = truncate(now, period)
+    if start is None or start >= end:
+        return 0
+
+    samples = defaultdict(list)
+    up = defaultdict(int)
+    logs = (
+        UptimeLog.objects.filter(checked_at__gte=start, checked_at__lt=end)
+        .values_list('service', 'checked_at', 'is_up', 'response_time')
+        .iterator(chunk_size=2000)
+    )
+    for service, checked_at, is_up, response_time in logs:
+        key = (service, truncate(checked_at, period))
+        samples[key].append(response_time)
+        up[key] += is_up
+
+    rows = []
+    for (service, bucket_start), times in samples.items():
+        times.sort()
+        rows.append(UptimeRollup(
+            service=service,
+            period=period,
+            bucket_start=bucket_start,
+            checks=len(times),
+            up_checks=up[(service, bucket_start)],
+            p50=percentile(times, 50),
+            p95=percentile(times, 95),
+            p99=percentile(times, 99),
+        ))
+
+    with transaction.atomic():
+        UptimeRollup.objects.filter(period=period, bucket_start__gte=start, bucket_start__lt=end).delete()
+        UptimeRollup.objects.bulk_create(rows)
+    return len(rows)
+
+
+def prune(now=None):
+    """Delete raw logs and hourly rollups past retention. Returns (logs, hourly)."""
+    now = now or timezone.now()
+    # Never drop raw rows that a daily rollup may still read
+    cutoff = min(
+        now - timedelta(days=settings.UPTIME_RAW_RETENTION_DAYS),
+        _first_bucket_to_roll('day') or now,
+    )
+    logs, _ = UptimeLog.objects.filter(checked_at__lt=cutoff).delete()
+    hourly, _ = UptimeRollup.objects.filter(
+        period='hour',
+        bucket_start__lt=now - timedelta(days=settings.UPTIME_HOURLY_RETENTION_DAYS),
+    ).delete()
+    return logs, hourly
+
+
+def daily_history(days=90, now=None):
+    """Get {service: [day, ...]} for the last `days` days from daily rollups"""
+    now = now or timezone.now()
+    since = truncate(now, 'day') - timedelta(days=days)
+    history = defaultdict(list)
+    rollups = UptimeRollup.objects.filter(period='day', bucket_start__gte=since).order_by('service', 'bucket_start')
+    for row in rollups:
+        history[row.service].append({
+            'date': row.bucket_start.date().isoformat(),
+            'availability': round(row.availability, 3),
+            'checks': row.checks,
+            'p50': round(row.p50, 1),
+            'p95': round(row.p95, 1),
+            'p99': round(row.p99, 1),
+        })
+    return dict(history)
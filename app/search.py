@@ -0,0 +1,146 @@
+"""
+Full-text search over pastes.
+
+Searches go to the index created by migration 0011 on the PasteSearch
+table: the tsvector GIN index on Postgres, plus, where pg_trgm was
+available, an ILIKE match served by the trigram index for code-ish
+tokens (`foo_bar`, `::`, `->`) the text parser splits up, and an FTS5
+table on SQLite for local development. Other databases get a plain
+unindexed substring match. Expired pastes are filtered out, and only the
+requested page gets snippets.
+"""
+from django.apps import apps
+from django.db import connection
+from django.utils import timezone
+from django.utils.html import escape
+
+PAGE_SIZE = 20
+
+# Characters of context on each side of the match in plain snippets
+SNIPPET_CONTEXT = 60
+
+# Snippet markers; swapped for <mark> once the snippet is HTML-escaped
+START, STOP = '\x02', '\x03'
+# Stand-ins for < and > in Postgres headlines, which would drop them as tags
+LT, GT = '\x04', '\x05'
+
+POSTGRES_SQL = """
+    SELECT hit.paste_id, hit.title,
+           ts_headline('simple', translate(hit.body, '<>', E'\\x04\\x05'), hit.query,
+                       'StartSel=\x02, StopSel=\x03, MaxFragments=2, MaxWords=20, MinWords=5')
+    FROM (
+        SELECT s.paste_id, s.title, s.body, q.query,
+               ts_rank(s.search_vector, q.query){like_rank} AS rank
+        FROM app_pastesearch s, websearch_to_tsquery('simple', %(q)s) AS q(query)
+        WHERE (s.search_vector @@ q.query{like_match})
+          AND s.expires_at > %(now)s
+        ORDER BY rank DESC, s.paste_id
+        LIMIT %(limit)s OFFSET %(offset)s
+    ) hit
+    ORDER BY hit.rank DESC, hit.paste_id
+"""
+
+# Without the trigram index an ILIKE would scan every body, so it's only
+# added where migration 0011 could build the index
+POSTGRES_TRIGRAM_SQL = POSTGRES_SQL.format(
+    like_rank=' + CASE WHEN s.body ILIKE %(like)s THEN 0.1 ELSE 0 END',
+    like_match=' OR s.body ILIKE %(like)s',
+)
+POSTGRES_SQL = POSTGRES_SQL.format(like_rank='', like_match='')
+
+TRIGRAM_INDEX = 'app_pastesearch_body_trgm'
+
+# Whether TRIGRAM_INDEX exists, looked up once per process
+_trigram_index = None
+
+SQLITE_SQL = f"""
+    SELECT s.paste_id, s.title,
+           snippet(app_pastesearch_fts, 1, '{START}', '{STOP}', '…', 16)
+    FROM app_pastesearch_fts
+    JOIN app_pastesearch s ON s.rowid = app_pastesearch_fts.rowid
+    WHERE app_pastesearch_fts MATCH %s AND s.expires_at > %s
+    ORDER BY rank, s.paste_id
+    LIMIT %s OFFSET %s
+"""
+
+
+def _like_pattern(query):
+    escaped = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def _fts5_query(query):
+    # Quote every term so user input can't use FTS5 query syntax
+    return ' '.join('"{}"'.format(term.replace('"', '""')) for term in query.split())
+
+
+def _has_trigram_index():
+    global _trigram_index
+    if _trigram_index is None:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_indexes WHERE indexname = %s", [TRIGRAM_INDEX])
+            _trigram_index = cursor.fetchone() is not None
+    return _trigram_index
+
+
+def _indexed_rows(query, limit, offset):
+    """(paste_id, title, snippet) rows from the full-text index"""
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            sql = POSTGRES_TRIGRAM_SQL if _has_trigram_index() else POSTGRES_SQL
+            cursor.execute(sql, {
+                'q': query, 'like': _like_pattern(query), 'now': now,
+                'limit': limit, 'offset': offset,
+            })
+        else:
+            cursor.execute(SQLITE_SQL, [_fts5_query(query), now, limit, offset])
+        return cursor.fetchall()
+
+
+def _plain_rows(query, now, limit, offset):
+    """(paste_id, title, snippet) rows from a case-insensitive substring match"""
+    PasteSearch = apps.get_model('app', 'PasteSearch')
+    rows = (
+        PasteSearch.objects.filter(body__icontains=query, expires_at__gt=now)
+        .order_by('paste_id')
+        .values_list('paste_id', 'title', 'body')[offset:offset + limit]
+    )
+    results = []
+    for paste_id, title, body in rows:
+        at = body.lower().find(query.lower())
+        start = max(at - SNIPPET_CONTEXT, 0)
+        end = at + len(query)
+        snippet = f"{body[start:at]}{START}{body[at:end]}{STOP}{body[end:end + SNIPPET_CONTEXT]}"
+        results.append((paste_id, title, snippet))
+    return results
+
+
+def _highlight(snippet):
+    snippet = (snippet or '').replace(LT, '<').replace(GT, '>')
+    return escape(snippet).replace(START, '<mark>').replace(STOP, '</mark>')
+
+
+def search(query, page=1, page_size=PAGE_SIZE):
+    """Get one page of live pastes matching query.
+
+    Returns (results, has_next); each result has id, title and an HTML
+    snippet with matches in <mark>.
+    """
+    query = query.strip()
+    if not query:
+        return [], False
+
+    offset = (page - 1) * page_size
+    # Fetch one extra row to know whether there's a next page
+    limit = page_size + 1
+    if connection.vendor in ('postgresql', 'sqlite'):
+        rows = _indexed_rows(query, limit, offset)
+    else:
+        rows = _plain_rows(query, timezone.now(), limit, offset)
+
+    results = [
+        {'id': paste_id, 'title': title, 'snippet': _highlight(snippet)}
+        for paste_id, title, snippet in rows[:page_size]
+    ]
+    return results, len(rows) > page_size
@@ -1,3 +1,968 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from . import benchmark, corpus, dbrouter, dedup, highlight, ids, metrics, monitoring, pagecache, pastecache, pastefilter, ratelimit, reaper, responses, rollups, search, trending, viewcounts, views
+from .forms import PasteForm
+from .models import ApiToken, Paste, PasteBlob, PasteFingerprint, PasteSearch, RateLimitCounter, ServiceStatus, SiteStats, UptimeLog, UptimeRollup
+
+
+class SiteStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        pastecache.clear_local()
+
+    def test_counters_follow_creates(self):
+        SiteStats.rebuild()
+        Paste.objects.create(content='hello')
+        Paste.objects.create(content='world!')
+        stats = SiteStats.objects.get(pk=1)
+        self.assertEqual(stats.total_pastes, 2)
+        self.assertEqual(stats.total_characters, 11)
+        self.assertEqual(stats.active_pastes, 2)
+
+    def test_record_expired_and_rebuild(self):
+        Paste.objects.create(content='abc', expires_at=timezone.now() - timedelta(days=1))
+        SiteStats.record_expired()
+        self.assertEqual(SiteStats.objects.get(pk=1).active_pastes, 0)
+        stats = SiteStats.rebuild()
+        self.assertEqual((stats.total_pastes, stats.active_pastes), (1, 0))
+
+    def test_expired_create_is_not_active_and_totals_survive_reaping(self):
+        Paste.objects.create(content='live')
+        Paste.objects.create(content='gone', expires_at=timezone.now() - timedelta(days=1))
+        self.assertEqual(SiteStats.objects.get(pk=1).active_pastes, 1)
+        reaper.reap()
+        stats = SiteStats.rebuild()
+        self.assertEqual((stats.total_pastes, stats.total_characters, stats.active_pastes), (2, 8, 1))
+
+    def test_home_uses_cached_stats(self):
+        Paste.objects.create(content='x' * 10)
+        SiteStats.get_cached()
+        with self.assertNumQueries(0):
+            response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_chars'], 10)
+
+
+@override_settings(VIEW_COUNT_BUFFERED=True)
+class ViewCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        pastecache.clear_local()
+
+    def test_views_are_buffered_then_flushed(self):
+        paste = Paste.objects.create(content='hi')
+        with self.assertNumQueries(1):
+            self.client.get(f'/p/{paste.id}/')
+        self.client.get(f'/p/{paste.id}/')
+        paste.refresh_from_db()
+        self.assertEqual(paste.views, 0)
+
+        self.assertEqual(viewcounts.flush(include_current=True), 2)
+        paste.refresh_from_db()
+        self.assertEqual(paste.views, 2)
+
+        self.client.get(f'/p/{paste.id}/')
+        viewcounts.flush(include_current=True)
+        paste.refresh_from_db()
+        self.assertEqual(paste.views, 3)
+
+    def test_flush_after_outage_only_walks_live_generations(self):
+        cache.set(viewcounts.FLUSHED_KEY, viewcounts.current_generation() - 100_000, timeout=None)
+        with mock.patch('app.viewcounts._collect', return_value={}) as collect:
+            viewcounts.flush()
+        self.assertEqual(collect.call_count, settings.VIEW_COUNT_MAX_LAG + 1)
+
+    @override_settings(VIEW_COUNT_BUFFERED=False)
+    def test_unbuffered_views_update_directly(self):
+        paste = Paste.objects.create(content='hi')
+        self.client.get(f'/p/{paste.id}/')
+        paste.refresh_from_db()
+        self.assertEqual(paste.views, 1)
+
+
+class PasteCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        pastecache.clear_local()
+
+    def test_hot_paste_skips_database(self):
+        paste = Paste.objects.create(content='cached')
+        self.client.get(f'/p/{paste.id}/raw/')
+        with self.assertNumQueries(0):
+            response = self.client.get(f'/p/{paste.id}/raw/')
+        self.assertEqual(response.content, b'cached')
+
+        pastecache.clear_local()
+        with self.assertNumQueries(0):
+            self.client.get(f'/p/{paste.id}/clone/')
+        stats = pastecache.stats()
+        self.assertEqual((stats['misses'], stats['shared_hits']), (0, 1))
+
+    def test_missing_and_expired(self):
+        self.assertEqual(self.client.get('/p/nope/raw/').status_code, 404)
+        paste = Paste.objects.create(content='old', expires_at=timezone.now() - timedelta(days=1))
+        self.assertEqual(self.client.get(f'/p/{paste.id}/raw/').status_code, 404)
+
+
+class RawPasteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        pastecache.clear_local()
+        self.paste = Paste.objects.create(content='0123456789' * 200)
+        self.url = f'/p/{self.paste.id}/raw/'
+
+    def test_etag_and_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['ETag'], f'"{self.paste.content_hash}"')
+        self.assertIn('max-age=', response['Cache-Control'])
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_gzip_variant(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content).decode(), self.paste.content)
+
+    def test_refused_encodings(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='br;q=0, gzip;q=0.5')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip;q=0, br;q=0')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content.decode(), self.paste.content)
+
+    def test_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=5-9')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, b'56789')
+        self.assertEqual(response['Content-Range'], 'bytes 5-9/2000')
+        response = self.client.get(self.url, HTTP_RANGE='bytes=5000-')
+        self.assertEqual(response.status_code, 416)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-0')
+        self.assertEqual(response.status_code, 416)
+
+
+class PasteBlobTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_identical_content_shares_a_compressed_blob(self):
+        content = 'log line\n' * 500 + 'done'
+        first = Paste.objects.create(content=content)
+        response = self.client.post('/new', {'title': '', 'content': content, 'language': 'plaintext'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(PasteBlob.objects.count(), 1)
+
+        blob = PasteBlob.objects.get()
+        self.assertEqual(blob.codec, PasteBlob.CODEC_ZLIB)
+        self.assertLess(len(bytes(blob.data)), len(content))
+        self.assertEqual(Paste.objects.exclude(pk=first.pk).get().content, content)
+
+
+class ExternalBlobTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        pastecache.clear_local()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(PASTE_BLOB_STORE=directory.name, PASTE_BLOB_EXTERNAL_SIZE=4096))
+        self.content = ''.join(f'line {i} ✓\n' for i in range(2000))
+        self.paste = Paste.objects.create(content=self.content)
+        self.url = f'/p/{self.paste.id}/raw/'
+
+    def test_big_body_is_kept_out_of_the_row(self):
+        blob = PasteBlob.objects.get()
+        self.assertEqual(blob.codec, PasteBlob.CODEC_EXTERNAL)
+        self.assertEqual(bytes(blob.data), b'')
+        self.assertEqual(blob.size(), len(self.content.encode()))
+        self.assertEqual(Paste.objects.get().content, self.content)
+        self.assertEqual(pastecache.get_paste(self.paste.id).content, self.content)
+        self.assertNotIn('content', cache.get(pastecache._cache_key(self.paste.id)))
+
+    def test_raw_streams_from_the_store(self):
+        data = self.content.encode()
+        response = self.client.get(self.url)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Length'], str(len(data)))
+        self.assertEqual(b''.join(response.streaming_content), data)
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-5099')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-5099/{len(data)}')
+        self.assertEqual(b''.join(response.streaming_content), data[100:5100])
+
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), data)
+
+    async def test_raw_streams_asynchronously(self):
+        response = await self.async_client.get(self.url, headers={'Range': 'bytes=-5000'})
+        self.assertEqual(response.status_code, 206)
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(body, self.content.encode()[-5000:])
+
+    @override_settings(LARGE_PASTE_SIZE=1000, LARGE_PASTE_WINDOW=10)
+    def test_windows_are_read_in_ranges(self):
+        with mock.patch.object(PasteBlob, 'text', side_effect=AssertionError("read the whole body")):
+            response = self.client.get(f'/p/{self.paste.id}/')
+            data = self.client.get(f'/p/{self.paste.id}/lines', {'start': 1995, 'count': 10}).json()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.context['line_count'], response.context['total_lines']), (10, 2001))
+        self.assertContains(response, 'line 9 ✓')
+        self.assertNotContains(response, 'line 50 ✓')
+        self.assertEqual((data['count'], data['total_lines'], data['next_start']), (6, 2001, None))
+        self.assertIn('line 1999 ✓', data['html'])
+
+    def test_reaper_deletes_the_file(self):
+        Paste.objects.filter(pk=self.paste.pk).update(expires_at=timezone.now() - timedelta(days=1))
+        with self.captureOnCommitCallbacks(execute=True):
+            reaper.reap()
+        with self.assertRaises(FileNotFoundError):
+            PasteBlob(hash=self.paste.blob_id).size()
+
+    def test_size_limit(self):
+        with override_settings(PASTE_MAX_SIZE=1000):
+            response = self.client.post('/new', {'title': '', 'content': 'x' * 1001, 'language': 'plaintext'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Paste.objects.count(), 1)
+
+
+class ReaperTests(TestCase):
+    def test_deletes_expired_pastes_and_orphan_blobs(self):
+        past = timezone.now() - timedelta(days=1)
+        for i in range(5):
+            Paste.objects.create(content=f'old {i}', expires_at=past)
+        Paste.objects.create(content='shared', expires_at=past)
+        live = Paste.objects.create(content='shared')
+
+        deleted, _ = reaper.reap(batch_size=2)
+        self.assertEqual(deleted, 6)
+        self.assertEqual(list(Paste.objects.all()), [live])
+        self.assertEqual(PasteBlob.objects.count(), 1)
+        self.assertEqual(SiteStats.objects.get(pk=1).active_pastes, 1)
+
+
+class HighlightTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        pastecache.clear_local()
+
+    def test_highlighted_once_and_reused(self):
+        paste = Paste.objects.create(content='def f():\n    return 1\n', language='python')
+        response = self.client.get(f'/p/{paste.id}/')
+        self.assertEqual(response.context['line_count'], 3)
+        self.assertContains(response, '<span class="k">def</span>', html=False)
+        self.assertNotContains(response, 'highlight.min.js')
+
+        with mock.patch.object(highlight, '_render') as render:
+            self.client.get(f'/p/{paste.id}/')
+        render.assert_not_called()
+
+    def test_unknown_language_falls_back_to_client(self):
+        paste = Paste.objects.create(content='???', language='cobol')
+        response = self.client.get(f'/p/{paste.id}/')
+        self.assertTrue(response.context['client_highlight'])
+        self.assertContains(response, 'highlight.min.js')
+
+    @override_settings(LARGE_PASTE_SIZE=100, LARGE_PASTE_WINDOW=10)
+    def test_big_paste_is_rendered_in_windows(self):
+        content = '\n'.join(f'line {n}' for n in range(1, 101))
+        paste = Paste.objects.create(content=content)
+        response = self.client.get(f'/p/{paste.id}/')
+        self.assertEqual((response.context['line_count'], response.context['next_start']), (10, 10))
+        self.assertNotContains(response, 'line 50')
+
+        data = self.client.get(f'/p/{paste.id}/lines', {'start': 95, 'count': 10}).json()
+        self.assertEqual((data['count'], data['total_lines'], data['next_start']), (5, 100, None))
+        self.assertIn('line 100', data['html'])
+        self.assertTrue(data['gutter'].startswith('<div>96</div>'))
+        self.assertEqual(self.client.get(f'/p/{paste.id}/lines', {'start': 100}).status_code, 400)
+
+
+class PasteIdTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        ids.pool.clear()
+
+    def test_colliding_id_gets_a_new_one(self):
+        existing = Paste.objects.create(content='first')
+        paste = Paste(id=existing.id, content='second')
+        paste.save()
+        self.assertNotEqual(paste.id, existing.id)
+        existing.refresh_from_db()
+        self.assertEqual(existing.content, 'first')
+        self.assertEqual(ids.stats()['collisions'], 1)
+
+    def test_table_size_leaves_out_reaped_pastes(self):
+        Paste.objects.create(content='live')
+        Paste.objects.create(content='gone', expires_at=timezone.now() - timedelta(days=1))
+        reaper.reap()
+        self.assertEqual(ids.stats()['table_size'], 1)
+        self.assertEqual(SiteStats.objects.get(pk=1).total_pastes, 2)
+
+    @override_settings(PASTE_ID_POOL_SIZE=20)
+    def test_pool_skips_taken_ids(self):
+        taken = Paste.objects.create(content='x')
+        with mock.patch.object(ids, 'random_id', side_effect=[taken.id] + [f'id{n:05}' for n in range(19)]):
+            pool_ids = {ids.generate_paste_id() for _ in range(19)}
+        self.assertNotIn(taken.id, pool_ids)
+        self.assertEqual(len(pool_ids), 19)
+
+    @override_settings(PASTE_ID_POOL_SIZE=20)
+    def test_unsaved_pastes_take_no_id(self):
+        ids.pool.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(PasteForm().instance.id, '')
+        form = PasteForm({'title': '', 'content': 'hi', 'language': 'plaintext'})
+        self.assertTrue(form.is_valid())
+        paste = form.save()
+        self.assertEqual(len(paste.id), ids.ID_LENGTH)
+
+
+class RateLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_second_create_is_limited_with_retry_after(self):
+        data = {'title': '', 'content': 'hello', 'language': 'plaintext'}
+        self.assertEqual(self.client.post('/new', {**data, 'content': ''}).status_code, 200)
+        self.assertEqual(self.client.post('/new', data).status_code, 302)
+        response = self.client.post('/new', data)
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(1 <= int(response['Retry-After']) <= 30)
+        self.assertEqual(Paste.objects.count(), 1)
+
+    def test_client_ip_ignores_spoofed_forwarded_for(self):
+        data = {'title': '', 'content': 'hello', 'language': 'plaintext'}
+        headers = {'HTTP_X_FORWARDED_FOR': 'spoofed, 203.0.113.7'}
+        self.assertEqual(self.client.post('/new', data, **headers).status_code, 302)
+        headers = {'HTTP_X_FORWARDED_FOR': 'other, 203.0.113.7'}
+        self.assertEqual(self.client.post('/new', data, **headers).status_code, 429)
+        with override_settings(TRUSTED_PROXY_HOPS=0):
+            request = mock.Mock(META={**headers, 'REMOTE_ADDR': '10.0.0.1'})
+            self.assertEqual(ratelimit.get_client_ip(request), '10.0.0.1')
+
+    def test_sliding_window(self):
+        for store in ratelimit.STORES:
+            with self.subTest(store=store), override_settings(RATE_LIMIT_STORE=store):
+                self.assertEqual(ratelimit.hit(store, 'ip', 2, 10, now=100.0), 0)
+                self.assertEqual(ratelimit.hit(store, 'ip', 2, 10, now=105.0), 0)
+                self.assertAlmostEqual(ratelimit.hit(store, 'ip', 2, 10, now=106.0), 4.0)
+                self.assertEqual(ratelimit.hit(store, 'ip', 2, 10, now=110.5), 0)
+
+    @override_settings(RATE_LIMIT_STORE='database')
+    def test_database_counters_are_single_updates(self):
+        ratelimit.hit('t', 'ip', 5, 10, now=100.0)
+        # Bump the slot and read the window
+        with self.assertNumQueries(2):
+            self.assertEqual(ratelimit.hit('t', 'ip', 5, 10, now=100.5), 0)
+        self.assertEqual(RateLimitCounter.objects.get().count, 2)
+        ratelimit.refund('t', 'ip', 10, now=100.5)
+        self.assertEqual(RateLimitCounter.objects.get().count, 1)
+        self.assertEqual(RateLimitCounter.prune(timezone.now() + timedelta(seconds=12)), 1)
+        self.assertFalse(RateLimitCounter.objects.exists())
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == '/slow':
+            time.sleep(1)
+        self.send_response(200 if self.path in ('/ok', '/slow') else 500)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class MonitoringTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f'http://127.0.0.1:{cls.server.server_port}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    @override_settings(UPTIME_TIMEOUT=0.3)
+    def test_probes_run_concurrently_and_open_incidents(self):
+        services = {
+            'ok': f'{self.base}/ok',
+            'fail': f'{self.base}/fail',
+            'slow': f'{self.base}/slow',
+            'slow2': f'{self.base}/slow',
+        }
+        started = time.monotonic()
+        results = monitoring.check_all_services(services)
+        self.assertLess(time.monotonic() - started, 0.9)
+
+        self.assertEqual({name for name, r in results.items() if r['is_up']}, {'ok'})
+        self.assertEqual(UptimeLog.objects.count(), 4)
+        self.assertEqual(
+            set(ServiceStatus.objects.filter(is_resolved=False).values_list('service', flat=True)),
+            {'fail', 'slow', 'slow2', 'all'},
+        )
+
+        monitoring.check_all_services({'fail': f'{self.base}/ok'})
+        incident = ServiceStatus.objects.get(service='fail')
+        self.assertTrue(incident.is_resolved)
+        self.assertEqual(incident.updates.count(), 1)
+
+
+class UptimeRollupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_rollup_prune_and_history(self):
+        day = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=10)
+        UptimeLog.objects.bulk_create([
+            UptimeLog(service='web', is_up=n != 0, response_time=float(n + 1),
+                      checked_at=day + timedelta(minutes=n))
+            for n in range(100)
+        ])
+
+        self.assertEqual(rollups.rollup('hour'), 2)
+        self.assertEqual(rollups.rollup('day'), 1)
+        # The last day is rolled up again, not duplicated
+        self.assertEqual(rollups.rollup('day'), 1)
+
+        daily = UptimeRollup.objects.get(period='day')
+        self.assertEqual((daily.checks, daily.up_checks), (100, 99))
+        self.assertEqual((daily.p50, daily.p95, daily.p99), (50.0, 95.0, 99.0))
+
+        # Its raw rows are kept until the next day is rolled up
+        self.assertEqual(rollups.prune()[0], 0)
+        UptimeLog.objects.create(service='web', is_up=True, response_time=1.0, checked_at=day + timedelta(days=1))
+        self.assertEqual(rollups.rollup('day'), 2)
+        self.assertEqual(rollups.prune()[0], 100)
+        with self.assertNumQueries(1):
+            data = self.client.get('/status/history.json').json()
+        self.assertEqual(data['services']['web'][0]['availability'], 99.0)
+
+    def test_late_checks_are_rolled_up(self):
+        hour = rollups.truncate(timezone.now(), 'hour') - timedelta(hours=2)
+        UptimeLog.objects.create(service='web', is_up=True, response_time=1.0, checked_at=hour)
+        self.assertEqual(rollups.rollup('hour'), 1)
+        UptimeLog.objects.create(service='web', is_up=False, response_time=2.0, checked_at=hour + timedelta(minutes=1))
+        self.assertEqual(rollups.rollup('hour'), 1)
+        hourly = UptimeRollup.objects.get(period='hour')
+        self.assertEqual((hourly.checks, hourly.up_checks), (2, 1))
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        _, key = ApiToken.create_token('ci')
+        self.auth = {'HTTP_AUTHORIZATION': f'Token {key}'}
+
+    def post_bulk(self, pastes):
+        return self.client.post(
+            '/api/pastes/bulk', json.dumps({'pastes': pastes}),
+            content_type='application/json', **self.auth,
+        )
+
+    def test_bulk_create_and_multi_get(self):
+        pastes = [{'title': f'log {n}', 'content': f'output {n}', 'language': 'bash'} for n in range(20)]
+        pastes.append({'content': 'output 0'})
+        response = self.post_bulk(pastes)
+        self.assertEqual(response.status_code, 201)
+        created = [paste['id'] for paste in response.json()['pastes']]
+        self.assertEqual(len(set(created)), 21)
+        self.assertEqual(PasteBlob.objects.count(), 20)
+        self.assertEqual(SiteStats.objects.get(pk=1).total_pastes, 21)
+
+        # Rate limits are counted in Redis in production, not in the database
+        with override_settings(RATE_LIMIT_STORE='cache'), self.assertNumQueries(1):
+            data = self.client.get('/api/pastes', {'ids': f'{created[3]},nope'}, **self.auth).json()
+        self.assertEqual(data['pastes'][0]['content'], 'output 3')
+        self.assertEqual(data['missing'], ['nope'])
+
+    def test_invalid_batch_creates_nothing(self):
+        response = self.post_bulk([{'content': 'ok'}, {'content': '', 'language': 'nope'}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['errors']['1']), {'content', 'language'})
+        self.assertEqual(Paste.objects.count(), 0)
+
+    def test_requires_token(self):
+        response = self.client.get('/api/pastes', {'ids': 'abc'}, HTTP_AUTHORIZATION='Token wrong')
+        self.assertEqual(response.status_code, 401)
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        pastecache.clear_local()
+
+    async def test_raw_streams_big_paste(self):
+        content = 'x' * (responses.STREAM_CHUNK_SIZE * 3 + 10)
+        paste = await sync_to_async(Paste.objects.create)(content=content)
+        response = await self.async_client.get(f'/p/{paste.id}/raw/')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Length'], str(len(content)))
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(body.decode(), content)
+
+    async def test_home_and_view(self):
+        paste = await sync_to_async(Paste.objects.create)(content='print(1)', language='python')
+        self.assertEqual((await self.async_client.get('/')).status_code, 200)
+        response = await self.async_client.get(f'/p/{paste.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((await self.async_client.get('/p/missing/')).status_code, 404)
+
+    @override_settings(PASTE_ID_POOL_SIZE=20)
+    async def test_clone_with_id_pool(self):
+        paste = await sync_to_async(Paste.objects.create)(title='t', content='hi')
+        ids.pool.clear()
+        response = await self.async_client.get(f'/p/{paste.id}/clone/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'clone paste')
+
+
+class SearchTests(TestCase):
+    def test_search_live_pastes_with_snippets(self):
+        Paste.objects.create(title='deploy log', content='error: <connection> refused by upstream')
+        Paste.objects.create(content='all good here')
+        Paste.objects.create(content='connection refused', expires_at=timezone.now() - timedelta(days=1))
+
+        data = self.client.get('/search', {'q': 'connection refused'}).json()
+        self.assertEqual(len(data['results']), 1)
+        result = data['results'][0]
+        self.assertEqual(result['title'], 'deploy log')
+        self.assertIn('<mark>connection</mark>', result['snippet'])
+        self.assertIn('&lt;', result['snippet'])
+        self.assertFalse(data['has_next'])
+
+    def test_deleted_pastes_leave_the_index(self):
+        paste = Paste.objects.create(content='needle in a haystack')
+        self.assertEqual(len(search.search('needle')[0]), 1)
+        paste.delete()
+        self.assertEqual(search.search('needle')[0], [])
+        self.assertEqual(search.search('"unbalanced')[0], [])
+
+    def test_only_a_prefix_of_the_body_is_kept(self):
+        paste = Paste.objects.create(content='x' * PasteSearch.MAX_CHARS + ' needle')
+        self.assertEqual(len(paste.search.body), PasteSearch.MAX_CHARS)
+
+    @skipUnless(connection.vendor == 'postgresql', "Postgres full-text search")
+    def test_substring_match_needs_the_trigram_index(self):
+        Paste.objects.create(content='error: connection refused')
+        with mock.patch.object(search, '_trigram_index', False):
+            self.assertEqual(search.search('onnectio')[0], [])
+        with mock.patch.object(search, '_trigram_index', True):
+            self.assertEqual(len(search.search('onnectio')[0]), 1)
+
+    def test_other_databases_fall_back_to_substring_match(self):
+        Paste.objects.create(title='log', content='error: <Connection> refused by upstream')
+        with mock.patch.object(search.connection, 'vendor', 'mysql'):
+            results, has_next = search.search('connection')
+        self.assertEqual(len(results), 1)
+        self.assertIn('&lt;<mark>Connection</mark>&gt;', results[0]['snippet'])
+        self.assertFalse(has_next)
+
+
+@override_settings(ALLOWED_HOSTS=['skibin.lol'])
+class BenchmarkTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        pastecache.clear_local()
+
+    def test_report_per_endpoint_and_size(self):
+        real = Paste.objects.create(content='real')
+        for interface in ('wsgi', 'asgi'):
+            report = benchmark.run(sizes=[20, 10], requests=4, concurrency=1, interface=interface, warmup=0)
+            self.assertEqual(report['config']['interface'], interface)
+            self.assertEqual(len(report['results']), 2 * len(benchmark.ENDPOINTS))
+            self.assertEqual([row['dataset_size'] for row in report['results'][::5]], [10, 20])
+            for row in report['results']:
+                expected = '302' if row['endpoint'] == 'create_paste' else '200'
+                self.assertEqual(row['status'], {expected: 4}, row)
+                self.assertLessEqual(row['p50_ms'], row['p99_ms'])
+            create = next(row for row in report['results'] if row['endpoint'] == 'create_paste')
+            self.assertGreater(create['queries_mean'], 0)
+            json.dumps(report)
+            # Seeded and created pastes are cleaned up afterwards, and only
+            # they are taken out of the totals
+            self.assertEqual(list(Paste.objects.values_list('pk', flat=True)), [real.pk])
+            self.assertEqual(PasteBlob.objects.count(), 1)
+            stats = SiteStats.objects.get(pk=1)
+            self.assertEqual((stats.total_pastes, stats.total_characters, stats.active_pastes), (1, 4, 1))
+
+
+    @override_settings(DEDUP_MAX_COPIES=1)
+    def test_creates_are_not_rejected_as_copies(self):
+        text = ' '.join(benchmark.WORDS)
+        with mock.patch.object(benchmark.Dataset, 'text', return_value=text), self.assertLogs('app.dedup', 'WARNING'):
+            report = benchmark.run(sizes=[20], requests=6, concurrency=1, endpoints=['create_paste'], warmup=0)
+        self.assertEqual(report['config']['dedup_action'], 'flag')
+        self.assertEqual(report['results'][0]['status'], {'302': 6})
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        pastecache.clear_local()
+        metrics.registry.reset()
+
+    def test_route_latency_queries_and_cache(self):
+        paste = Paste.objects.create(content='print(1)')
+        self.client.get(f'/p/{paste.id}/')
+        self.client.get(f'/p/{paste.id}/')
+        self.client.get('/does/not/exist')
+
+        route = 'p/<str:paste_id>/'
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn(f'skibin_requests_total{{route="{route}",method="GET",status="200"}} 2', body)
+        self.assertIn(f'skibin_request_duration_seconds_count{{route="{route}",method="GET"}} 2', body)
+        self.assertIn(f'skibin_paste_cache_lookups_total{{route="{route}",result="miss"}} 1', body)
+        self.assertIn(f'skibin_paste_cache_lookups_total{{route="{route}",result="hit"}} 1', body)
+        self.assertIn('skibin_requests_total{route="unmatched",method="GET",status="404"} 1', body)
+        self.assertGreater(metrics.registry.db_queries[(route,)], 0)
+        self.assertGreater(metrics.registry.size[(route,)].sum, 0)
+
+    @override_settings(METRICS_SAMPLE_RATE=1, METRICS_SLOW_REQUEST_MS=0)
+    def test_slow_requests_log_their_queries(self):
+        paste = Paste.objects.create(content='print(1)')
+        with self.assertLogs('app.metrics', 'WARNING') as logs:
+            self.client.get(f'/p/{paste.id}/')
+        self.assertIn('SELECT', logs.output[0])
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_token_required_when_set(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        response = self.client.get('/metrics', headers={'Authorization': 'Bearer s3cret'})
+        self.assertEqual(response.status_code, 200)
+
+
+class StaticAssetTests(TestCase):
+    def test_pages_use_self_hosted_assets(self):
+        paste = Paste.objects.create(content='print(1)', language='python')
+        for url in ('/', '/new', f'/p/{paste.id}/', '/pricing', '/terms', '/contact'):
+            body = self.client.get(url).content.decode()
+            self.assertIn('/static/css/dist/styles.css', body, url)
+            self.assertIn('/static/vendor/fontawesome/css/all.min.css', body, url)
+            self.assertNotIn('cdn.tailwindcss.com', body, url)
+            self.assertNotIn('tailwind.config', body, url)
+
+
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        pastecache.clear_local()
+
+    def test_static_page_is_rendered_once(self):
+        first = self.client.get('/pricing')
+        with mock.patch('app.views.render') as render:
+            second = self.client.get('/pricing')
+        render.assert_not_called()
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.content, first.content)
+
+    def test_version_change_misses_the_cache(self):
+        with override_settings(PAGE_CACHE_VERSION='a'):
+            self.client.get('/terms')
+        with override_settings(PAGE_CACHE_VERSION='b'), mock.patch('app.views.render', wraps=views.render) as render:
+            self.client.get('/terms')
+        render.assert_called_once()
+
+    @override_settings(HOME_STATS_TIMEOUT=0, HOME_STATS_STALE=60)
+    def test_home_stats_are_served_stale_while_refreshing(self):
+        Paste.objects.create(content='x' * 10)
+        self.assertContains(self.client.get('/'), 'id="total-pastes">1<')
+
+        Paste.objects.create(content='y' * 10)
+        cache.delete(SiteStats.CACHE_KEY)
+        # Another request is already rebuilding the fragment
+        cache.add(f"{pagecache._key('home_stats')}_refresh", 1)
+        self.assertContains(self.client.get('/'), 'id="total-pastes">1<')
+
+        cache.delete(f"{pagecache._key('home_stats')}_refresh")
+        self.assertContains(self.client.get('/'), 'id="total-pastes">2<')
+
+
+class ReplicaRouterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        pastecache.clear_local()
+
+    @override_settings(DATABASE_REPLICAS=['replica1'])
+    def test_writes_pin_the_client_to_the_primary(self):
+        self.assertEqual(dbrouter.ReplicaRouter().db_for_read(Paste), 'default')
+        response = self.client.post('/new', {'title': '', 'content': 'hi', 'language': 'plaintext'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.cookies[dbrouter.PIN_COOKIE]['max-age'], settings.READ_AFTER_WRITE_SECONDS)
+
+    @override_settings(DATABASE_REPLICAS=['default'], VIEW_COUNT_BUFFERED=False)
+    def test_counting_a_view_does_not_pin(self):
+        paste = Paste.objects.create(content='hi')
+        response = self.client.get(f'/p/{paste.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(dbrouter.PIN_COOKIE, response.cookies)
+        paste.refresh_from_db()
+        self.assertEqual(paste.views, 1)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_pin_cookie_without_replicas(self):
+        response = self.client.post('/new', {'title': '', 'content': 'hi', 'language': 'plaintext'})
+        self.assertNotIn(dbrouter.PIN_COOKIE, response.cookies)
+
+
+@skipUnless(settings.DATABASE_REPLICAS, "set DATABASE_REPLICA_URLS to test against a replica")
+class ReplicaReadTests(TestCase):
+    # Run on their own with two SQLite databases, see settings.py. The test
+    # replica is a separate database with nothing replicated to it, so a
+    # paste only exists where it was written.
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        pastecache.clear_local()
+
+    def test_reads_go_to_a_replica(self):
+        paste = Paste.objects.create(content='only on the primary')
+        self.assertEqual(self.client.get(f'/p/{paste.id}/raw/').status_code, 404)
+
+    def test_reads_after_a_create_go_to_the_primary(self):
+        response = self.client.post('/new', {'title': '', 'content': 'mine', 'language': 'plaintext'})
+        self.assertEqual(self.client.get(response['Location']).status_code, 200)
+        self.assertEqual(self.client.get(response['Location'] + 'raw/').content, b'mine')
+
+
+class CorpusTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = f'{directory.name}/pastes.ndjson.gz'
+
+    def test_export_then_import(self):
+        old = timezone.now() - timedelta(days=30)
+        first = Paste.objects.create(title='héllo', content='line one\nline two', language='python')
+        Paste.objects.filter(pk=first.pk).update(created_at=old)
+        Paste.objects.create(content='gone', expires_at=timezone.now() - timedelta(days=1))
+        call_command('export_pastes', self.path, '--chunk-size', '1', stderr=io.StringIO())
+        with gzip.open(self.path, 'rt') as f:
+            self.assertEqual(len(f.readlines()), 2)
+
+        # Into a fresh database; lifetime totals would otherwise count them twice
+        Paste.objects.all().delete()
+        SiteStats.objects.all().delete()
+        call_command('import_pastes', self.path, stdout=io.StringIO(), stderr=io.StringIO())
+        paste = Paste.objects.get(pk=first.pk)
+        self.assertEqual((paste.title, paste.content, paste.language), ('héllo', 'line one\nline two', 'python'))
+        self.assertEqual(paste.created_at, old)
+        self.assertEqual(SiteStats.objects.get(pk=1).total_pastes, 2)
+
+        # Everything is there already
+        out = io.StringIO()
+        call_command('import_pastes', self.path, stdout=out, stderr=io.StringIO())
+        self.assertIn('imported 0 pastes, skipped 2', out.getvalue())
+
+    def test_external_bodies_are_streamed_into_the_export(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        content = ''.join(f'line {i} ✓ "quoted"\n' for i in range(10000))
+        with override_settings(PASTE_BLOB_STORE=directory.name, PASTE_BLOB_EXTERNAL_SIZE=4096):
+            big = Paste.objects.create(content=content)
+            small = Paste.objects.create(content='small')
+            out = io.BytesIO()
+            self.assertEqual(corpus.export_pastes(out), 2)
+        records = {record['id']: record for record in map(json.loads, out.getvalue().splitlines())}
+        self.assertEqual(records[big.id]['content'], content)
+        self.assertEqual(records[small.id]['content'], 'small')
+        self.assertEqual(list(records[big.id]), list(records[small.id]))
+
+    @override_settings(PASTE_FILTER_MAX_AGE=3600)
+    def test_imports_leave_no_fingerprints_or_markers(self):
+        paste = Paste.objects.create(content=DedupTests.TEXT)
+        call_command('export_pastes', self.path, stderr=io.StringIO())
+        Paste.objects.all().delete()
+        PasteFingerprint.objects.all().delete()
+        pastefilter.build()
+        cache.delete(pastefilter._marker_key(paste.id))
+
+        built_at = cache.get(pastefilter.BUILT_AT_KEY)
+        with gzip.open(self.path, 'rb') as stream:
+            corpus.import_pastes(corpus.read_lines(stream))
+        self.assertFalse(PasteFingerprint.objects.exists())
+        self.assertIsNone(cache.get(pastefilter._marker_key(paste.id)))
+        # The filter is rebuilt with the imported pastes
+        self.assertNotEqual(cache.get(pastefilter.BUILT_AT_KEY), built_at)
+        pastefilter.clear_local()
+        self.assertTrue(pastefilter.might_exist(paste.id))
+
+    def test_import_resumes_from_checkpoint_and_renames_conflicts(self):
+        for n in range(3):
+            Paste.objects.create(content=f'paste {n}')
+        call_command('export_pastes', self.path, '--live', stderr=io.StringIO())
+        with open(self.path + '.checkpoint', 'w') as f:
+            f.write('1')
+
+        call_command('import_pastes', self.path, '--on-conflict', 'new-id', stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertEqual(Paste.objects.count(), 5)
+        self.assertFalse(os.path.exists(self.path + '.checkpoint'))
+
+
+class TrendingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        pastecache.clear_local()
+        trending._counter.take()
+
+    def test_sketch_never_undercounts_and_merges(self):
+        sketch = trending.CountMinSketch(width=64, depth=3)
+        for n in range(500):
+            sketch.add(f'paste{n % 50}')
+        self.assertTrue(all(sketch.estimate(f'paste{n}') >= 10 for n in range(50)))
+        other = trending.CountMinSketch.from_bytes(sketch.to_bytes(), width=64, depth=3)
+        other.merge(sketch)
+        self.assertEqual(other.estimate('paste0'), 2 * sketch.estimate('paste0'))
+
+    @override_settings(TRENDING_MERGE_INTERVAL=0)
+    def test_most_viewed_live_pastes_first(self):
+        hot = Paste.objects.create(title='hot', content='a')
+        warm = Paste.objects.create(title='warm', content='b')
+        gone = Paste.objects.create(content='c')
+        for paste, views in ((hot, 3), (warm, 1), (gone, 5)):
+            for _ in range(views):
+                self.client.get(f'/p/{paste.id}/')
+        Paste.objects.filter(pk=gone.pk).update(expires_at=timezone.now() - timedelta(days=1))
+
+        pastes = self.client.get('/trending.json').json()['pastes']
+        self.assertEqual([paste['id'] for paste in pastes], [hot.id, warm.id])
+        self.assertEqual(pastes[0]['score'], 3)
+        self.assertContains(self.client.get('/trending'), 'hot')
+
+
+class DedupTests(TestCase):
+    TEXT = (
+        "Buy cheap watches online today, limited offer for our loyal visitors, "
+        "click the link below and enter your card number to claim the prize "
+        "before midnight, only three hundred left in stock so hurry up now"
+    )
+
+    def form(self, content):
+        return PasteForm({'title': '', 'content': content, 'language': 'plaintext'})
+
+    def test_signature_estimates_similarity(self):
+        original = dedup.signature(self.TEXT)
+        mutated = dedup.signature(self.TEXT.replace('three', 'four'))
+        unrelated = dedup.signature("def add(a, b):\n    return a + b\n\nprint(add(2, 40))")
+        self.assertIsNone(dedup.signature('too short'))
+        self.assertEqual(dedup.unpack(dedup.pack(original)), tuple(original))
+        self.assertGreaterEqual(dedup.similarity(original, mutated), 0.7)
+        self.assertLess(dedup.similarity(original, unrelated), 0.2)
+
+    def test_rejects_near_duplicates_past_max_copies(self):
+        for n in range(settings.DEDUP_MAX_COPIES):
+            form = self.form(self.TEXT.replace('three', str(n)))
+            self.assertTrue(form.is_valid())
+            form.save()
+        self.assertEqual(len(dedup.check(self.TEXT, None).similar), settings.DEDUP_MAX_COPIES)
+        self.assertFalse(self.form(self.TEXT.upper()).is_valid())
+        self.assertTrue(self.form("Something else entirely, a shopping list: eggs, milk and bread").is_valid())
+
+    def test_exact_copies_and_old_pastes(self):
+        first = Paste.objects.create(content=self.TEXT)
+        self.assertEqual(dedup.check(self.TEXT, first.blob_id).similar, [(first.id, 1.0)])
+        with override_settings(DEDUP_WINDOW=0):
+            self.assertEqual(dedup.check(self.TEXT, first.blob_id).similar, [])
+            self.assertEqual(dedup.prune(), 1)
+
+    def test_short_pastes_are_never_counted(self):
+        for _ in range(settings.DEDUP_MAX_COPIES + 1):
+            form = self.form('hello world')
+            self.assertTrue(form.is_valid())
+            form.save()
+        response = self.post_bulk([{'content': 'hello world'}] * (settings.DEDUP_MAX_COPIES + 1))
+        self.assertEqual(response.status_code, 201)
+
+    def post_bulk(self, pastes):
+        _, key = ApiToken.create_token('ci')
+        return self.client.post(
+            '/api/pastes/bulk', json.dumps({'pastes': pastes}),
+            content_type='application/json', HTTP_AUTHORIZATION=f'Token {key}',
+        )
+
+    def test_copies_in_one_batch_count_against_each_other(self):
+        copies = [{'content': f'{self.TEXT} ref{n}'} for n in range(settings.DEDUP_MAX_COPIES + 1)]
+        response = self.post_bulk(copies)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.json()['errors']), [str(settings.DEDUP_MAX_COPIES)])
+        self.assertEqual(Paste.objects.count(), 0)
+        self.assertEqual(self.post_bulk(copies[:-1]).status_code, 201)
+
+    @override_settings(DEDUP_ACTION='flag', DEDUP_MAX_COPIES=1)
+    def test_flagged_batch_copy_points_at_its_original(self):
+        response = self.post_bulk([{'content': self.TEXT}, {'content': self.TEXT.upper()}])
+        first, second = [paste['id'] for paste in response.json()['pastes']]
+        self.assertEqual(PasteFingerprint.objects.get(pk=second).similar_to, first)
+
+    @override_settings(DEDUP_ACTION='flag', DEDUP_MAX_COPIES=1)
+    def test_flag_saves_and_marks(self):
+        first = Paste.objects.create(content=self.TEXT)
+        form = self.form(self.TEXT)
+        self.assertTrue(form.is_valid())
+        with self.assertLogs('app.dedup', 'WARNING'):
+            second = form.save()
+        self.assertEqual(PasteFingerprint.objects.get(pk=second.pk).similar_to, first.id)
+
+
+class PasteFilterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        pastecache.clear_local()
+        pastefilter.clear_local()
+        self.addCleanup(pastefilter.clear_local)
+        metrics.registry.reset()
+
+    def test_bloom_filter(self):
+        bloom = pastefilter.BloomFilter.for_capacity(1000, 0.01)
+        for n in range(1000):
+            bloom.add(f'id{n}')
+        self.assertTrue(all(f'id{n}' in bloom for n in range(1000)))
+        false_positives = sum(f'other{n}' in bloom for n in range(10000))
+        self.assertLess(false_positives, 300)
+        self.assertIn('id1', pastefilter.BloomFilter.from_dict(bloom.to_dict()))
+
+    def test_missing_ids_skip_database(self):
+        old = Paste.objects.create(content='before the build')
+        pastefilter.build()
+        cache.delete(pastefilter._marker_key(old.id))
+        new = Paste.objects.create(content='after the build')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/p/AAAAAAAA/raw/').status_code, 404)
+        stats = pastecache.stats()
+        self.assertEqual((stats['filtered'], stats['misses'], stats['hit_ratio']), (1, 0, 0.0))
+        self.assertIn('result="filtered"} 1', metrics.registry.render())
+        # Another worker has neither paste in its filter, but finds the new one's marker
+        pastefilter.clear_local()
+        self.assertEqual(self.client.get(f'/p/{old.id}/raw/').status_code, 200)
+        self.assertEqual(self.client.get(f'/p/{new.id}/').status_code, 200)
+
+    def test_stale_filter_is_ignored(self):
+        pastefilter.build()
+        self.assertFalse(pastefilter.might_exist('AAAAAAAA'))
+        with mock.patch('time.time', return_value=time.time() + settings.PASTE_FILTER_MAX_AGE + 1):
+            self.assertTrue(pastefilter.might_exist('AAAAAAAA'))
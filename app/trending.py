@@ -0,0 +1,218 @@
+"""
+Trending pastes from a Count-Min Sketch of recent views.
+
+Time is split into windows of TRENDING_WINDOW seconds. Each process
+counts the views it serves in a small Count-Min Sketch and keeps the
+pastes with the highest estimates as top-K candidates. Every
+TRENDING_MERGE_INTERVAL seconds, and when the window rolls over, it
+merges them into the window's shared sketch in the cache and resets its
+own.
+
+A paste's score is its estimated views in each of the last
+TRENDING_WINDOWS windows, weighted by TRENDING_DECAY per window of age.
+Only the stored candidates are scored, so building the list costs O(K)
+whatever the number of pastes, and each window's sketch has a fixed
+size.
+"""
+import hashlib
+import heapq
+import threading
+import time
+from array import array
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import Paste
+
+WIDTH = 2048
+DEPTH = 4
+
+LIST_KEY = 'trending_list'
+
+
+class CountMinSketch:
+    """Approximate counts that never undercount, in WIDTH x DEPTH counters"""
+
+    def __init__(self, width=WIDTH, depth=DEPTH, counts=None):
+        self.width = width
+        self.depth = depth
+        self.counts = counts if counts is not None else array('I', bytes(4 * width * depth))
+
+    def _cells(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [row * self.width + (first + row * second) % self.width for row in range(self.depth)]
+
+    def add(self, key, count=1):
+        """Count key. Returns its new estimate."""
+        cells = self._cells(key)
+        for cell in cells:
+            self.counts[cell] += count
+        return min(self.counts[cell] for cell in cells)
+
+    def estimate(self, key):
+        return min(self.counts[cell] for cell in self._cells(key))
+
+    def merge(self, other):
+        for cell, count in enumerate(other.counts):
+            if count:
+                self.counts[cell] += count
+
+    def to_bytes(self):
+        return self.counts.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data, width=WIDTH, depth=DEPTH):
+        counts = array('I')
+        counts.frombytes(data)
+        return cls(width, depth, counts)
+
+
+def _top(candidates, limit):
+    """The limit highest (paste_id, count) pairs"""
+    return dict(heapq.nlargest(limit, candidates.items(), key=lambda item: item[1]))
+
+
+def current_window():
+    return int(time.time() // settings.TRENDING_WINDOW)
+
+
+def _window_key(window):
+    return f"trending_{window}"
+
+
+class Counter:
+    """This process's views not yet merged into the shared sketches"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.pending = []
+        self.last_merge = time.monotonic()
+        self._reset(current_window())
+
+    def _reset(self, window):
+        self.window = window
+        self.sketch = CountMinSketch()
+        self.candidates = {}
+
+    def _add_candidates(self, paste_ids):
+        for paste_id in paste_ids:
+            self.candidates[paste_id] = self.sketch.estimate(paste_id)
+        if len(self.candidates) > 2 * settings.TRENDING_SIZE:
+            self.candidates = _top(self.candidates, settings.TRENDING_SIZE)
+
+    def record(self, paste_id):
+        """Count a view. Returns True when it's time to merge."""
+        window = current_window()
+        with self._lock:
+            if window != self.window:
+                if self.candidates:
+                    self.pending.append((self.window, self.sketch, self.candidates))
+                self._reset(window)
+            self.sketch.add(paste_id)
+            self._add_candidates([paste_id])
+            return bool(self.pending) or time.monotonic() - self.last_merge >= settings.TRENDING_MERGE_INTERVAL
+
+    def take(self):
+        """Hand over the unmerged counts as a list of (window, sketch, candidates)"""
+        with self._lock:
+            taken = self.pending
+            if self.candidates:
+                taken.append((self.window, self.sketch, self.candidates))
+            self.pending = []
+            self._reset(self.window)
+            self.last_merge = time.monotonic()
+            return taken
+
+    def put_back(self, window, sketch, candidates):
+        """Keep counts that couldn't be merged, to try again next time"""
+        with self._lock:
+            if window == self.window:
+                self.sketch.merge(sketch)
+                self._add_candidates(candidates)
+            elif window > current_window() - settings.TRENDING_WINDOWS:
+                self.pending.append((window, sketch, candidates))
+
+
+_counter = Counter()
+
+
+def _merge_window(window, sketch, candidates):
+    """Add counts to the shared sketch for their window. False if it's busy."""
+    key = _window_key(window)
+    lock = f"{key}_lock"
+    if not cache.add(lock, 1, timeout=5):
+        return False
+    try:
+        shared = cache.get(key)
+        if shared is None:
+            merged, shared_candidates = sketch, {}
+        else:
+            merged = CountMinSketch.from_bytes(shared[0])
+            merged.merge(sketch)
+            shared_candidates = shared[1]
+        scores = {paste_id: merged.estimate(paste_id) for paste_id in {*shared_candidates, *candidates}}
+        timeout = settings.TRENDING_WINDOW * (settings.TRENDING_WINDOWS + 1)
+        cache.set(key, (merged.to_bytes(), _top(scores, 2 * settings.TRENDING_SIZE)), timeout=timeout)
+    finally:
+        cache.delete(lock)
+    return True
+
+
+def merge():
+    """Merge this process's counts into the cache"""
+    for window, sketch, candidates in _counter.take():
+        if not _merge_window(window, sketch, candidates):
+            _counter.put_back(window, sketch, candidates)
+
+
+def record_view(paste_id):
+    """Count a view of a paste, merging into the cache when due"""
+    if _counter.record(paste_id):
+        merge()
+
+
+async def arecord_view(paste_id):
+    """Async record_view()"""
+    if _counter.record(paste_id):
+        await sync_to_async(merge)()
+
+
+def top(limit=None):
+    """[(paste_id, score)] for the highest scoring candidates, best first"""
+    limit = limit or settings.TRENDING_SIZE
+    now = current_window()
+    windows = {_window_key(window): now - window for window in range(now - settings.TRENDING_WINDOWS + 1, now + 1)}
+    scores = {}
+    shared = cache.get_many(list(windows))
+    sketches = [
+        (settings.TRENDING_DECAY ** windows[key], CountMinSketch.from_bytes(data))
+        for key, (data, _) in shared.items()
+    ]
+    for _, candidates in shared.values():
+        for paste_id in candidates:
+            if paste_id not in scores:
+                scores[paste_id] = sum(weight * sketch.estimate(paste_id) for weight, sketch in sketches)
+    return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+
+def trending():
+    """Live trending pastes, best first, as dicts with their score; cached briefly"""
+    pastes = cache.get(LIST_KEY)
+    if pastes is None:
+        ranked = top()
+        found = {
+            paste['id']: paste
+            for paste in Paste.objects.filter(pk__in=[paste_id for paste_id, _ in ranked], expires_at__gt=timezone.now())
+            .values('id', 'title', 'language', 'created_at')
+        }
+        pastes = [
+            {**found[paste_id], 'score': round(score, 2)}
+            for paste_id, score in ranked if paste_id in found
+        ]
+        cache.set(LIST_KEY, pastes, timeout=settings.TRENDING_MERGE_INTERVAL)
+    return pastes
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, metrics, views
 
 urlpatterns = [
     path("", views.home, name="home"),
@@ -9,7 +9,15 @@ urlpatterns = [
     path("contact", views.contact, name="contact"),
     path("pricing", views.pricing, name="pricing"),
     path("terms", views.terms, name="terms"),
+    path("search", views.search_pastes, name="search_pastes"),
+    path("trending", views.trending_pastes, name="trending"),
+    path("trending.json", views.trending_json, name="trending_json"),
+    path("metrics", metrics.metrics_view, name="metrics"),
+    path("status/history.json", views.uptime_history, name="uptime_history"),
     path('p/<str:paste_id>/', views.view_paste, name='view_paste'),
+    path('p/<str:paste_id>/lines', views.paste_lines, name='paste_lines'),
     path('p/<str:paste_id>/raw/', views.raw_paste, name='raw_paste'),
     path('p/<str:paste_id>/clone/', views.clone_paste, name='clone_paste'),
+    path('api/pastes', api.get_pastes, name='api_get_pastes'),
+    path('api/pastes/bulk', api.bulk_create_pastes, name='api_bulk_create_pastes'),
 ]
@@ -0,0 +1,161 @@
+"""
+Write-behind buffer for paste view counts.
+
+Views are counted with atomic cache increments instead of an UPDATE per
+page view. Time is split into generations of VIEW_COUNT_FLUSH_INTERVAL
+seconds; each generation keeps its own counters plus a list of the paste
+IDs it touched. `flush_views` adds the counters of every closed generation
+to `Paste.views` in a handful of bulk UPDATEs.
+
+Counters expire after VIEW_COUNT_MAX_LAG generations, so if the flusher
+stops running we lose at most that many intervals of views.
+
+The buffer only works when the cache is shared with the flusher, so
+without VIEW_COUNT_BUFFERED (no Redis) each view is a plain UPDATE. It
+doesn't pin the viewer to the primary (see dbrouter.py).
+"""
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+
+from . import dbrouter
+from .models import Paste
+
+FLUSHED_KEY = 'paste_views_flushed'
+LOCK_KEY = 'paste_views_flush_lock'
+
+
+def current_generation():
+    return int(time.time() // settings.VIEW_COUNT_FLUSH_INTERVAL)
+
+
+def _key_timeout():
+    return settings.VIEW_COUNT_FLUSH_INTERVAL * (settings.VIEW_COUNT_MAX_LAG + 1)
+
+
+def _count_key(generation, paste_id):
+    return f"paste_views_{generation}_{paste_id}"
+
+
+def _dirty_count_key(generation):
+    return f"paste_views_{generation}_dirty"
+
+
+def _dirty_key(generation, n):
+    return f"paste_views_{generation}_dirty_{n}"
+
+
+def _incr(key, timeout):
+    """Atomically increment key, creating it if missing. Returns new value."""
+    if cache.add(key, 1, timeout=timeout):
+        return 1
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Expired between add() and incr()
+        cache.add(key, 1, timeout=timeout)
+        return 1
+
+
+async def _aincr(key, timeout):
+    """Async _incr()"""
+    if await cache.aadd(key, 1, timeout=timeout):
+        return 1
+    try:
+        return await cache.aincr(key)
+    except ValueError:
+        await cache.aadd(key, 1, timeout=timeout)
+        return 1
+
+
+def record_view(paste_id):
+    """Buffer one view of a paste. Returns the views buffered this generation."""
+    if not settings.VIEW_COUNT_BUFFERED:
+        with dbrouter.unpinned():
+            Paste.objects.filter(pk=paste_id).update(views=F('views') + 1)
+        return 1
+    generation = current_generation()
+    timeout = _key_timeout()
+    count = _incr(_count_key(generation, paste_id), timeout)
+    if count == 1:
+        # First view in this generation, remember the ID for the flusher
+        n = _incr(_dirty_count_key(generation), timeout)
+        cache.set(_dirty_key(generation, n), paste_id, timeout=timeout)
+    return count
+
+
+async def arecord_view(paste_id):
+    """Async record_view()"""
+    if not settings.VIEW_COUNT_BUFFERED:
+        with dbrouter.unpinned():
+            await Paste.objects.filter(pk=paste_id).aupdate(views=F('views') + 1)
+        return 1
+    generation = current_generation()
+    timeout = _key_timeout()
+    count = await _aincr(_count_key(generation, paste_id), timeout)
+    if count == 1:
+        n = await _aincr(_dirty_count_key(generation), timeout)
+        await cache.aset(_dirty_key(generation, n), paste_id, timeout=timeout)
+    return count
+
+
+def _collect(generation):
+    """Get {paste_id: views} buffered in a generation and clear it"""
+    dirty_total = cache.get(_dirty_count_key(generation)) or 0
+    if not dirty_total:
+        return {}
+
+    dirty_keys = [_dirty_key(generation, n) for n in range(1, dirty_total + 1)]
+    paste_ids = [pid for pid in cache.get_many(dirty_keys).values() if pid]
+    count_keys = {_count_key(generation, pid): pid for pid in paste_ids}
+    counts = cache.get_many(list(count_keys))
+
+    cache.delete_many(dirty_keys + list(count_keys) + [_dirty_count_key(generation)])
+    return {count_keys[key]: value for key, value in counts.items() if value}
+
+
+def _apply(counts):
+    """Add buffered views to the database, one UPDATE per distinct increment"""
+    by_increment = defaultdict(list)
+    for paste_id, views in counts.items():
+        by_increment[views].append(paste_id)
+
+    for views, paste_ids in by_increment.items():
+        for start in range(0, len(paste_ids), 500):
+            Paste.objects.filter(pk__in=paste_ids[start:start + 500]).update(
+                views=F('views') + views
+            )
+
+
+def flush(include_current=False):
+    """Write every closed generation to the database.
+
+    include_current also drains the generation still being written to (for
+    shutdown and tests); views landing while it is drained can be lost.
+    Returns the number of views flushed, or None if another flusher holds
+    the lock.
+    """
+    if not cache.add(LOCK_KEY, 1, timeout=settings.VIEW_COUNT_FLUSH_INTERVAL):
+        return None
+
+    try:
+        current = current_generation()
+        last = current if include_current else current - 1
+        first = cache.get(FLUSHED_KEY)
+        # Older generations have expired, don't walk them after an outage
+        oldest = last - settings.VIEW_COUNT_MAX_LAG
+        first = oldest if first is None else max(first + 1, oldest)
+
+        counts = defaultdict(int)
+        for generation in range(first, last + 1):
+            for paste_id, views in _collect(generation).items():
+                counts[paste_id] += views
+
+        _apply(counts)
+        cache.set(FLUSHED_KEY, current - 1, timeout=None)
+        return sum(counts.values())
+    finally:
+        cache.delete(LOCK_KEY)
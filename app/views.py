@@ -1,25 +1,29 @@
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
 from django.shortcuts import render, redirect, get_object_or_404
+from django.template.loader import render_to_string
+from django.urls import reverse
 from django.http import HttpResponse, Http404, JsonResponse
 from django.views.decorators.http import require_GET
+from django.conf import settings
 from django.core.cache import cache
 from django.utils import timezone
+from django.utils.safestring import mark_safe
 from django.views.decorators.http import require_http_methods
 from django.db.models import Avg, Count, Q
-from .models import Paste
+from .models import Paste, SiteStats
 from .forms import PasteForm
+from .pagecache import cached_page
+from .ratelimit import get_client_ip, rate_limit
+from .responses import raw_response
+from . import highlight, lines, pagecache, pastecache, rollups, search, trending, viewcounts
 import uuid
 import time
 from datetime import datetime
 
-def get_client_ip(request):
-    """Get client IP address"""
-    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-    if x_forwarded_for:
-        ip = x_forwarded_for.split(',')[0]
-    else:
-        ip = request.META.get('REMOTE_ADDR')
-    return ip
+HOME_STATS_MARKER = '<!-- home stats -->'
 
+@cached_page('advtest')
 def advtest(request):
     return render(request, "advtest.html")
 
@@ -27,14 +31,16 @@ def ads_txt(request):
     content = "google.com, pub-5653411333184686, DIRECT, f08c47fec0942fa0"
     return HttpResponse(content, content_type='text/plain')
 
+@cached_page('pricing')
 def pricing(request):
     return render(request, "pricing.html")
 
-def home(request):
-    """Landing page with stats"""
-    total_pastes = Paste.get_total_pastes()
-    total_chars = Paste.get_total_characters()
-    active_pastes = Paste.get_active_pastes()
+def _home_stats():
+    """Render the home page stats fragment"""
+    stats = SiteStats.get_cached()
+    total_pastes = stats['total_pastes']
+    total_chars = stats['total_characters']
+    active_pastes = stats['active_pastes']
     
     # Format numbers nicely
     if total_chars > 1000000:
@@ -56,100 +62,178 @@ def home(request):
     else:
         avg_size = 0
     
-    context = {
-        'current_year': datetime.now().year,
+    return render_to_string('home_stats.html', {
         'total_pastes': total_pastes,
         'total_chars': total_chars,
         'chars_display': chars_display,
         'active_pastes': active_pastes,
-        'paste_progress': paste_progress,  # Add this
-        'avg_size': avg_size,  # Add this
-    }
-    return render(request, 'home.html', context)
+        'paste_progress': paste_progress,
+        'avg_size': avg_size,
+    })
 
+async def home(request):
+    """Landing page with stats: a cached shell with the stats fragment spliced in"""
+    year = datetime.now().year
+    shell = await pagecache.aget_fragment(
+        f'home_{year}',
+        lambda: render_to_string('home.html', {
+            'current_year': year,
+            'stats_html': mark_safe(HOME_STATS_MARKER),
+        }, request=request),
+        settings.PAGE_CACHE_TIMEOUT,
+    )
+    stats_html = await pagecache.aget_fragment(
+        'home_stats', _home_stats, settings.HOME_STATS_TIMEOUT, settings.HOME_STATS_STALE,
+    )
+    return HttpResponse(shell.replace(HOME_STATS_MARKER, stats_html))
+
+@cached_page('contact')
 def contact(request):
     return render(request, "contact.html")
 
+@cached_page('terms')
 def terms(request):
     return render(request, "terms.html")
 
 def status_page(request):
     return render(request, "status.html")
 
+@require_GET
+def search_pastes(request):
+    """Full-text search over live pastes, as JSON"""
+    query = request.GET.get('q', '')[:200]
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+    
+    results, has_next = search.search(query, page=page)
+    for result in results:
+        result['url'] = reverse('view_paste', args=[result['id']])
+    return JsonResponse({
+        'query': query,
+        'page': page,
+        'has_next': has_next,
+        'results': results,
+    })
+
+@require_GET
+def trending_pastes(request):
+    """Most viewed pastes lately"""
+    return render(request, 'trending.html', {'pastes': trending.trending()})
+
+@require_GET
+def trending_json(request):
+    """trending_pastes() as JSON"""
+    pastes = [
+        {**paste, 'url': reverse('view_paste', args=[paste['id']])}
+        for paste in trending.trending()
+    ]
+    return JsonResponse({'pastes': pastes})
+
+@require_GET
+def uptime_history(request):
+    """90 days of daily uptime per service, from the rollup tables only"""
+    history = cache.get('uptime_history')
+    if history is None:
+        history = rollups.daily_history(days=90)
+        cache.set('uptime_history', history, timeout=300)
+    return JsonResponse({'days': 90, 'services': history})
+
+def rate_limited_form(request, retry_after):
+    """Show the rate limit error on the form"""
+    form = PasteForm(request.POST)
+    form.add_error(None, f"Rate limit: Please wait {retry_after} seconds before creating another paste")
+    return render(request, 'new.html', {'form': form}, status=429)
+
 @require_http_methods(["GET", "POST"])
+@rate_limit('create_paste', on_limit=rate_limited_form,
+            refund_if=lambda response: response.status_code != 302)
 def create_paste(request):
     """Create a new paste"""
-    
-    # RATE LIMITING: Check if IP has created a paste in last minute
-    if request.method == 'POST':
-        client_ip = get_client_ip(request)
-        cache_key = f"paste_limit_{client_ip}"
-        
-        # Check if IP is rate limited
-        last_paste_time = cache.get(cache_key)
-        
-        if last_paste_time:
-            time_passed = timezone.now() - last_paste_time
-            if time_passed.total_seconds() < 30:  # 1 minute cooldown
-                seconds_left = 30 - int(time_passed.total_seconds())
-                
-                # Show error message on the form
-                form = PasteForm(request.POST)
-                form.add_error(None, f"Rate limit: Please wait {seconds_left} seconds before creating another paste")
-                return render(request, 'new.html', {'form': form})
-    
     if request.method == 'POST':
         form = PasteForm(request.POST)
         if form.is_valid():
             paste = form.save()
-            
-            # Set rate limit for this IP (1 minute)
-            client_ip = get_client_ip(request)
-            cache_key = f"paste_limit_{client_ip}"
-            cache.set(cache_key, timezone.now(), timeout=60)
-            
             return redirect('view_paste', paste_id=paste.id)
     else:
         form = PasteForm()
     
     return render(request, 'new.html', {'form': form})
 
-def view_paste(request, paste_id):
+async def view_paste(request, paste_id):
     """View a specific paste"""
     try:
-        paste = get_object_or_404(Paste, id=paste_id)
+        paste = await pastecache.aget_paste(paste_id)
         
         if paste.is_expired():
             raise Http404("This paste has expired")
         
-        content_lines = paste.content.split('\n')
+        # Highlighted HTML and gutter are rendered once and cached
+        rendered = await sync_to_async(highlight.rendered, thread_sensitive=False)(paste)
         
-        paste.views += 1
-        paste.save(update_fields=['views'])
+        # Buffered, flushed to the database by `manage.py flush_views`
+        paste.views += await viewcounts.arecord_view(paste.id)
+        await trending.arecord_view(paste.id)
         
         return render(request, 'view.html', {
             'paste': paste,
-            'content_lines': content_lines,
+            'line_count': rendered['line_count'],
+            'total_lines': rendered['total_lines'],
+            'next_start': rendered['next_start'],
+            'gutter': rendered['gutter'],
+            'highlighted': rendered['html'],
+            'client_highlight': rendered['client_highlight'],
+            'highlight_css': highlight.style_css(),
             'is_code': paste.language != 'plaintext',
         })
         
     except Exception:
         raise Http404("Paste not found")
 
-def raw_paste(request, paste_id):
+@require_GET
+def paste_lines(request, paste_id):
+    """Get a window of lines of a big paste as JSON"""
+    paste = pastecache.get_paste(paste_id)
+    
+    if paste.is_expired():
+        raise Http404("This paste has expired")
+    
+    try:
+        start = int(request.GET.get('start', 0))
+        count = int(request.GET.get('count', settings.LARGE_PASTE_WINDOW))
+    except ValueError:
+        return JsonResponse({'error': 'start and count must be integers'}, status=400)
+    
+    total_lines = len(lines.line_offsets(paste))
+    if start < 0 or start >= total_lines or count < 1:
+        return JsonResponse({'error': 'line window out of range'}, status=400)
+    
+    count = min(count, settings.LARGE_PASTE_MAX_WINDOW)
+    rendered = highlight.rendered_window(paste, start, count)
+    return JsonResponse({
+        'start': start,
+        'count': rendered['line_count'],
+        'total_lines': rendered['total_lines'],
+        'next_start': rendered['next_start'],
+        'html': rendered['html'],
+        'gutter': rendered['gutter'],
+    })
+
+async def raw_paste(request, paste_id):
     """Get raw paste content"""
-    paste = get_object_or_404(Paste, id=paste_id)
+    paste = await pastecache.aget_paste(paste_id)
     
     if paste.is_expired():
         raise Http404("This paste has expired")
     
-    response = HttpResponse(paste.content, content_type='text/plain; charset=utf-8')
-    response['X-Content-Type-Options'] = 'nosniff'
-    return response
+    # Streamed under ASGI so slow clients don't hold up a worker
+    stream = isinstance(request, ASGIRequest)
+    return await sync_to_async(raw_response, thread_sensitive=False)(request, paste, stream=stream)
 
-def clone_paste(request, paste_id):
+async def clone_paste(request, paste_id):
     """Clone an existing paste"""
-    original = get_object_or_404(Paste, id=paste_id)
+    original = await pastecache.aget_paste(paste_id)
     
     if original.is_expired():
         raise Http404("This paste has expired")
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'skibin.settings')
+# Read by settings to pick connection defaults that suit ASGI
+os.environ.setdefault('SKIBIN_ASGI', '1')
 
 application = get_asgi_application()
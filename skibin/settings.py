@@ -12,6 +12,9 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 
 from pathlib import Path
 import os
+import sys
+
+import dj_database_url
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 NPM_BIN_PATH = r"D:\nodejs\npm.cmd"
@@ -51,7 +54,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'app.metrics.MetricsMiddleware',
+    'app.dbrouter.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -83,16 +89,192 @@ WSGI_APPLICATION = 'skibin.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': os.environ.get('PGDATABASE'),
-        'USER': os.environ.get('PGUSER'),
-        'PASSWORD': os.environ.get('PGPASSWORD'),
-        'HOST': os.environ.get('PGHOST'),
-        'PORT': os.environ.get('PGPORT'),
+# The primary is DATABASE_URL if set, otherwise Postgres from the PG* variables.
+
+if os.environ.get('DATABASE_URL'):
+    DATABASES = {'default': dj_database_url.parse(os.environ['DATABASE_URL'])}
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('PGDATABASE'),
+            'USER': os.environ.get('PGUSER'),
+            'PASSWORD': os.environ.get('PGPASSWORD'),
+            'HOST': os.environ.get('PGHOST'),
+            'PORT': os.environ.get('PGPORT'),
+        }
+    }
+
+# Read replicas, a comma separated list of database URLs. GET requests read
+# from a random replica (see app/dbrouter.py); a client that has just written
+# reads from the primary for READ_AFTER_WRITE_SECONDS. Locally, two SQLite
+# files can stand in for a primary and a replica, which is how
+# app.tests.ReplicaReadTests is run:
+#   DATABASE_URL=sqlite:///primary.sqlite3 DATABASE_REPLICA_URLS=sqlite:///replica.sqlite3
+for number, url in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_URLS', '').split(',')), 1):
+    DATABASES[f'replica{number}'] = dj_database_url.parse(url.strip())
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['app.dbrouter.ReplicaRouter']
+READ_AFTER_WRITE_SECONDS = int(os.environ.get('READ_AFTER_WRITE_SECONDS', 10))
+
+# Connections are kept open for DB_CONN_MAX_AGE seconds and checked before
+# reuse. That only pays off under WSGI: under ASGI (skibin/asgi.py) sync code
+# runs in a changing set of threads, each holding its own connection, so
+# persistent ones pile up until the database runs out, and the default is 0.
+# With DB_POOL_MAX_SIZE set, Postgres connections come from a pool of
+# DB_POOL_MIN_SIZE to DB_POOL_MAX_SIZE connections per process instead, which
+# is the way to reuse them under ASGI (uses psycopg[pool]).
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 0 if os.environ.get('SKIBIN_ASGI') else 60))
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', 2))
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 0))
+for database in DATABASES.values():
+    database['CONN_HEALTH_CHECKS'] = True
+    if DB_POOL_MAX_SIZE and database['ENGINE'] == 'django.db.backends.postgresql':
+        database['CONN_MAX_AGE'] = 0
+        database.setdefault('OPTIONS', {})['pool'] = {'min_size': DB_POOL_MIN_SIZE, 'max_size': DB_POOL_MAX_SIZE}
+    else:
+        database['CONN_MAX_AGE'] = DB_CONN_MAX_AGE
+
+
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+# Counters and rate limits are shared between workers, so production should
+# point REDIS_URL at a shared Redis. Without it each process gets its own
+# local memory cache, which is only suitable for development.
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
     }
+
+# Rate limit policies, 'requests/period' with s, m, h or d periods. Counters
+# live in the cache with REDIS_URL; without it they are rows in the database
+# ('database'), so limits still hold across workers.
+RATE_LIMIT_STORE = 'cache' if os.environ.get('REDIS_URL') else 'database'
+# Clients are told apart by the address TRUSTED_PROXY_HOPS proxies from the
+# right of X-Forwarded-For (the one our own proxy added), or by REMOTE_ADDR
+# with 0 when nothing sits in front of the app.
+TRUSTED_PROXY_HOPS = int(os.environ.get('TRUSTED_PROXY_HOPS', 1))
+RATE_LIMITS = {
+    'create_paste': os.environ.get('RATE_LIMIT_CREATE_PASTE', '1/30s'),
+    'api': os.environ.get('RATE_LIMIT_API', '120/m'),
+}
+
+# Most pastes per JSON API request, created or fetched
+API_MAX_BATCH = int(os.environ.get('API_MAX_BATCH', 500))
+
+# Paste view counts are buffered in the cache and written to the database
+# in batches by `manage.py flush_views` every VIEW_COUNT_FLUSH_INTERVAL
+# seconds. Buffered counts not flushed within VIEW_COUNT_MAX_LAG intervals
+# are dropped. The buffer needs the cache shared with the flusher, so it is
+# only on with REDIS_URL; otherwise every view is a direct UPDATE.
+VIEW_COUNT_BUFFERED = bool(os.environ.get('REDIS_URL'))
+VIEW_COUNT_FLUSH_INTERVAL = int(os.environ.get('VIEW_COUNT_FLUSH_INTERVAL', 60))
+VIEW_COUNT_MAX_LAG = int(os.environ.get('VIEW_COUNT_MAX_LAG', 10))
+
+# Pastes are cached for PASTE_CACHE_TIMEOUT seconds in the shared cache and
+# PASTE_CACHE_LOCAL_TIMEOUT seconds in a per-process LRU of
+# PASTE_CACHE_LOCAL_SIZE entries, never past their expiry.
+PASTE_CACHE_TIMEOUT = int(os.environ.get('PASTE_CACHE_TIMEOUT', 3600))
+PASTE_CACHE_LOCAL_TIMEOUT = int(os.environ.get('PASTE_CACHE_LOCAL_TIMEOUT', 60))
+PASTE_CACHE_LOCAL_SIZE = int(os.environ.get('PASTE_CACHE_LOCAL_SIZE', 256))
+
+# Lookups of paste IDs missing from the filter built by `manage.py
+# rebuild_paste_filter` are 404s without a query. The filter is sized for
+# PASTE_FILTER_ERROR_RATE false positives and only trusted for
+# PASTE_FILTER_MAX_AGE seconds, so rebuild it more often than that (0 turns
+# it off). Workers look for a new one every PASTE_FILTER_CHECK_INTERVAL
+# seconds.
+PASTE_FILTER_ERROR_RATE = float(os.environ.get('PASTE_FILTER_ERROR_RATE', 0.01))
+PASTE_FILTER_MAX_AGE = int(os.environ.get('PASTE_FILTER_MAX_AGE', 3600))
+PASTE_FILTER_CHECK_INTERVAL = int(os.environ.get('PASTE_FILTER_CHECK_INTERVAL', 30))
+
+# Static pages are cached whole for PAGE_CACHE_TIMEOUT seconds under keys
+# that change on every deploy: PAGE_CACHE_VERSION if set, otherwise a hash
+# of the templates and the static files manifest. The home page stats are
+# rebuilt every HOME_STATS_TIMEOUT seconds and served up to HOME_STATS_STALE
+# seconds stale while that happens.
+PAGE_CACHE_VERSION = os.environ.get('PAGE_CACHE_VERSION', '')
+PAGE_CACHE_TIMEOUT = int(os.environ.get('PAGE_CACHE_TIMEOUT', 86400))
+HOME_STATS_TIMEOUT = int(os.environ.get('HOME_STATS_TIMEOUT', 30))
+HOME_STATS_STALE = int(os.environ.get('HOME_STATS_STALE', 300))
+
+# Workers keep a pool of PASTE_ID_POOL_SIZE pre-checked paste IDs, refilled
+# with one query when empty. 0 disables the pool.
+PASTE_ID_POOL_SIZE = int(os.environ.get('PASTE_ID_POOL_SIZE', 0))
+
+# Paste bodies are stored compressed with this codec, 'zlib' or 'zstd'
+# (zstd needs the zstandard package, otherwise zlib is used).
+PASTE_BLOB_CODEC = os.environ.get('PASTE_BLOB_CODEC', 'zlib')
+
+# Bodies of PASTE_BLOB_EXTERNAL_SIZE bytes or more are kept out of the
+# database in PASTE_BLOB_STORE, a directory or an s3://bucket/prefix URL
+# (needs boto3). Pastes over PASTE_MAX_SIZE bytes are rejected; request
+# bodies may be three times that, since form encoding can triple the size.
+PASTE_BLOB_EXTERNAL_SIZE = int(os.environ.get('PASTE_BLOB_EXTERNAL_SIZE', 256 * 1024))
+PASTE_BLOB_STORE = os.environ.get('PASTE_BLOB_STORE', str(BASE_DIR / 'blobs'))
+PASTE_MAX_SIZE = int(os.environ.get('PASTE_MAX_SIZE', 10 * 1024 * 1024))
+DATA_UPLOAD_MAX_MEMORY_SIZE = 3 * PASTE_MAX_SIZE + 64 * 1024
+
+# Pastes over LARGE_PASTE_SIZE characters are shown LARGE_PASTE_WINDOW lines
+# at a time, the rest is fetched from /p/<id>/lines in windows of at most
+# LARGE_PASTE_MAX_WINDOW lines.
+LARGE_PASTE_SIZE = int(os.environ.get('LARGE_PASTE_SIZE', 200_000))
+LARGE_PASTE_WINDOW = int(os.environ.get('LARGE_PASTE_WINDOW', 1000))
+LARGE_PASTE_MAX_WINDOW = int(os.environ.get('LARGE_PASTE_MAX_WINDOW', 5000))
+
+# New pastes with DEDUP_MAX_COPIES or more near-duplicates (estimated
+# similarity of at least DEDUP_THRESHOLD) created in the last DEDUP_WINDOW
+# seconds are rejected, or only flagged with DEDUP_ACTION = 'flag'. 'off'
+# turns fingerprinting off.
+DEDUP_ACTION = os.environ.get('DEDUP_ACTION', 'reject')
+DEDUP_THRESHOLD = float(os.environ.get('DEDUP_THRESHOLD', 0.7))
+DEDUP_WINDOW = int(os.environ.get('DEDUP_WINDOW', 3600))
+DEDUP_MAX_COPIES = int(os.environ.get('DEDUP_MAX_COPIES', 3))
+
+# Trending pastes are ranked by views over the last TRENDING_WINDOWS windows
+# of TRENDING_WINDOW seconds, each window worth TRENDING_DECAY times the one
+# after it. Workers merge their counts into the cache every
+# TRENDING_MERGE_INTERVAL seconds; the top TRENDING_SIZE are listed.
+TRENDING_WINDOW = int(os.environ.get('TRENDING_WINDOW', 600))
+TRENDING_WINDOWS = int(os.environ.get('TRENDING_WINDOWS', 6))
+TRENDING_DECAY = float(os.environ.get('TRENDING_DECAY', 0.5))
+TRENDING_MERGE_INTERVAL = int(os.environ.get('TRENDING_MERGE_INTERVAL', 10))
+TRENDING_SIZE = int(os.environ.get('TRENDING_SIZE', 20))
+
+# Request metrics are served at /metrics, behind a bearer token when
+# METRICS_TOKEN is set. METRICS_SAMPLE_RATE of requests also record their
+# SQL; sampled requests slower than METRICS_SLOW_REQUEST_MS are logged with
+# their METRICS_SLOW_QUERIES slowest queries.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_SAMPLE_RATE = float(os.environ.get('METRICS_SAMPLE_RATE', 0.05))
+METRICS_SLOW_REQUEST_MS = float(os.environ.get('METRICS_SLOW_REQUEST_MS', 500))
+METRICS_SLOW_QUERIES = int(os.environ.get('METRICS_SLOW_QUERIES', 5))
+
+
+# Uptime monitoring, see `manage.py monitor_uptime`
+UPTIME_SERVICES = {
+    'web': 'https://skibin.lol/',
+    'api': 'https://skibin.lol/api/health',
+    'db': 'https://skibin.lol/api/db-health',
 }
+UPTIME_INTERVAL = int(os.environ.get('UPTIME_INTERVAL', 60))
+UPTIME_TIMEOUT = float(os.environ.get('UPTIME_TIMEOUT', 10))
+UPTIME_JITTER = float(os.environ.get('UPTIME_JITTER', 2))
+
+# Raw checks and hourly rollups are pruned by `manage.py rollup_uptime`
+# after these many days; daily rollups are kept.
+UPTIME_RAW_RETENTION_DAYS = int(os.environ.get('UPTIME_RAW_RETENTION_DAYS', 7))
+UPTIME_HOURLY_RETENTION_DAYS = int(os.environ.get('UPTIME_HOURLY_RETENTION_DAYS', 30))
 
 
 # Password validation
@@ -130,3 +312,28 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/6.0/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# Collected files get content hashes in their names plus gzip and brotli
+# copies, so WhiteNoise can serve them compressed with far-future immutable
+# cache headers. A reference to a file that wasn't collected raises. Test
+# runs collect nothing, so they link files by their plain names.
+TESTING = sys.argv[1:2] == ['test']
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': (
+            'django.contrib.staticfiles.storage.StaticFilesStorage'
+            if TESTING or DEBUG
+            else 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+        ),
+    },
+}
+
+# Default primary key field type
+# https://docs.djangoproject.com/en/6.0/ref/settings/#default-auto-field
+
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'